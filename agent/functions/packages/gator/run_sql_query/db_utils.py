@@ -1,10 +1,84 @@
 """
 Database utility functions for executing queries.
+
+Connections come from a module-level pool, which lives as long as the
+function's container: warm invocations reuse an open connection instead of
+paying for TCP, TLS and authentication again. The first invocation connects
+directly while the pool opens in the background, so connection errors
+surface as they are rather than as a pool timeout.
 """
+import time
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
 from sql_utils import serialize_row, is_read_only_query
 
+# Server settings applied when each connection starts, so queries need no extra round trip
+CONNECTION_OPTIONS = "-c statement_timeout=30s -c default_transaction_read_only=on"
+
+# Recycle connections before the server or a proxy drops them
+POOL_MAX_LIFETIME = 1800
+POOL_MAX_IDLE = 300
+# An invocation runs one query at a time
+POOL_MAX_SIZE = 2
+
+CONNECTION_KWARGS = {
+    'connect_timeout': 10,
+    'row_factory': dict_row,
+    'options': CONNECTION_OPTIONS,
+}
+
+_pools = {}
+
+
+def get_pool(database_url):
+    """
+    Return the connection pool for a database, creating it on the first call in this container.
+    
+    Connections are checked before being handed out, so one closed while the
+    container was frozen is replaced rather than failing the query.
+    """
+    pool = _pools.get(database_url)
+    if pool is None:
+        pool = ConnectionPool(
+            database_url,
+            min_size=1,
+            max_size=POOL_MAX_SIZE,
+            kwargs=CONNECTION_KWARGS,
+            check=ConnectionPool.check_connection,
+            max_lifetime=POOL_MAX_LIFETIME,
+            max_idle=POOL_MAX_IDLE,
+            timeout=10,
+            name='run_sql_query',
+            open=True,
+        )
+        _pools[database_url] = pool
+    return pool
+
+
+def connect(database_url):
+    """
+    Return a connection for one query: from the pool when it is open, otherwise a direct one.
+    
+    A pool retries failed connections until its timeout and then raises
+    PoolTimeout, hiding the cause. So the first invocation connects directly,
+    raising the real OperationalError (bad credentials, unreachable host) at
+    once, and only then opens the pool for later invocations. If the pool
+    times out later on, it is discarded and the direct connection tells why.
+    """
+    pool = _pools.get(database_url)
+    if pool is not None:
+        try:
+            return pool.getconn(), pool
+        except PoolTimeout:
+            print("run_sql_query: pool timed out, reconnecting directly")
+            _pools.pop(database_url, None)
+            pool.close()
+    
+    conn = psycopg.connect(database_url, **CONNECTION_KWARGS)
+    get_pool(database_url)
+    return conn, None
+
 
 def execute_read_only_query(query, database_url):
     """
@@ -13,10 +87,10 @@ def execute_read_only_query(query, database_url):
     Args:
         query (str): The SQL query to execute
         database_url (str): PostgreSQL connection string
-        
+    
     Returns:
         dict: Result dictionary with columns, rows, row_count, and truncated flag
-        
+    
     Raises:
         ValueError: If query is not read-only
         psycopg.Error: For database-related errors
@@ -25,12 +99,13 @@ def execute_read_only_query(query, database_url):
     if not is_read_only_query(query):
         raise ValueError("Only SELECT queries are allowed")
     
-    # Connect to database
-    with psycopg.connect(database_url, connect_timeout=10, row_factory=dict_row) as conn:
+    started = time.perf_counter()
+    
+    # Get a connection (read-only, with a 30 second statement timeout)
+    conn, pool = connect(database_url)
+    connected = time.perf_counter()
+    try:
         with conn.cursor() as cursor:
-            # Set statement timeout to 30 seconds
-            cursor.execute("SET statement_timeout = '30s'")
-            
             # Execute the user's query
             cursor.execute(query)
             
@@ -42,6 +117,17 @@ def execute_read_only_query(query, database_url):
             
             # Check if there are more results
             has_more = len(results) == 1000
+        conn.rollback()
+    finally:
+        if pool is not None:
+            pool.putconn(conn)
+        else:
+            conn.close()
+    queried = time.perf_counter()
+    
+    print(f"run_sql_query: {'warm' if pool is not None else 'cold'} pool, "
+          f"connection {(connected - started) * 1000:.1f} ms, "
+          f"query {(queried - connected) * 1000:.1f} ms, {len(results)} rows")
     
     # Serialize rows to ensure all values are JSON-compatible
     serialized_rows = [serialize_row(row) for row in results]
@@ -56,4 +142,4 @@ def execute_read_only_query(query, database_url):
     if has_more:
         response_data['message'] = 'Results truncated to 1000 rows'
     
-    return response_data
\ No newline at end of file
+    return response_data
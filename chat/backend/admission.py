@@ -0,0 +1,173 @@
+"""
+Admission control for agent requests.
+Limits how many requests talk to the agent at once and queues the rest
+fairly: waiting requests are served round-robin across users (or Slack
+workspaces), so one heavy client cannot starve everyone else.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+import metrics
+
+queue_depth = metrics.gauge(
+    "admission_queue_depth",
+    "Requests waiting for an agent slot",
+)
+active_slots = metrics.gauge(
+    "admission_active",
+    "Requests currently holding an agent slot",
+)
+queue_wait = metrics.histogram(
+    "admission_wait_seconds",
+    "Time requests spent queued before getting an agent slot",
+)
+rejections = metrics.counter(
+    "admission_rejections_total",
+    "Requests turned away by admission control",
+    ("reason",),
+)
+
+
+class QueueFull(Exception):
+    """Raised when a request cannot even be queued."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A request's place in line, and later its hold on an agent slot."""
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self.key = key
+        self.granted = False
+        self._controller = controller
+        self._future: Optional[asyncio.Future] = None
+        self._released = False
+        self._queued_at = time.monotonic()
+        self._granted_at: Optional[float] = None
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait until the slot is granted; raises asyncio.TimeoutError after `timeout`."""
+        if self.granted:
+            return
+        try:
+            await asyncio.wait_for(self._future, timeout)
+        except asyncio.TimeoutError:
+            rejections.inc(reason="timeout")
+            self._controller._abandon(self)
+            raise
+        except BaseException:
+            self._controller._abandon(self)
+            raise
+
+    def release(self) -> None:
+        """Give the slot back (or leave the queue). Safe to call more than once."""
+        if self._released:
+            return
+        self._released = True
+        if self.granted:
+            self._controller._release(self)
+        else:
+            self._controller._abandon(self)
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, per-key fair wait queue."""
+
+    def __init__(self, max_active: int = 32, max_queue: int = 128, max_queue_per_key: int = 8):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self.active = 0
+        self.queued = 0
+        self._queues: "OrderedDict[str, Deque[Slot]]" = OrderedDict()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._avg_hold = 5.0
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying."""
+        estimate = self._avg_hold * (self.queued / max(self.max_active, 1) + 1)
+        return max(1, min(60, math.ceil(estimate)))
+
+    def reserve(self, key: str) -> Slot:
+        """Take a slot now or a place in the queue; raises QueueFull if neither is possible."""
+        slot = Slot(self, key)
+        if self.active < self.max_active and not self.queued:
+            self._grant(slot)
+            return slot
+
+        key_queue = self._queues.get(key)
+        if self.queued >= self.max_queue:
+            rejections.inc(reason="queue_full")
+            raise QueueFull("Too many requests are waiting", self.retry_after())
+        if key_queue is not None and len(key_queue) >= self.max_queue_per_key:
+            rejections.inc(reason="key_queue_full")
+            raise QueueFull("Too many of your requests are waiting", self.retry_after())
+
+        slot._future = asyncio.get_running_loop().create_future()
+        if key_queue is None:
+            key_queue = self._queues[key] = deque()
+        key_queue.append(slot)
+        self.queued += 1
+        queue_depth.set(self.queued)
+        return slot
+
+    async def acquire(self, key: str, timeout: Optional[float] = None) -> Slot:
+        """Reserve and wait for a slot."""
+        slot = self.reserve(key)
+        await slot.wait(timeout)
+        return slot
+
+    def _grant(self, slot: Slot) -> None:
+        slot.granted = True
+        slot._granted_at = time.monotonic()
+        self.active += 1
+        active_slots.set(self.active)
+        queue_wait.observe(slot._granted_at - slot._queued_at)
+        if slot._future is not None:
+            slot._future.set_result(None)
+
+    def _grant_next(self) -> None:
+        """Hand free slots to waiting requests, one key at a time."""
+        while self.active < self.max_active and self._queues:
+            key, key_queue = next(iter(self._queues.items()))
+            slot = key_queue.popleft()
+            if key_queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self.queued -= 1
+            queue_depth.set(self.queued)
+            if not slot._future.done():
+                self._grant(slot)
+
+    def _release(self, slot: Slot) -> None:
+        self.active -= 1
+        active_slots.set(self.active)
+        held = time.monotonic() - slot._granted_at
+        self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+        self._grant_next()
+
+    def _abandon(self, slot: Slot) -> None:
+        """Drop a slot whose waiter gave up, timed out or was cancelled."""
+        if slot.granted:
+            # Granted just as the waiter gave up
+            if not slot._released:
+                slot._released = True
+                self._release(slot)
+            return
+        key_queue = self._queues.get(slot.key)
+        if key_queue is not None and slot in key_queue:
+            key_queue.remove(slot)
+            if not key_queue:
+                del self._queues[slot.key]
+            self.queued -= 1
+            queue_depth.set(self.queued)
+        if slot._future is not None and not slot._future.done():
+            slot._future.cancel()
+        slot._released = True
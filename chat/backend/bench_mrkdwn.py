@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark markdown to Slack mrkdwn conversion on answers with large tables
+and lists. Compares converting the whole answer at once, streaming it in
+token by token with a partial render every few tokens (as Slack message
+updates do), re-converting the whole growing answer for every update, and
+memo cache hits for a repeated answer. The markdown-to-mrkdwn package (the
+previous converter) is included when it is installed.
+
+Usage:
+  uv run python bench_mrkdwn.py --rows 500 --rounds 20
+"""
+import argparse
+import re
+import time
+
+import slack_mrkdwn
+from slack_mrkdwn import MrkdwnStream, to_mrkdwn
+
+try:
+    from markdown_to_mrkdwn import SlackMarkdownConverter
+except ImportError:  # Only needed for the comparison
+    SlackMarkdownConverter = None
+
+
+def make_answer(rows: int) -> str:
+    table = ["| Region | Product | Revenue | Change |", "|---|---|---:|---:|"]
+    table += [f"| Region {i % 7} | **Product {i}** | ${i * 1000:,} | {i % 13 - 6}% |" for i in range(rows)]
+    items = [f"- Item {i}: revenue was *{'up' if i % 2 else 'down'}*, see [report {i}](https://example.com/{i})"
+             for i in range(rows)]
+    steps = [f"{i + 1}. Check `region_{i}` and ~~old~~ **new** figures" for i in range(rows)]
+    return "\n".join(["# Quarterly revenue", "", *table, "", "## Highlights", "", *items, "", *steps, ""])
+
+
+def library_convert(text: str) -> str:
+    """The previous two passes: the package's converter, then bullet fixes."""
+    converted = SlackMarkdownConverter().convert(text)
+    return "\n".join(line.replace("* ", "• ", 1) if line.strip().startswith("* ") else line
+                     for line in converted.split("\n"))
+
+
+def convert(text: str) -> str:
+    """One conversion without the memo cache."""
+    converter = MrkdwnStream()
+    converter.feed(text)
+    return converter.finish()
+
+
+def stream(tokens, update_every: int) -> str:
+    converter = MrkdwnStream()
+    for number, token in enumerate(tokens, 1):
+        converter.feed(token)
+        if number % update_every == 0:
+            converter.render()
+    return converter.finish()
+
+
+def reconvert(tokens, update_every: int, convert) -> str:
+    text = ""
+    for number, token in enumerate(tokens, 1):
+        text += token
+        if number % update_every == 0:
+            convert(text)
+    return convert(text)
+
+
+def timed(function, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main(args):
+    answer = make_answer(args.rows)
+    tokens = re.findall(r"\S*\s*", answer)
+    results = {
+        "one-shot": timed(lambda: convert(answer), args.rounds),
+        "stream": timed(lambda: stream(tokens, args.update_every), args.rounds),
+        "reconvert": timed(lambda: reconvert(tokens, args.update_every, convert), max(1, args.rounds // 10)),
+    }
+    to_mrkdwn(answer)
+    results["memo hit"] = timed(lambda: to_mrkdwn(answer), args.rounds)
+    if SlackMarkdownConverter is not None:
+        results["library"] = timed(lambda: library_convert(answer), args.rounds)
+        results["library reconvert"] = timed(lambda: reconvert(tokens, args.update_every, library_convert),
+                                             max(1, args.rounds // 10))
+
+    print(f"{len(answer.splitlines())} lines, {len(answer)} chars, {len(tokens)} tokens, "
+          f"partial render every {args.update_every} tokens")
+    print(f"{'mode':<18} {'ms':>10}")
+    for mode, ms in results.items():
+        print(f"{mode:<18} {ms:>10.2f}")
+    print(f"memo cache hit rate {slack_mrkdwn._converted.hit_rate:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500, help="Table rows, list items and steps each")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--update-every", type=int, default=50, help="Tokens between partial renders")
+    main(parser.parse_args())
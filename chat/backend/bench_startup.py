@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark backend startup.
+Measures, in fresh interpreters, how long `import main` takes and how long a
+uvicorn process takes from launch until /health answers.
+
+Usage:
+  uv run python bench_startup.py --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def startup_env() -> dict:
+    env = dict(os.environ)
+    # Placeholders so startup validation passes; no agent request is made
+    env.setdefault("DO_AGENT_ENDPOINT", "http://127.0.0.1:9")
+    env.setdefault("DO_AGENT_ACCESS_KEY", "benchmark")
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import() -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=startup_env(),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_ready(timeout: float = 30) -> float:
+    """Seconds from spawning uvicorn until /health returns 200."""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=startup_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+        raise TimeoutError("Backend did not become healthy")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(name: str, samples: list) -> None:
+    ms = [sample * 1000 for sample in samples]
+    print(f"{name:<18} median {statistics.median(ms):7.1f} ms   min {min(ms):7.1f} ms   max {max(ms):7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    summarize("import main", [measure_import() for _ in range(args.runs)])
+    summarize("ready (/health)", [measure_ready() for _ in range(args.runs)])
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark stream framing against a fake agent.
+Compares the old per-delta framing (json.dumps per token plus a fixed 10 ms
+sleep) with adaptive chunk coalescing, then the encoding cost and size of
+each wire format (NDJSON, SSE, compact) for the same answer.
+
+Usage:
+  uv run python bench_streaming.py --tokens 1000 --token-delay 0.002
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import stream_format
+from chat_service import FlushPolicy, _stream_agent_deltas, stream_chat_response
+from fake_agent import make_fake_agent_client
+
+
+async def legacy_frames(client):
+    """Previous behavior: one JSON frame per delta followed by a 10 ms sleep."""
+    async for content in _stream_agent_deltas(client, "benchmark", []):
+        yield json.dumps({"content": content}) + "\n"
+        await asyncio.sleep(0.01)
+
+
+async def coalesced_frames(client, policy: FlushPolicy):
+    """Current behavior: deltas batched by the flush policy."""
+    async for content in stream_chat_response(client, "benchmark", [], policy):
+        yield json.dumps({"content": content}) + "\n"
+
+
+async def measure(frames) -> dict:
+    start = time.perf_counter()
+    first = None
+    count = 0
+    size = 0
+    async for frame in frames:
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+        size += len(frame.encode())
+    return {"ttft_ms": first * 1000, "total_ms": (time.perf_counter() - start) * 1000, "frames": count, "bytes": size}
+
+
+async def main(args):
+    tokens = ["word " if i % 12 else "end. " for i in range(args.tokens)]
+    client = make_fake_agent_client(tokens, delay=args.token_delay)
+    policy = FlushPolicy(max_bytes=args.flush_bytes, max_delay_ms=args.flush_ms)
+
+    # Warm up client and model parsing so neither mode pays one-time costs
+    await measure(coalesced_frames(make_fake_agent_client(["warm"], delay=0), policy))
+
+    results = {
+        "legacy": await measure(legacy_frames(client)),
+        "coalesced": await measure(coalesced_frames(client, policy)),
+    }
+
+    print(f"{args.tokens} tokens, {args.token_delay * 1000:.1f} ms/token upstream")
+    print(f"{'mode':<10} {'ttft ms':>9} {'total ms':>10} {'frames':>7} {'bytes':>8}")
+    for mode, result in results.items():
+        print(f"{mode:<10} {result['ttft_ms']:>9.1f} {result['total_ms']:>10.1f} {result['frames']:>7} {result['bytes']:>8}")
+
+    print("\nWire formats, per-token frames")
+    print(f"{'format':<12} {'us/frame':>9} {'bytes':>8}")
+    encoders = {
+        "json.dumps": lambda text: (json.dumps({"content": text}) + "\n").encode(),
+        **{f.name: f.content for f in (stream_format.NDJSON, stream_format.SSE, stream_format.COMPACT)},
+    }
+    for name, encode in encoders.items():
+        start = time.perf_counter()
+        for _ in range(args.encode_rounds):
+            size = sum(len(encode(token)) for token in tokens)
+        per_frame = (time.perf_counter() - start) / (args.encode_rounds * len(tokens)) * 1e6
+        print(f"{name:<12} {per_frame:>9.2f} {size:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Seconds between upstream tokens")
+    parser.add_argument("--flush-bytes", type=int, default=256)
+    parser.add_argument("--flush-ms", type=float, default=50)
+    parser.add_argument("--encode-rounds", type=int, default=100, help="Repetitions for the encoding benchmark")
+    asyncio.run(main(parser.parse_args()))
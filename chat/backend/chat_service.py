@@ -1,71 +1,807 @@
 """
 Shared chat service for DASH AI agent integration.
 Provides both streaming and non-streaming interfaces to DigitalOcean Agent.
+
+All calls go through the async OpenAI client so that waiting on the agent
+never blocks the event loop shared by web streams and Slack events.
 """
 import asyncio
-from typing import AsyncGenerator, List, Dict, Any
-from openai import OpenAI
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
+
+import metrics
+from caching import TTLCache
+
+if TYPE_CHECKING:
+    # Only for annotations: importing openai is slow, and callers pass in the client
+    from openai import AsyncOpenAI
+
+
+@dataclass(frozen=True)
+class FlushPolicy:
+    """When buffered stream deltas are flushed downstream as a single frame.
+    
+    The first delta is always flushed immediately to keep time-to-first-token
+    minimal; after that a frame is emitted as soon as any limit is reached.
+    """
+    max_bytes: int = 256
+    max_delay_ms: float = 50
+    flush_on_sentence: bool = True
+
+
+DEFAULT_FLUSH_POLICY = FlushPolicy()
 
 
-async def get_chat_response(client: OpenAI, message: str, history: List[Dict[str, str]]) -> str:
-    """Get complete chat response from DigitalOcean Agent (non-streaming)."""
+class AgentError(str):
+    """Error text sent in place of (the rest of) an answer when the agent call fails.
+    
+    It is still a str, so callers that only show the text need no changes;
+    use isinstance to tell a failed answer from one that happens to start
+    with "Error: ". `detail` is the error message without any partial answer.
+    """
+    
+    def __new__(cls, detail: str, partial: str = "") -> "AgentError":
+        error = super().__new__(cls, f"{partial}Error: {detail}")
+        error.detail = detail
+        return error
+
+# Sentence end or line break at the end of the buffered text
+SENTENCE_BOUNDARY = re.compile(r'(?:[.!?:]["\')\]]?\s*|\n\s*)$')
+
+
+async def coalesce_chunks(chunks: AsyncIterator[str], policy: Optional[FlushPolicy] = None) -> AsyncGenerator[str, None]:
+    """Batch small stream deltas into fewer, larger frames according to `policy`."""
+    policy = policy or DEFAULT_FLUSH_POLICY
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer: List[str] = []
+    buffered_bytes = 0
+    deadline: Optional[float] = None
+    first = True
+    pending: Optional[asyncio.Future] = None
+    
     try:
-        # Build full conversation messages including history
-        messages = []
-        messages.extend(history)
-        messages.append({"role": "user", "content": message})
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            # With nothing buffered there is nothing to flush on a timer
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # Upstream is slow: flush what we have and keep waiting
+                yield "".join(buffer)
+                buffer, buffered_bytes, deadline = [], 0, None
+                continue
+            
+            task, pending = pending, None
+            try:
+                content = task.result()
+            except StopAsyncIteration:
+                break
+            
+            if isinstance(content, AgentError):
+                # Keep the error a frame of its own so callers can recognize it
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, buffered_bytes, deadline = [], 0, None
+                yield content
+                continue
+            
+            if first:
+                first = False
+                yield content
+                continue
+            
+            buffer.append(content)
+            buffered_bytes += len(content.encode())
+            if deadline is None:
+                deadline = loop.time() + policy.max_delay_ms / 1000
+            
+            if buffered_bytes >= policy.max_bytes or (
+                policy.flush_on_sentence and SENTENCE_BOUNDARY.search(content)
+            ):
+                yield "".join(buffer)
+                buffer, buffered_bytes, deadline = [], 0, None
         
-        # Create non-streaming request with debugging parameters
-        response = client.chat.completions.create(
-            model="n/a",  # Model is configured in DO Agent
-            messages=messages,
-            stream=False,
-            extra_body={
-                "include_retrieval_info": True,
-                "include_functions_info": True,
-                "include_guardrails_info": True
-            }
-        )
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                pending.exception()  # Mark as retrieved
+
+
+# Token estimates: the model is configured in the DO Agent, so its exact
+# tokenizer is unknown; ~4 characters per token is close for English text.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in `text`."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    """Estimate the prompt tokens used by one chat message."""
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass(frozen=True)
+class CompactionStats:
+    """Token accounting for one compacted history."""
+    tokens_before: int
+    tokens_after: int
+    turns_summarized: int
+    
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+history_tokens = metrics.counter(
+    "chat_history_tokens_total",
+    "Estimated history tokens before and after compaction",
+    ("stage",),
+)
+history_compactions = metrics.counter(
+    "chat_history_compactions_total",
+    "Requests whose history was compacted",
+)
+history_tokens_saved = metrics.histogram(
+    "chat_history_tokens_saved",
+    "Estimated prompt tokens saved by history compaction per request",
+    buckets=(0, 100, 250, 500, 1000, 2500, 5000, 10000, 25000),
+)
+
+
+class HistoryCompactor:
+    """Keep recent turns within a token budget and summarize the rest.
+    
+    Older turns are collapsed into an extractive rolling summary (one short
+    line per message), cached by history prefix so each request only
+    summarizes the turns that fell out of the window since the last one.
+    """
+    
+    SUMMARY_PREFIX = "Summary of earlier conversation:"
+    LINE_CHARS = 200
+    
+    def __init__(self, max_tokens: int = 4000, summary_tokens: int = 500, cache_size: int = 256):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self._summaries = TTLCache(cache_size)
+    
+    def _summarize_line(self, message: Dict[str, str]) -> str:
+        speaker = "Assistant" if message.get("role") == "assistant" else "User"
+        text = " ".join((message.get("content") or "").split())
+        first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        if len(first_sentence) > self.LINE_CHARS:
+            first_sentence = first_sentence[:self.LINE_CHARS - 1] + "…"
+        return f"- {speaker}: {first_sentence}"
+    
+    def _summary_lines(self, older: List[Dict[str, str]]) -> List[str]:
+        """Summary lines for `older`, reusing the longest cached prefix."""
+        digest = hashlib.sha256()
+        prefix_keys = []
+        for message in older:
+            digest.update(f"{message.get('role')}\x00{message.get('content')}\x01".encode())
+            prefix_keys.append(digest.hexdigest())
         
-        # Log debugging info if available (for tool call performance monitoring)
-        if hasattr(response, 'usage') and response.usage:
-            print(f"DEBUG: Token usage - {response.usage}")
-        if hasattr(response, 'system_fingerprint'):
-            print(f"DEBUG: System fingerprint - {response.system_fingerprint}")
+        lines: List[str] = []
+        start = 0
+        for index in range(len(prefix_keys) - 1, -1, -1):
+            cached = self._summaries.get(prefix_keys[index])
+            if cached is not None:
+                lines, start = list(cached), index + 1
+                break
         
-        return response.choices[0].message.content or ""
+        lines.extend(self._summarize_line(message) for message in older[start:])
+        # Rolling window: drop the oldest lines once over the summary budget
+        total = sum(count_tokens(line) for line in lines)
+        while lines and total > self.summary_tokens:
+            total -= count_tokens(lines.pop(0))
         
-    except Exception as e:
-        return f"Error: {str(e)}"
+        if prefix_keys:
+            self._summaries.set(prefix_keys[-1], tuple(lines))
+        return lines
+    
+    def compact(self, history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], CompactionStats]:
+        """Return history fitting the token budget, plus token accounting."""
+        sizes = [count_message_tokens(message) for message in history]
+        before = sum(sizes)
+        if before <= self.max_tokens:
+            return history, CompactionStats(before, before, 0)
+        
+        # Keep the most recent turns that fit alongside the summary
+        budget = max(self.max_tokens - self.summary_tokens, 0)
+        kept = 0
+        split = len(history)
+        while split > 0 and kept + sizes[split - 1] <= budget:
+            split -= 1
+            kept += sizes[split]
+        
+        older = history[:split]
+        lines = self._summary_lines(older)
+        compacted = history[split:]
+        if lines:
+            summary = {"role": "system", "content": "\n".join([self.SUMMARY_PREFIX, *lines])}
+            compacted = [summary, *compacted]
+        
+        after = sum(count_message_tokens(message) for message in compacted)
+        return compacted, CompactionStats(before, after, len(older))
+
+
+def _normalize(text: str) -> str:
+    """Normalize text so trivially different phrasings share a cache key."""
+    return " ".join((text or "").casefold().split()).rstrip("?!. ")
+
+
+def fingerprint(message: str, history: List[Dict[str, str]]) -> str:
+    """Stable key for a (history, message) request."""
+    normalized = [[m.get("role"), _normalize(m.get("content", ""))] for m in history]
+    normalized.append(["user", _normalize(message)])
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode()).hexdigest()
+
+
+response_cache_requests = metrics.counter(
+    "chat_response_cache_requests_total",
+    "Response cache lookups by result",
+    ("result",),
+)
+
+
+class ResponseCache:
+    """Exact-match cache of complete agent answers with TTL and LRU eviction."""
+    
+    def __init__(self, maxsize: int = 512, ttl_seconds: float = 600):
+        self._entries = TTLCache(maxsize, ttl=ttl_seconds)
+    
+    def get(self, key: str) -> Optional[str]:
+        answer = self._entries.get(key)
+        response_cache_requests.inc(result="miss" if answer is None else "hit")
+        return answer
+    
+    def set(self, key: str, answer: str) -> None:
+        # Never cache failures, including answers cut short by one
+        if answer and not isinstance(answer, AgentError):
+            self._entries.set(key, answer)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
 
+single_flight_requests = metrics.counter(
+    "chat_single_flight_requests_total",
+    "Agent requests by whether they started an upstream stream or joined one in flight",
+    ("role",),
+)
 
-async def stream_chat_response(client: OpenAI, message: str, history: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
-    """Stream chat response from DigitalOcean Agent."""
-    try:        
-        # Build full conversation messages including history
-        messages = []
-        messages.extend(history)
-        messages.append({"role": "user", "content": message})
+
+class _Flight:
+    """One upstream stream and everything it has produced so far."""
+    
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Share one upstream stream between identical concurrent requests.
+    
+    The first request for a key starts the upstream stream; later identical
+    requests join it and receive every chunk from the start. The upstream
+    is cancelled once all of its subscribers have gone away.
+    """
+    
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+    
+    def in_flight(self) -> int:
+        return len(self._flights)
+    
+    async def _pump(self, key: str, flight: _Flight, source: AsyncGenerator[str, None]) -> None:
+        try:
+            async for chunk in source:
+                flight.chunks.append(chunk)
+                async with flight.changed:
+                    flight.changed.notify_all()
+        finally:
+            await source.aclose()
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.changed:
+                flight.changed.notify_all()
+    
+    async def subscribe(self, key: str, start: Callable[[], AsyncGenerator[str, None]]) -> AsyncGenerator[str, None]:
+        """Stream the chunks for `key`, calling `start` only if nothing is in flight."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, start()))
+            single_flight_requests.inc(role="leader")
+        else:
+            single_flight_requests.inc(role="follower")
         
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    index += 1
+                    yield flight.chunks[index - 1]
+                    continue
+                if flight.done:
+                    return
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: index < len(flight.chunks) or flight.done)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more; stop the upstream stream
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retries for agent requests that fail before the first token.
+    
+    Once content has reached the caller a failure is final: the answer
+    cannot be restarted without repeating text.
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 2.0
+    
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay in seconds before retrying after failed `attempt` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """Send a second, identical request when the first is slow to answer.
+    
+    The hedge is sent once the first token is later than the `percentile` of
+    recent time-to-first-token samples; whichever request answers first wins
+    and the other is cancelled.
+    """
+    enabled: bool = False
+    percentile: float = 95
+    min_samples: int = 20
+    min_delay: float = 0.5
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies for percentile estimates."""
+    
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile of the window, or None when it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an agent endpoint that keeps failing."""
+
+
+circuit_state = metrics.gauge(
+    "agent_circuit_state",
+    "Agent circuit breaker state (0 closed, 1 half-open, 2 open)",
+)
+circuit_rejections = metrics.counter(
+    "agent_circuit_rejections_total",
+    "Agent requests failed fast because the circuit was open",
+)
+
+
+class CircuitBreaker:
+    """Fails fast while the agent endpoint is unhealthy.
+    
+    After `failure_threshold` consecutive failures the circuit opens and
+    requests fail immediately for `reset_timeout` seconds. Then a single probe
+    request is let through (half-open): success closes the circuit again,
+    failure re-opens it.
+    """
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = self.CLOSED
+        circuit_state.set(self._STATE_VALUES[self.state])
+    
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            print(f"Agent circuit breaker {self.state} -> {state}")
+            self.state = state
+            circuit_state.set(self._STATE_VALUES[state])
+    
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+    
+    def allow(self) -> bool:
+        """Whether a request may be sent now."""
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                return False
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+    
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        self._set_state(self.CLOSED)
+    
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+            self._set_state(self.OPEN)
+    
+    def record_abandoned(self) -> None:
+        """A request ended without telling us anything about endpoint health."""
+        self._probing = False
+
+
+# Shared components for web and Slack requests; replaced via configure()
+history_compactor = HistoryCompactor()
+response_cache: Optional[ResponseCache] = None
+single_flight = SingleFlight()
+retry_policy = RetryPolicy()
+hedge_policy = HedgePolicy()
+circuit_breaker = CircuitBreaker()
+ttft_tracker = LatencyTracker()
+
+_UNSET: Any = object()
+
+
+def configure(*, compactor: Optional[HistoryCompactor] = None, cache: Optional[ResponseCache] = _UNSET,
+              retry: Optional[RetryPolicy] = None, hedge: Optional[HedgePolicy] = None,
+              breaker: Optional[CircuitBreaker] = None) -> None:
+    """Install shared chat service components (pass cache=None to disable caching)."""
+    global history_compactor, response_cache, retry_policy, hedge_policy, circuit_breaker
+    if compactor is not None:
+        history_compactor = compactor
+    if cache is not _UNSET:
+        response_cache = cache
+    if retry is not None:
+        retry_policy = retry
+    if hedge is not None:
+        hedge_policy = hedge
+    if breaker is not None:
+        circuit_breaker = breaker
+
+
+def _cache_lookup(key: str, use_cache: bool) -> Optional[str]:
+    """Return the cached answer for `key`, if caching is on and allowed."""
+    if response_cache is None:
+        return None
+    if not use_cache:
+        response_cache_requests.inc(result="bypass")
+        return None
+    return response_cache.get(key)
+
+
+def _cache_store(key: str, answer: str) -> None:
+    """Remember a complete answer (fresh answers also refresh bypassed entries)."""
+    if response_cache is not None:
+        response_cache.set(key, answer)
+
+
+async def _replay(answer: str) -> AsyncGenerator[str, None]:
+    """Replay a cached answer as a stream of sentence-sized deltas."""
+    for piece in re.split(r"(?<=[.!?\n])(?=\s)", answer):
+        yield piece
+        await asyncio.sleep(0)
+
+
+def _build_messages(message: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Build conversation messages, compacting history to the token budget."""
+    compacted, stats = history_compactor.compact(history)
+    history_tokens.inc(stats.tokens_before, stage="before")
+    history_tokens.inc(stats.tokens_after, stage="after")
+    history_tokens_saved.observe(stats.tokens_saved)
+    if stats.turns_summarized:
+        history_compactions.inc()
+        print(f"DEBUG: Compacted history - {stats.turns_summarized} turns summarized, "
+              f"{stats.tokens_saved} tokens saved")
+    
+    messages = []
+    messages.extend(compacted)
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+upstream_errors = metrics.counter(
+    "agent_upstream_errors_total",
+    "Failed agent requests by exception type",
+    ("error",),
+)
+
+
+# Debugging parameters understood by the DO Agent endpoint
+AGENT_EXTRA_BODY: Dict[str, Any] = {
+    "include_retrieval_info": True,
+    "include_functions_info": True,
+    "include_guardrails_info": True
+}
+
+
+agent_ttft = metrics.histogram(
+    "agent_ttft_seconds",
+    "Time from sending an agent request to its first content token",
+)
+agent_retries = metrics.counter(
+    "agent_retries_total",
+    "Agent requests retried after failing before the first token",
+)
+hedged_requests = metrics.counter(
+    "agent_hedged_requests_total",
+    "Hedged agent requests sent, and how many answered first",
+    ("outcome",),
+)
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """Whether `error` means the agent endpoint (not our request) is at fault."""
+    import httpx
+    import openai
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError))
+
+
+def _chunk_content(chunk: Any) -> str:
+    """Content delta of one stream chunk ("" if none)."""
+    # Log debugging info if available (for tool call performance monitoring)
+    if getattr(chunk, 'usage', None):
+        print(f"DEBUG: Token usage - {chunk.usage}")
+    if chunk.choices and chunk.choices[0].delta.content:
+        return chunk.choices[0].delta.content
+    return ""
+
+
+async def _first_token(client: "AsyncOpenAI", messages: List[Dict[str, str]]) -> Tuple[Any, AsyncIterator, str]:
+    """Open an agent stream and wait for its first content delta.
+    
+    Returns the stream, its chunk iterator and the first delta ("" if the
+    answer was empty). Updates the circuit breaker with the outcome.
+    """
+    started = time.perf_counter()
+    stream = None
+    try:
         # Create streaming request with debugging parameters
-        stream = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model="n/a",  # Model is configured in DO Agent
             messages=messages,
             stream=True,
-            extra_body={
-                "include_retrieval_info": True,
-                "include_functions_info": True,
-                "include_guardrails_info": True
-            }
+            extra_body=AGENT_EXTRA_BODY
         )
+        chunks = stream.__aiter__()
+        first = ""
+        async for chunk in chunks:
+            first = _chunk_content(chunk)
+            if first:
+                break
+    except BaseException as e:
+        if stream is not None:
+            await stream.close()
+        if isinstance(e, Exception) and _is_retryable(e):
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_abandoned()
+        raise
+    
+    ttft = time.perf_counter() - started
+    agent_ttft.observe(ttft)
+    ttft_tracker.observe(ttft)
+    circuit_breaker.record_success()
+    return stream, chunks, first
+
+
+def _discard_attempt(task: asyncio.Future) -> None:
+    """Cancel a losing request, closing its stream if it already answered."""
+    def close_stream(done: asyncio.Future) -> None:
+        if not done.cancelled() and done.exception() is None:
+            asyncio.ensure_future(done.result()[0].close())
+    
+    task.cancel()
+    task.add_done_callback(close_stream)
+
+
+def _hedge_delay() -> Optional[float]:
+    """Seconds to wait for a first token before hedging, or None to not hedge."""
+    if not hedge_policy.enabled or len(ttft_tracker) < hedge_policy.min_samples:
+        return None
+    return max(hedge_policy.min_delay, ttft_tracker.percentile(hedge_policy.percentile))
+
+
+async def _hedged_first_token(client: "AsyncOpenAI", messages: List[Dict[str, str]]) -> Tuple[Any, AsyncIterator, str]:
+    """First token from the agent, hedging with a second request if it is slow."""
+    delay = _hedge_delay()
+    if delay is None:
+        return await _first_token(client, messages)
+    
+    primary = asyncio.ensure_future(_first_token(client, messages))
+    attempts = [primary]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done and circuit_breaker.state == CircuitBreaker.CLOSED:
+            hedged_requests.inc(outcome="sent")
+            attempts.append(asyncio.ensure_future(_first_token(client, messages)))
         
-        # Stream chunks
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                yield content
-                # Small delay to ensure chunk is sent
-                await asyncio.sleep(0.01)
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    if task is not primary:
+                        hedged_requests.inc(outcome="won")
+                    return task.result()
+            if not pending:
+                # Every request failed; report the first one's error
+                raise primary.exception()
+    finally:
+        for task in attempts:
+            if task is not winner:
+                _discard_attempt(task)
+
+
+async def _open_agent_stream(client: "AsyncOpenAI", messages: List[Dict[str, str]]) -> Tuple[Any, AsyncIterator, str]:
+    """Open an agent stream, retrying failures that happen before the first token."""
+    attempt = 1
+    while True:
+        if not circuit_breaker.allow():
+            circuit_rejections.inc()
+            raise CircuitOpenError(
+                f"Agent is unavailable, please retry in {math.ceil(circuit_breaker.retry_after())}s"
+            )
+        try:
+            return await _hedged_first_token(client, messages)
+        except Exception as e:
+            if attempt >= retry_policy.max_attempts or not _is_retryable(e):
+                raise
+            upstream_errors.inc(error=type(e).__name__)
+            agent_retries.inc()
+            await asyncio.sleep(retry_policy.backoff(attempt))
+            attempt += 1
+
+
+async def _stream_agent_deltas(client: "AsyncOpenAI", message: str, history: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+    """Stream raw content deltas from DigitalOcean Agent.
+    
+    Failures before the first token are retried with jittered backoff (and
+    slow first tokens optionally hedged); an open circuit breaker fails fast.
+    """
+    try:
+        messages = _build_messages(message, history)
+        stream, chunks, first = await _open_agent_stream(client, messages)
+        
+        # Stream chunks without blocking the event loop between them
+        try:
+            if first:
+                yield first
+            async for chunk in chunks:
+                content = _chunk_content(chunk)
+                if content:
+                    yield content
+        except Exception:
+            circuit_breaker.record_failure()
+            raise
+        finally:
+            # Release the upstream connection right away when cancelled mid-stream
+            await stream.close()
                 
     except Exception as e:
-        yield f"Error: {str(e)}"
\ No newline at end of file
+        upstream_errors.inc(error=type(e).__name__)
+        yield AgentError(str(e))
+
+
+def _shared_deltas(client: "AsyncOpenAI", message: str, history: List[Dict[str, str]], key: str) -> AsyncGenerator[str, None]:
+    """Agent deltas for this request, joining an identical request already in flight."""
+    return single_flight.subscribe(key, lambda: _stream_agent_deltas(client, message, history))
+
+
+async def get_chat_response(client: "AsyncOpenAI", message: str, history: List[Dict[str, str]],
+                            use_cache: bool = True) -> str:
+    """Get complete chat response from DigitalOcean Agent (non-streaming).
+    
+    The answer is collected from the shared upstream stream so Slack requests
+    coalesce with identical web requests in flight.
+    """
+    key = fingerprint(message, history)
+    cached = _cache_lookup(key, use_cache)
+    if cached is not None:
+        return cached
+    
+    try:
+        deltas = [delta async for delta in _shared_deltas(client, message, history, key)]
+        answer = "".join(delta for delta in deltas if not isinstance(delta, AgentError))
+        errors = [delta for delta in deltas if isinstance(delta, AgentError)]
+        if errors:
+            return AgentError(errors[0].detail, partial=answer)
+        _cache_store(key, answer)
+        return answer
+        
+    except Exception as e:
+        return AgentError(str(e))
+
+
+async def stream_chat_response(client: "AsyncOpenAI", message: str, history: List[Dict[str, str]],
+                               flush_policy: Optional[FlushPolicy] = None,
+                               use_cache: bool = True) -> AsyncGenerator[str, None]:
+    """Stream chat response from DigitalOcean Agent, coalescing deltas into frames.
+    
+    Cached answers are replayed through the same framing, so callers always
+    receive a stream.
+    """
+    key = fingerprint(message, history)
+    cached = _cache_lookup(key, use_cache)
+    if cached is not None:
+        deltas = _replay(cached)
+    else:
+        deltas = _shared_deltas(client, message, history, key)
+    
+    parts = []
+    failed = False
+    try:
+        # Close the coalescer first: it may still be waiting on `deltas`, which
+        # cannot be closed while that read is pending
+        async with aclosing(coalesce_chunks(deltas, flush_policy)) as frames:
+            async for frame in frames:
+                failed = failed or isinstance(frame, AgentError)
+                parts.append(frame)
+                yield frame
+    finally:
+        await deltas.aclose()
+    
+    # Only reached when the stream ran to completion
+    if cached is None and not failed:
+        _cache_store(key, "".join(parts))
@@ -0,0 +1,157 @@
+"""
+Server-side conversation history for the DASH chat backend.
+Conversations live in a local SQLite database (WAL mode) with an in-memory
+LRU in front, so web clients only send the new message on each turn.
+"""
+import asyncio
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from caching import TTLCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+
+class ConversationStore:
+    """Conversation histories in SQLite, fronted by an in-memory LRU.
+
+    Database work runs in a worker thread so it never blocks the event loop.
+    Conversations idle for longer than `ttl_seconds` are evicted by `purge_expired`.
+    """
+
+    def __init__(self, path: str = "conversations.db", cache_size: int = 512, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._cache = TTLCache(cache_size, ttl=ttl_seconds)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load(self, conversation_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None or time.time() - row[0] > self.ttl_seconds:
+                return []
+            rows = db.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def _exists(self, conversation_id: str) -> bool:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl_seconds
+
+    def _create(self, conversation_id: str) -> None:
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO conversations (id, updated_at) VALUES (?, ?)", (conversation_id, time.time())
+            )
+
+    def _append(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = db.execute("SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+                if row is not None and now - row[0] > self.ttl_seconds:
+                    # Expired but not purged yet: start over rather than reviving the old turns
+                    db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                db.execute(
+                    "INSERT INTO conversations (id, updated_at) VALUES (?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (conversation_id, now)
+                )
+                (next_seq,) = db.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation_id = ?",
+                    (conversation_id,)
+                ).fetchone()
+                db.executemany(
+                    "INSERT INTO messages (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(conversation_id, next_seq + i, m["role"], m["content"]) for i, m in enumerate(messages)]
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def _purge(self, cutoff: float) -> int:
+        with self._lock:
+            return self._db().execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+
+    async def create(self) -> str:
+        """Start an empty conversation and return its new, unguessable ID."""
+        conversation_id = secrets.token_urlsafe(24)
+        await asyncio.to_thread(self._create, conversation_id)
+        self._cache.set(conversation_id, [])
+        return conversation_id
+
+    async def exists(self, conversation_id: str) -> bool:
+        """Whether a conversation was created here and has not expired."""
+        return await asyncio.to_thread(self._exists, conversation_id)
+
+    async def get_history(self, conversation_id: str) -> List[Dict[str, str]]:
+        """Return the stored messages for a conversation (empty if unknown or expired)."""
+        history = self._cache.get(conversation_id)
+        if history is None:
+            history = await asyncio.to_thread(self._load, conversation_id)
+            self._cache.set(conversation_id, history)
+        return list(history)
+
+    async def append(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
+        """Append messages to a conversation, creating it if needed."""
+        await asyncio.to_thread(self._append, conversation_id, messages)
+        cached = self._cache.get(conversation_id)
+        if cached is not None:
+            self._cache.set(conversation_id, cached + messages)
+
+    async def delete(self, conversation_id: str) -> None:
+        """Forget a conversation."""
+        self._cache.pop(conversation_id)
+        await asyncio.to_thread(self._delete, conversation_id)
+
+    async def purge_expired(self) -> int:
+        """Evict conversations idle for longer than the TTL; returns how many were deleted."""
+        self._cache.purge_expired()
+        return await asyncio.to_thread(self._purge, time.time() - self.ttl_seconds)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,206 @@
+"""
+Fake DigitalOcean Agent for local testing and benchmarks.
+Speaks the OpenAI chat completions protocol (streaming and non-streaming),
+either in-process through an httpx transport or as a local HTTP server.
+
+Usage:
+  uv run python fake_agent.py --port 9000 --token-rate 50 --ttft 0.5 --error-rate 0.01
+  DO_AGENT_ENDPOINT=http://localhost:9000 uv run python main.py
+"""
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from openai import AsyncOpenAI
+
+
+def completion_chunk(content: str) -> str:
+    """Encode one chat completion chunk as an SSE event."""
+    payload = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "n/a",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def completion(content: str) -> dict:
+    """Build a non-streaming chat completion body."""
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "n/a",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+    }
+
+
+def make_fake_agent_client(tokens: List[str], delay: float = 0.02, *, failures: int = 0,
+                           first_token_delays: Optional[List[float]] = None,
+                           drop_after: Optional[int] = None) -> AsyncOpenAI:
+    """Create an AsyncOpenAI client backed by an in-process fake agent.
+    
+    Each token is emitted `delay` seconds after the previous one. The first
+    `failures` requests get a 503, and request N waits an extra
+    `first_token_delays[N]` seconds before its first token. With
+    `drop_after`, streams break off with a read error after that many
+    tokens. Request bodies
+    received by the fake agent are recorded in `client.fake_requests`.
+    The client does not retry on its own, so chat_service retries are visible.
+    """
+    received: List[dict] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        index = len(received)
+        received.append(body)
+        if index < failures:
+            return httpx.Response(503, json={"error": {"message": "Injected failure", "type": "server_error"}})
+        if first_token_delays and index < len(first_token_delays):
+            await asyncio.sleep(first_token_delays[index])
+        if not body.get("stream"):
+            await asyncio.sleep(delay * len(tokens))
+            return httpx.Response(200, json=completion("".join(tokens)))
+
+        async def events():
+            for number, token in enumerate(tokens):
+                if number == drop_after:
+                    raise httpx.ReadError("connection reset")
+                await asyncio.sleep(delay)
+                yield completion_chunk(token).encode()
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+
+    client = AsyncOpenAI(
+        base_url="http://fake-agent/api/v1",
+        api_key="fake",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        max_retries=0,
+    )
+    client.fake_requests = received
+    return client
+
+
+def default_answer(length: int) -> List[str]:
+    """A plausible-looking answer of `length` tokens."""
+    return [f"figure{i}{'. ' if i % 12 == 11 else ' '}" for i in range(length)]
+
+
+@dataclass
+class FakeAgentStats:
+    """What the fake agent server has seen."""
+    requests: int = 0
+    completed_streams: int = 0
+    aborted_streams: int = 0
+    injected_errors: int = 0
+
+
+class InjectedStreamError(Exception):
+    """Raised to cut a stream off mid-answer."""
+
+
+def create_app(tokens: Optional[List[str]] = None, token_delay: float = 0.02, first_token_delay: float = 0.0,
+               *, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500,
+               stream_error_rate: float = 0.0, seed: Optional[int] = None) -> FastAPI:
+    """Create a fake agent server app; stats are kept on `app.state.stats`.
+
+    Args:
+        tokens: Answer tokens (defaults to a 100-token answer)
+        token_delay: Seconds between streamed tokens (1 / token rate)
+        first_token_delay: Seconds before the first token, e.g. tool-call latency
+        jitter: Random extra latency, as a fraction of each delay
+        error_rate: Fraction of requests failed with `error_status` up front
+        stream_error_rate: Fraction of streams cut off halfway through
+        seed: Seed for reproducible error injection and jitter
+    """
+    tokens = tokens if tokens is not None else default_answer(100)
+    rng = random.Random(seed)
+    app = FastAPI(title="Fake DASH Agent")
+    stats = FakeAgentStats()
+    app.state.stats = stats
+
+    def delay(seconds: float) -> float:
+        return seconds * (1 + rng.uniform(0, jitter)) if jitter else seconds
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats.requests += 1
+        if rng.random() < error_rate:
+            stats.injected_errors += 1
+            return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}},
+                                status_code=error_status)
+        await asyncio.sleep(delay(first_token_delay))
+        if not body.get("stream"):
+            await asyncio.sleep(delay(token_delay) * len(tokens))
+            return JSONResponse(completion("".join(tokens)))
+
+        cut_off = len(tokens) // 2 if rng.random() < stream_error_rate else None
+
+        async def events():
+            try:
+                for index, token in enumerate(tokens):
+                    if index == cut_off:
+                        stats.injected_errors += 1
+                        raise InjectedStreamError("Injected mid-stream failure")
+                    yield completion_chunk(token)
+                    await asyncio.sleep(delay(token_delay))
+                yield "data: [DONE]\n\n"
+                stats.completed_streams += 1
+            except (asyncio.CancelledError, GeneratorExit):
+                # Client went away before the answer was finished
+                stats.aborted_streams += 1
+                raise
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(
+        description="Run a fake DigitalOcean Agent. Point the backend at it with "
+                    "DO_AGENT_ENDPOINT=http://localhost:<port>"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--answer-tokens", type=int, default=100, help="Tokens per answer")
+    parser.add_argument("--token-rate", type=float, default=50, help="Tokens per second")
+    parser.add_argument("--ttft", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed up front")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="Fraction of streams cut off")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(
+            default_answer(args.answer_tokens),
+            token_delay=1 / args.token_rate,
+            first_token_delay=args.ttft,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            stream_error_rate=args.stream_error_rate,
+            seed=args.seed,
+        ),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,123 @@
+"""
+Fake Slack Web API for local testing.
+Answers the handful of methods SlackBot uses (auth.test,
+conversations.history, conversations.replies, chat.postMessage, chat.update,
+chat.delete)
+and records what it was sent, so tests can run the bot without a Slack
+workspace.
+
+Point a SlackBot at it with:
+  bot.slack_client.base_url = f"{fake_slack_url}/api/"
+"""
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BOT_USER_ID = "UFAKEBOT"
+BOT_ID = "BFAKEBOT"
+
+
+@dataclass
+class FakeSlackStats:
+    """What the fake Slack API has seen."""
+    calls: Counter = field(default_factory=Counter)
+    connections: Set[Tuple[str, int]] = field(default_factory=set)
+    posted: List[Dict[str, Any]] = field(default_factory=list)
+    updates: List[Dict[str, Any]] = field(default_factory=list)
+    rate_limited: int = 0
+    # Latest text of every message, by ts
+    texts: Dict[str, str] = field(default_factory=dict)
+
+
+async def request_args(request: Request) -> Dict[str, Any]:
+    """Collect Web API arguments from the query string, form or JSON body."""
+    args: Dict[str, Any] = dict(request.query_params)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        args.update(await request.json())
+    elif content_type.startswith("application/x-www-form-urlencoded"):
+        args.update(parse_qsl((await request.body()).decode()))
+    return args
+
+
+def create_app(messages: Optional[List[Dict[str, Any]]] = None, latency: float = 0.0,
+               *, rate_limits: Optional[Dict[str, int]] = None, retry_after: int = 1) -> FastAPI:
+    """Create a fake Slack API app; stats are kept on `app.state.stats`.
+
+    Args:
+        messages: Channel history, newest first as Slack returns it; the bot's
+            posts are added to it and tests may add more (`app.state.messages`)
+        latency: Seconds every API call takes
+        rate_limits: Calls allowed per method every `retry_after` seconds
+            before answering 429 (methods not listed are unlimited)
+        retry_after: Retry-After seconds sent with 429 responses
+    """
+    messages = messages if messages is not None else []
+    app = FastAPI(title="Fake Slack API")
+    stats = FakeSlackStats()
+    app.state.stats = stats
+    app.state.messages = messages
+    rate_limits = rate_limits or {}
+    # Per method: when the current rate limit window started and calls made in it
+    windows: Dict[str, List[float]] = {}
+    clock = {"ts": 0.0}
+
+    def next_ts() -> str:
+        """Unique, increasing message timestamps, like Slack's."""
+        clock["ts"] = max(time.time(), clock["ts"] + 0.000001)
+        return f"{clock['ts']:.6f}"
+
+    @app.api_route("/api/{method}", methods=["GET", "POST"])
+    async def api_method(method: str, request: Request):
+        stats.calls[method] += 1
+        stats.connections.add((request.client.host, request.client.port))
+        args = await request_args(request)
+        await asyncio.sleep(latency)
+
+        if method in rate_limits:
+            now = time.monotonic()
+            window = windows.setdefault(method, [now, 0])
+            if now - window[0] >= retry_after:
+                window[:] = [now, 0]
+            window[1] += 1
+            if window[1] > rate_limits[method]:
+                stats.rate_limited += 1
+                return JSONResponse({"ok": False, "error": "ratelimited"}, status_code=429,
+                                    headers={"Retry-After": str(retry_after)})
+
+        if method == "auth.test":
+            return {"ok": True, "user_id": BOT_USER_ID, "bot_id": BOT_ID, "team_id": "TFAKE"}
+        if method in ("conversations.history", "conversations.replies"):
+            limit = int(args.get("limit", 100))
+            oldest = args.get("oldest")
+            newer = [message for message in messages if oldest is None or float(message["ts"]) > float(oldest)]
+            return {"ok": True, "messages": newer[:limit], "has_more": len(newer) > limit}
+        if method == "chat.postMessage":
+            ts = next_ts()
+            stats.posted.append({**args, "ts": ts})
+            stats.texts[ts] = args.get("text", "")
+            messages.insert(0, {"ts": ts, "user": BOT_USER_ID, "bot_id": BOT_ID, "text": args.get("text", "")})
+            return {"ok": True, "channel": args.get("channel"), "ts": ts}
+        if method == "chat.update":
+            if args.get("ts") not in stats.texts:
+                return {"ok": False, "error": "message_not_found"}
+            stats.updates.append(args)
+            stats.texts[args["ts"]] = args.get("text", "")
+            for message in messages:
+                if message["ts"] == args["ts"]:
+                    message["text"] = args.get("text", "")
+            return {"ok": True, "channel": args.get("channel"), "ts": args["ts"]}
+        if method == "chat.delete":
+            if stats.texts.pop(args.get("ts"), None) is None:
+                return {"ok": False, "error": "message_not_found"}
+            messages[:] = [message for message in messages if message["ts"] != args["ts"]]
+            return {"ok": True, "channel": args.get("channel"), "ts": args["ts"]}
+        return {"ok": False, "error": "unknown_method"}
+
+    return app
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Load test for the DASH chat backend.
+Drives /api/chat/stream and/or /slack/events at a fixed concurrency and
+reports latency percentiles, throughput and error rates.
+
+Run the backend against the fake agent to benchmark offline:
+  uv run python fake_agent.py --port 9000 --token-rate 50 --ttft 0.5
+  DO_AGENT_ENDPOINT=http://localhost:9000 uv run python main.py
+  uv run python load_test.py --url http://localhost:8000 --concurrency 50 --requests 500
+
+For --mode slack or mixed, the backend must have Slack configured and
+SLACK_SIGNING_SECRET must match so the events pass signature checks.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+
+@dataclass
+class Result:
+    kind: str
+    ok: bool
+    ttft: Optional[float] = None  # Chat: first content frame; Slack: acknowledgement
+    duration: float = 0.0
+    response_bytes: int = 0
+    error: str = ""
+
+
+@dataclass
+class Report:
+    results: List[Result] = field(default_factory=list)
+    wall_time: float = 0.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+async def chat_request(client: httpx.AsyncClient, url: str, index: int, unique: bool) -> Result:
+    message = f"Load test question {index}: what was revenue in 2023?" if unique else "What was revenue in 2023?"
+    headers = {"Cache-Control": "no-cache"} if unique else {}
+    started = time.perf_counter()
+    ttft = None
+    size = 0
+    try:
+        async with client.stream("POST", f"{url}/api/chat/stream", json={"message": message}, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return Result("chat", False, duration=time.perf_counter() - started, error=f"HTTP {response.status_code}")
+            async for line in response.aiter_lines():
+                size += len(line) + 1
+                if not line.strip():
+                    continue
+                frame = json.loads(line)
+                if "error" in frame:
+                    return Result("chat", False, ttft, time.perf_counter() - started, size, frame["error"])
+                if "content" in frame and ttft is None:
+                    ttft = time.perf_counter() - started
+        return Result("chat", True, ttft, time.perf_counter() - started, size)
+    except Exception as e:
+        return Result("chat", False, ttft, time.perf_counter() - started, size, type(e).__name__)
+
+
+def signed_slack_event(index: int, signing_secret: str) -> tuple[bytes, Dict[str, str]]:
+    """Build an app_mention event with a valid Slack signature."""
+    body = json.dumps({
+        "type": "event_callback",
+        "team_id": "TLOADTEST",
+        "event_id": f"Ev{uuid.uuid4().hex}",
+        "event": {
+            "type": "app_mention",
+            "user": "ULOADTEST",
+            "channel": f"CLOAD{index % 10}",
+            "text": f"<@UBOT> load test question {index}",
+            "ts": f"{time.time():.6f}",
+        },
+    }).encode()
+    timestamp = str(int(time.time()))
+    signature = "v0=" + hmac.new(
+        signing_secret.encode(), f"v0:{timestamp}:{body.decode()}".encode(), hashlib.sha256
+    ).hexdigest()
+    return body, {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+    }
+
+
+async def slack_request(client: httpx.AsyncClient, url: str, index: int, signing_secret: str) -> Result:
+    body, headers = signed_slack_event(index, signing_secret)
+    started = time.perf_counter()
+    try:
+        response = await client.post(f"{url}/slack/events", content=body, headers=headers)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            return Result("slack", False, elapsed, elapsed, len(response.content), f"HTTP {response.status_code}")
+        return Result("slack", True, elapsed, elapsed, len(response.content))
+    except Exception as e:
+        return Result("slack", False, duration=time.perf_counter() - started, error=type(e).__name__)
+
+
+async def run_load(url: str, mode: str, total: int, concurrency: int, unique: bool,
+                   signing_secret: str, timeout: float) -> Report:
+    report = Report()
+    next_index = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < total:
+                index = next_index
+                next_index += 1
+                use_slack = mode == "slack" or (mode == "mixed" and index % 2)
+                if use_slack:
+                    report.results.append(await slack_request(client, url, index, signing_secret))
+                else:
+                    report.results.append(await chat_request(client, url, index, unique))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        report.wall_time = time.perf_counter() - started
+    return report
+
+
+def print_report(report: Report) -> None:
+    print(f"Wall time: {report.wall_time:.2f}s")
+    for kind in ("chat", "slack"):
+        results = [r for r in report.results if r.kind == kind]
+        if not results:
+            continue
+        ok = [r for r in results if r.ok]
+        ttfts = [r.ttft for r in ok if r.ttft is not None]
+        durations = [r.duration for r in ok]
+        label = "TTFT" if kind == "chat" else "Ack"
+        print(f"\n{kind}: {len(results)} requests, {len(ok)} ok, "
+              f"{100 * (len(results) - len(ok)) / len(results):.1f}% errors")
+        print(f"  Throughput: {len(ok) / report.wall_time:.1f} req/s, "
+              f"{sum(r.response_bytes for r in ok) / report.wall_time / 1024:.1f} KiB/s")
+        print(f"  {label:<8} p50 {percentile(ttfts, 50) * 1000:8.1f} ms  "
+              f"p95 {percentile(ttfts, 95) * 1000:8.1f} ms  p99 {percentile(ttfts, 99) * 1000:8.1f} ms")
+        if kind == "chat":
+            print(f"  {'Total':<8} p50 {percentile(durations, 50) * 1000:8.1f} ms  "
+                  f"p95 {percentile(durations, 95) * 1000:8.1f} ms  p99 {percentile(durations, 99) * 1000:8.1f} ms")
+        errors: Dict[str, int] = {}
+        for r in results:
+            if not r.ok:
+                errors[r.error] = errors.get(r.error, 0) + 1
+        for error, count in sorted(errors.items(), key=lambda item: -item[1])[:5]:
+            print(f"  Error x{count}: {error[:100]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--mode", choices=["chat", "slack", "mixed"], default="chat")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--repeat-prompt", action="store_true",
+                        help="Send the same question every time (exercises caching and coalescing)")
+    parser.add_argument("--signing-secret", default=os.getenv("SLACK_SIGNING_SECRET", ""))
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    if args.mode != "chat" and not args.signing_secret:
+        parser.error("--signing-secret (or SLACK_SIGNING_SECRET) is required for Slack load")
+
+    print_report(asyncio.run(run_load(
+        args.url, args.mode, args.requests, args.concurrency,
+        unique=not args.repeat_prompt, signing_secret=args.signing_secret, timeout=args.timeout,
+    )))
@@ -7,19 +7,44 @@ import json
 import asyncio
 import hashlib
 import hmac
-from typing import AsyncGenerator
+import importlib.util
+import ipaddress
+import time
+import weakref
+from contextlib import aclosing, asynccontextmanager
+from typing import TYPE_CHECKING, AsyncGenerator, Optional
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from openai import OpenAI
-from dotenv import load_dotenv
-from slack_bot import SlackBot
-from chat_service import stream_chat_response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import HTTPConnection
+import chat_service
+from chat_service import (
+    AgentError,
+    CircuitBreaker,
+    FlushPolicy,
+    HedgePolicy,
+    HistoryCompactor,
+    ResponseCache,
+    RetryPolicy,
+    count_tokens,
+    fingerprint,
+    get_chat_response,
+    stream_chat_response,
+)
+from conversation_store import ConversationStore
+from admission import AdmissionController, QueueFull, Slot
+from slack_dedup import EventDeduplicator
+from slack_queue import SlackEventQueue
+import stream_format
+from stream_format import StreamFormat
+import metrics
 
-# Load environment variables
-load_dotenv()
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+    from slack_bot import SlackBot
 
 class ChatMessage(BaseModel):
     message: str
@@ -27,16 +52,114 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     history: list[dict] = []  # Previous conversation messages
+    # When set, history is kept server-side. Send "new" to start a conversation
+    # (from `history`, if any); its ID is issued by the server (X-Conversation-ID).
+    # For an existing conversation `history` is ignored
+    conversation_id: Optional[str] = Field(default=None, pattern=r"^(new|[A-Za-z0-9_-]{32})$")
+
+class BatchRequest(BaseModel):
+    questions: list[str]
+    history: list[dict] = []  # Shared context for every question
+    concurrency: Optional[int] = Field(default=None, ge=1)  # Capped at BATCH_MAX_CONCURRENCY
 
 class Config:
-    """Configuration loaded from environment variables."""
-    DO_AGENT_ENDPOINT: str = os.getenv("DO_AGENT_ENDPOINT", "")
-    DO_AGENT_ACCESS_KEY: str = os.getenv("DO_AGENT_ACCESS_KEY", "")
-    DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+    """Configuration loaded from environment variables.
+    
+    Read at instantiation and again by the app lifespan once `.env` is loaded.
+    """
     
-    # Slack configuration
-    SLACK_BOT_TOKEN: str = os.getenv("SLACK_BOT_TOKEN", "")
-    SLACK_SIGNING_SECRET: str = os.getenv("SLACK_SIGNING_SECRET", "")
+    def __init__(self):
+        self.load()
+    
+    def load(self) -> None:
+        """(Re)read every setting from the environment."""
+        self.DO_AGENT_ENDPOINT: str = os.getenv("DO_AGENT_ENDPOINT", "")
+        self.DO_AGENT_ACCESS_KEY: str = os.getenv("DO_AGENT_ACCESS_KEY", "")
+        self.DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+        
+        # Slack configuration
+        self.SLACK_BOT_TOKEN: str = os.getenv("SLACK_BOT_TOKEN", "")
+        self.SLACK_SIGNING_SECRET: str = os.getenv("SLACK_SIGNING_SECRET", "")
+        self.SLACK_POOL_MAX_CONNECTIONS: int = int(os.getenv("SLACK_POOL_MAX_CONNECTIONS", "20"))
+        # Stream answers into Slack by editing a placeholder message, at most once per interval
+        self.SLACK_STREAM_REPLIES: bool = os.getenv("SLACK_STREAM_REPLIES", "true").lower() == "true"
+        self.SLACK_STREAM_UPDATE_SECONDS: float = float(os.getenv("SLACK_STREAM_UPDATE_SECONDS", "1.0"))
+        # Outbound pacing: messages per second (and burst) per channel, attempts when rate limited
+        self.SLACK_CHANNEL_MESSAGES_PER_SECOND: float = float(os.getenv("SLACK_CHANNEL_MESSAGES_PER_SECOND", "1.0"))
+        self.SLACK_CHANNEL_BURST: float = float(os.getenv("SLACK_CHANNEL_BURST", "3"))
+        self.SLACK_DELIVERY_ATTEMPTS: int = int(os.getenv("SLACK_DELIVERY_ATTEMPTS", "3"))
+        
+        # Slack event workers (events in one channel are handled in order by one worker)
+        self.SLACK_WORKERS: int = int(os.getenv("SLACK_WORKERS", "4"))
+        self.SLACK_MAX_BACKLOG: int = int(os.getenv("SLACK_MAX_BACKLOG", "256"))
+        self.SLACK_DRAIN_SECONDS: float = float(os.getenv("SLACK_DRAIN_SECONDS", "20"))
+        
+        # Slack event deduplication (set a DB path to share it between worker processes)
+        self.SLACK_DEDUP_TTL_SECONDS: float = float(os.getenv("SLACK_DEDUP_TTL_SECONDS", "3600"))
+        self.SLACK_DEDUP_CACHE_SIZE: int = int(os.getenv("SLACK_DEDUP_CACHE_SIZE", "10000"))
+        self.SLACK_DEDUP_DB_PATH: str = os.getenv("SLACK_DEDUP_DB_PATH", "")
+        
+        # Bot identity (auth.test) cached in a file shared by worker processes ("" disables the file)
+        self.SLACK_IDENTITY_CACHE_PATH: str = os.getenv("SLACK_IDENTITY_CACHE_PATH", "slack_identity.json")
+        self.SLACK_IDENTITY_REFRESH_SECONDS: float = float(os.getenv("SLACK_IDENTITY_REFRESH_SECONDS", "3600"))
+        
+        # Agent connection pool
+        self.AGENT_POOL_MAX_CONNECTIONS: int = int(os.getenv("AGENT_POOL_MAX_CONNECTIONS", "100"))
+        self.AGENT_POOL_MAX_KEEPALIVE: int = int(os.getenv("AGENT_POOL_MAX_KEEPALIVE", "20"))
+        self.AGENT_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("AGENT_POOL_KEEPALIVE_EXPIRY", "60"))
+        self.AGENT_HTTP2: bool = os.getenv("AGENT_HTTP2", "true").lower() == "true"
+        
+        # Agent resilience: retries before the first token, hedging, circuit breaker
+        self.AGENT_RETRY_ATTEMPTS: int = int(os.getenv("AGENT_RETRY_ATTEMPTS", "3"))
+        self.AGENT_RETRY_BASE_DELAY: float = float(os.getenv("AGENT_RETRY_BASE_DELAY", "0.2"))
+        self.AGENT_RETRY_MAX_DELAY: float = float(os.getenv("AGENT_RETRY_MAX_DELAY", "2"))
+        self.AGENT_HEDGE: bool = os.getenv("AGENT_HEDGE", "false").lower() == "true"
+        self.AGENT_HEDGE_PERCENTILE: float = float(os.getenv("AGENT_HEDGE_PERCENTILE", "95"))
+        self.AGENT_HEDGE_MIN_DELAY: float = float(os.getenv("AGENT_HEDGE_MIN_DELAY", "0.5"))
+        self.AGENT_CIRCUIT_FAILURES: int = int(os.getenv("AGENT_CIRCUIT_FAILURES", "5"))
+        self.AGENT_CIRCUIT_RESET_SECONDS: float = float(os.getenv("AGENT_CIRCUIT_RESET_SECONDS", "30"))
+        
+        # Stream frame coalescing (flush on whichever limit is reached first)
+        self.STREAM_FLUSH_BYTES: int = int(os.getenv("STREAM_FLUSH_BYTES", "256"))
+        self.STREAM_FLUSH_MS: float = float(os.getenv("STREAM_FLUSH_MS", "50"))
+        self.STREAM_FLUSH_ON_SENTENCE: bool = os.getenv("STREAM_FLUSH_ON_SENTENCE", "true").lower() == "true"
+        
+        # History compaction (estimated tokens)
+        self.HISTORY_MAX_TOKENS: int = int(os.getenv("HISTORY_MAX_TOKENS", "4000"))
+        self.HISTORY_SUMMARY_TOKENS: int = int(os.getenv("HISTORY_SUMMARY_TOKENS", "500"))
+        self.SLACK_HISTORY_LIMIT: int = int(os.getenv("SLACK_HISTORY_LIMIT", "15"))
+        # Recent Slack messages cached per channel (idle channels are evicted)
+        self.SLACK_HISTORY_CACHE_CHANNELS: int = int(os.getenv("SLACK_HISTORY_CACHE_CHANNELS", "1000"))
+        self.SLACK_HISTORY_IDLE_SECONDS: float = float(os.getenv("SLACK_HISTORY_IDLE_SECONDS", "1800"))
+        
+        # Response cache for repeated questions (size 0 disables it)
+        self.RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+        self.RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+        
+        # Server-side conversation store
+        self.CONVERSATION_DB_PATH: str = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+        self.CONVERSATION_CACHE_SIZE: int = int(os.getenv("CONVERSATION_CACHE_SIZE", "512"))
+        self.CONVERSATION_TTL_SECONDS: float = float(os.getenv("CONVERSATION_TTL_SECONDS", str(7 * 24 * 3600)))
+        self.CONVERSATION_PURGE_INTERVAL: float = float(os.getenv("CONVERSATION_PURGE_INTERVAL", "600"))
+        
+        # Admission control (concurrent agent requests and fair wait queue)
+        self.ADMISSION_MAX_ACTIVE: int = int(os.getenv("ADMISSION_MAX_ACTIVE", "32"))
+        self.ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+        self.ADMISSION_MAX_QUEUE_PER_KEY: int = int(os.getenv("ADMISSION_MAX_QUEUE_PER_KEY", "8"))
+        self.ADMISSION_MAX_WAIT: float = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+        # Proxies (IPs or CIDRs) whose X-User-ID and X-Forwarded-For headers are believed
+        self.ADMISSION_TRUSTED_PROXIES: list = [
+            ipaddress.ip_network(proxy.strip(), strict=False)
+            for proxy in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if proxy.strip()
+        ]
+        
+        # WebSocket multiplexing (concurrent streams and initial frame credit per stream)
+        self.WS_MAX_STREAMS: int = int(os.getenv("WS_MAX_STREAMS", "8"))
+        self.WS_INITIAL_CREDIT: int = int(os.getenv("WS_INITIAL_CREDIT", "32"))
+        
+        # Batch questions (/api/chat/batch)
+        self.BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+        self.BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
     
     def validate(self) -> None:
         """Validate that required settings are present."""
@@ -54,22 +177,177 @@ class Config:
 
 config = Config()
 
-# Validate configuration on startup
-try:
-    config.validate()
-except ValueError as e:
-    print(f"Configuration error: {e}")
-    if not config.DEBUG:
-        raise
+# Shared services, built by init_services() when the app starts
+flush_policy = FlushPolicy()
+conversation_store: Optional[ConversationStore] = None
+admission = AdmissionController()
+slack_bot: Optional["SlackBot"] = None
+slack_event_queue: Optional[SlackEventQueue] = None
+slack_dedup: Optional[EventDeduplicator] = None
+
+def init_services() -> None:
+    """Load `.env`, validate configuration and build the shared services."""
+    global flush_policy, conversation_store, admission, slack_event_queue, slack_dedup
+    from dotenv import load_dotenv
+    load_dotenv()
+    config.load()
+    
+    try:
+        config.validate()
+    except ValueError as e:
+        print(f"Configuration error: {e}")
+        if not config.DEBUG:
+            raise
+    
+    flush_policy = FlushPolicy(
+        max_bytes=config.STREAM_FLUSH_BYTES,
+        max_delay_ms=config.STREAM_FLUSH_MS,
+        flush_on_sentence=config.STREAM_FLUSH_ON_SENTENCE,
+    )
+    
+    chat_service.configure(
+        compactor=HistoryCompactor(
+            max_tokens=config.HISTORY_MAX_TOKENS,
+            summary_tokens=config.HISTORY_SUMMARY_TOKENS,
+        ),
+        cache=ResponseCache(
+            maxsize=config.RESPONSE_CACHE_SIZE,
+            ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS,
+        ) if config.RESPONSE_CACHE_SIZE > 0 else None,
+        retry=RetryPolicy(
+            max_attempts=config.AGENT_RETRY_ATTEMPTS,
+            base_delay=config.AGENT_RETRY_BASE_DELAY,
+            max_delay=config.AGENT_RETRY_MAX_DELAY,
+        ),
+        hedge=HedgePolicy(
+            enabled=config.AGENT_HEDGE,
+            percentile=config.AGENT_HEDGE_PERCENTILE,
+            min_delay=config.AGENT_HEDGE_MIN_DELAY,
+        ),
+        breaker=CircuitBreaker(
+            failure_threshold=config.AGENT_CIRCUIT_FAILURES,
+            reset_timeout=config.AGENT_CIRCUIT_RESET_SECONDS,
+        ),
+    )
+    
+    conversation_store = ConversationStore(
+        config.CONVERSATION_DB_PATH,
+        cache_size=config.CONVERSATION_CACHE_SIZE,
+        ttl_seconds=config.CONVERSATION_TTL_SECONDS,
+    )
+    
+    admission = AdmissionController(
+        max_active=config.ADMISSION_MAX_ACTIVE,
+        max_queue=config.ADMISSION_MAX_QUEUE,
+        max_queue_per_key=config.ADMISSION_MAX_QUEUE_PER_KEY,
+    )
+    
+    slack_event_queue = SlackEventQueue(
+        handle_queued_slack_event,
+        workers=config.SLACK_WORKERS,
+        max_backlog=config.SLACK_MAX_BACKLOG,
+    )
+    
+    slack_dedup = EventDeduplicator(
+        config.SLACK_DEDUP_DB_PATH or None,
+        cache_size=config.SLACK_DEDUP_CACHE_SIZE,
+        ttl_seconds=config.SLACK_DEDUP_TTL_SECONDS,
+    )
+
+def init_slack_bot(client: "AsyncOpenAI") -> None:
+    """Start the Slack integration if it is configured (slack_sdk is only imported then)."""
+    global slack_bot
+    slack_bot = None
+    if not (config.SLACK_BOT_TOKEN and config.SLACK_SIGNING_SECRET):
+        print("Slack integration disabled (missing SLACK_BOT_TOKEN or SLACK_SIGNING_SECRET)")
+        return
+    try:
+        config.validate_slack()
+        from slack_bot import SlackBot
+        from slack_history import SlackHistoryCache
+        history_cache = SlackHistoryCache(
+            max_channels=config.SLACK_HISTORY_CACHE_CHANNELS,
+            max_messages=config.SLACK_HISTORY_LIMIT,
+            idle_seconds=config.SLACK_HISTORY_IDLE_SECONDS,
+        )
+        slack_bot = SlackBot(config.SLACK_BOT_TOKEN, client, history_limit=config.SLACK_HISTORY_LIMIT,
+                             max_connections=config.SLACK_POOL_MAX_CONNECTIONS,
+                             stream_replies=config.SLACK_STREAM_REPLIES,
+                             update_interval=config.SLACK_STREAM_UPDATE_SECONDS,
+                             history_cache=history_cache,
+                             channel_rate=config.SLACK_CHANNEL_MESSAGES_PER_SECOND,
+                             channel_burst=config.SLACK_CHANNEL_BURST,
+                             delivery_attempts=config.SLACK_DELIVERY_ATTEMPTS,
+                             identity_path=config.SLACK_IDENTITY_CACHE_PATH or None,
+                             identity_refresh_seconds=config.SLACK_IDENTITY_REFRESH_SECONDS)
+        print("Slack bot initialized successfully")
+    except ValueError as e:
+        print(f"Slack configuration error: {e}")
+
+async def purge_idle_conversations() -> None:
+    """Periodically evict idle conversations, old Slack event IDs and idle Slack channel histories."""
+    while True:
+        await asyncio.sleep(config.CONVERSATION_PURGE_INTERVAL)
+        try:
+            purged = await conversation_store.purge_expired()
+            if purged:
+                print(f"Purged {purged} idle conversations")
+            await slack_dedup.purge_expired()
+            if slack_bot:
+                slack_bot.history_cache.purge_expired()
+        except Exception as e:
+            print(f"Error purging conversations: {e}")
 
-# Slack bot will be initialized after function definitions
-slack_bot = None
+warmup_task: Optional[asyncio.Task] = None
+
+async def warm_up() -> None:
+    """Build the agent client and Slack bot (and resolve its identity) without holding up startup."""
+    started = time.perf_counter()
+    # The openai import dominates; do it off the event loop so requests are served meanwhile
+    await asyncio.to_thread(importlib.import_module, "openai")
+    init_slack_bot(agent_clients.get())
+    if slack_bot:
+        # Resolve the bot identity before the first event rather than while handling it
+        await slack_bot.start()
+    print(f"Agent client ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+async def wait_until_warm() -> None:
+    """Wait for startup warm-up, for handlers that need the Slack bot."""
+    if warmup_task is not None and not warmup_task.done():
+        await asyncio.shield(warmup_task)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build shared resources on startup and release them on shutdown.
+    
+    Nothing expensive happens at import time, so `--reload` cycles and tools
+    that only import the module stay fast; the agent client is warmed in the
+    background once the server is accepting requests.
+    """
+    global warmup_task
+    started = time.perf_counter()
+    init_services()
+    slack_event_queue.start()
+    warmup_task = asyncio.create_task(warm_up())
+    purge_task = asyncio.create_task(purge_idle_conversations())
+    print(f"Startup complete in {(time.perf_counter() - started) * 1000:.0f} ms")
+    yield
+    # Let queued Slack events finish while the agent and Slack clients are still open
+    await slack_event_queue.drain(config.SLACK_DRAIN_SECONDS)
+    warmup_task.cancel()
+    purge_task.cancel()
+    await agent_clients.aclose()
+    if slack_bot:
+        await slack_bot.aclose()
+    conversation_store.close()
+    slack_dedup.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="DASH Chat Backend",
     description="Simplified JSON API for DASH chat interface",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Configure CORS for frontend development
@@ -79,10 +357,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Conversation-ID"],
 )
 
-def get_openai_client() -> OpenAI:
-    """Create OpenAI client configured for DigitalOcean Agent endpoint."""
+def get_agent_base_url() -> str:
+    """Normalize DO_AGENT_ENDPOINT into the base URL expected by the OpenAI client."""
     # Ensure endpoint has proper format - OpenAI client will append /chat/completions
     base_url = config.DO_AGENT_ENDPOINT
     if base_url.endswith('/api/v1/chat/completions'):
@@ -91,64 +370,611 @@ def get_openai_client() -> OpenAI:
     elif not base_url.endswith('/api/v1'):
         # Add /api/v1 if not present
         base_url = base_url.rstrip('/') + '/api/v1'
+    return base_url
+
+agent_pool_requests = metrics.counter(
+    "agent_pool_requests_total",
+    "Agent HTTP requests by whether they reused a pooled connection",
+    ("connection",),
+)
+
+class AgentClientRegistry:
+    """Process-wide agent clients sharing one pooled HTTP connection pool each.
     
-    return OpenAI(
-        base_url=base_url,
-        api_key=config.DO_AGENT_ACCESS_KEY,
-    )
+    Clients are created on first use and closed by the app lifespan, so chat
+    requests and Slack events reuse warm keep-alive (and HTTP/2) connections
+    instead of paying TCP/TLS setup on every message.
+    """
+    
+    def __init__(self):
+        self._clients: dict[str, "AsyncOpenAI"] = {}
+    
+    def _build_http_client(self) -> "httpx.AsyncClient":
+        import httpx
+        from openai import DefaultAsyncHttpxClient
+        http2 = config.AGENT_HTTP2 and importlib.util.find_spec("h2") is not None
+        if config.AGENT_HTTP2 and not http2:
+            print("AGENT_HTTP2 is set but h2 is not installed; using HTTP/1.1")
+        return DefaultAsyncHttpxClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.AGENT_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=config.AGENT_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=config.AGENT_POOL_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={"request": [self._trace_connection]},
+        )
+    
+    @staticmethod
+    async def _trace_connection(request: "httpx.Request") -> None:
+        """Count whether each request opened a new connection or reused a pooled one."""
+        connected = False
+        
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal connected
+            if event_name == "connection.connect_tcp.complete":
+                connected = True
+            elif event_name.endswith("send_request_headers.started"):
+                agent_pool_requests.inc(connection="new" if connected else "reused")
+        
+        request.extensions["trace"] = trace
+    
+    def get(self, name: str = "default") -> "AsyncOpenAI":
+        """Return the shared client for `name`, creating it on first use."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed():
+            # Imported here: the openai package takes a third of the module's import time
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                base_url=get_agent_base_url(),
+                api_key=config.DO_AGENT_ACCESS_KEY,
+                http_client=self._build_http_client(),
+                max_retries=0,  # chat_service retries with jitter and a circuit breaker
+            )
+            self._clients[name] = client
+        return client
+    
+    async def aclose(self) -> None:
+        """Close every client and its connection pool."""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.close()
+    
+    def pool_stats(self) -> dict:
+        """Pooled vs. newly opened connections since startup."""
+        return {
+            "clients": len(self._clients),
+            "reused_connections": agent_pool_requests.value(connection="reused"),
+            "new_connections": agent_pool_requests.value(connection="new"),
+        }
 
-# Initialize Slack bot if configuration is available
-if config.SLACK_BOT_TOKEN and config.SLACK_SIGNING_SECRET:
-    try:
-        config.validate_slack()
-        client = get_openai_client()
-        slack_bot = SlackBot(config.SLACK_BOT_TOKEN, client)
-        print("Slack bot initialized successfully")
-    except ValueError as e:
-        print(f"Slack configuration error: {e}")
-        if not config.DEBUG:
-            slack_bot = None
-else:
-    print("Slack integration disabled (missing SLACK_BOT_TOKEN or SLACK_SIGNING_SECRET)")
+agent_clients = AgentClientRegistry()
 
-async def stream_openai_response_json(message: str, history: list[dict]) -> AsyncGenerator[str, None]:
-    """Stream response from DigitalOcean Agent as JSON lines (for web interface)."""
+def get_openai_client() -> "AsyncOpenAI":
+    """Get the shared async OpenAI client for the DigitalOcean Agent endpoint."""
+    return agent_clients.get()
+
+stream_ttft = metrics.histogram(
+    "chat_stream_time_to_first_token_seconds",
+    "Time from request to the first streamed content frame",
+)
+stream_duration = metrics.histogram(
+    "chat_stream_duration_seconds",
+    "Total duration of web chat streams",
+)
+stream_chunks = metrics.histogram(
+    "chat_stream_chunks",
+    "Content frames sent per web chat stream",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+stream_bytes = metrics.histogram(
+    "chat_stream_bytes",
+    "Bytes sent per web chat stream, by wire format",
+    ("format",),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+stream_tokens_per_second = metrics.histogram(
+    "chat_stream_tokens_per_second",
+    "Estimated answer tokens per second of stream time",
+    buckets=(1, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+active_streams = metrics.gauge(
+    "chat_active_streams",
+    "Web chat streams currently in progress",
+)
+stream_cancellations = metrics.counter(
+    "chat_stream_cancellations_total",
+    "Web chat streams stopped early because the client disconnected",
+)
+
+async def cancel_on_disconnect(request: Request, task: asyncio.Task) -> None:
+    """Cancel `task` as soon as the HTTP client disconnects."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            task.cancel()
+            return
+
+async def stream_openai_response(message: str, history: list[dict],
+                                 conversation_id: Optional[str] = None,
+                                 use_cache: bool = True,
+                                 request: Optional[Request] = None,
+                                 slot: Optional[Slot] = None,
+                                 wire_format: StreamFormat = stream_format.NDJSON) -> AsyncGenerator[bytes, None]:
+    """Stream response from DigitalOcean Agent in `wire_format` (for web interface).
+    
+    With a conversation_id, history is loaded from and the new turn saved to
+    the server-side conversation store. With a request, the stream (and the
+    upstream agent response) is cancelled when the client disconnects. With
+    an admission slot, the stream waits its turn and releases it when done.
+    """
+    started = time.perf_counter()
+    sent_bytes = 0
+    parts = []
+    failed = False
+    active_streams.inc()
+    watcher = None
+    if request is not None:
+        watcher = asyncio.create_task(cancel_on_disconnect(request, asyncio.current_task()))
     try:
+        if slot is not None:
+            try:
+                await slot.wait(config.ADMISSION_MAX_WAIT)
+            except asyncio.TimeoutError:
+                yield wire_format.error("Server busy, please retry")
+                return
+        
         client = get_openai_client()
+        if conversation_id:
+            history = await conversation_store.get_history(conversation_id)
+        
+        # Stream coalesced frames using shared service; closed here rather than
+        # whenever it is garbage collected, so a client leaving stops it at once
+        async with aclosing(stream_chat_response(client, message, history, flush_policy, use_cache)) as contents:
+            async for content in contents:
+                if not parts:
+                    stream_ttft.observe(time.perf_counter() - started)
+                if isinstance(content, AgentError):
+                    # Sent as an error frame, which ends the stream without a completion signal
+                    failed = True
+                    frame = wire_format.error(content.detail)
+                else:
+                    parts.append(content)
+                    frame = wire_format.content(content)
+                sent_bytes += len(frame)
+                yield frame
+        if failed:
+            return
         
-        # Stream chunks as JSON using shared service
-        async for content in stream_chat_response(client, message, history):
-            yield json.dumps({"content": content}) + "\n"
+        response = "".join(parts)
+        if conversation_id:
+            await conversation_store.append(conversation_id, [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": response},
+            ])
             
         # Send completion signal
-        yield json.dumps({"complete": True}) + "\n"
+        yield wire_format.complete()
         
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away; unwinding closes the upstream agent stream
+        stream_cancellations.inc()
+        raise
     except Exception as e:
         # Send error
-        yield json.dumps({"error": str(e)}) + "\n"
+        yield wire_format.error(str(e))
+    finally:
+        if slot is not None:
+            slot.release()
+        if watcher is not None:
+            watcher.cancel()
+        active_streams.dec()
+        elapsed = time.perf_counter() - started
+        stream_duration.observe(elapsed)
+        stream_chunks.observe(len(parts))
+        stream_bytes.observe(sent_bytes, format=wire_format.name)
+        if parts and elapsed > 0:
+            stream_tokens_per_second.observe(count_tokens("".join(parts)) / elapsed)
 
-@app.post("/api/chat/stream")
-async def chat_stream(chat_request: ChatRequest):
-    """Stream chat response as JSON lines."""
+def wants_fresh_response(request: Request) -> bool:
+    """Whether the client opted out of cached answers via Cache-Control."""
+    cache_control = request.headers.get("Cache-Control", "").lower()
+    return "no-cache" in cache_control or "no-store" in cache_control
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in config.ADMISSION_TRUSTED_PROXIES)
+
+def client_key(connection: HTTPConnection) -> str:
+    """Fair-queueing key: the peer address, or the user or client a trusted proxy names.
     
+    X-User-ID and X-Forwarded-For are only believed from ADMISSION_TRUSTED_PROXIES;
+    from anyone else they would let a client pick a fresh key per request and
+    get around ADMISSION_MAX_QUEUE_PER_KEY. X-Forwarded-For is read from the
+    right, skipping trusted proxies, since clients can prepend any address.
+    """
+    peer = connection.client.host if connection.client else "unknown"
+    if not is_trusted_proxy(peer):
+        return f"ip:{peer}"
+    user_id = connection.headers.get("X-User-ID", "").strip()
+    if user_id:
+        return f"user:{user_id}"
+    forwarded = [address.strip() for address in connection.headers.get("X-Forwarded-For", "").split(",")]
+    for address in reversed(forwarded):
+        if address and not is_trusted_proxy(address):
+            return f"ip:{address}"
+    return f"ip:{peer}"
+
+def reserve_slot(key: str) -> Slot:
+    """Reserve an agent slot, or reject with 429 and Retry-After when the queue is full."""
+    try:
+        return admission.reserve(key)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def resolve_conversation_id(conversation_id: Optional[str], history: list[dict]) -> Optional[str]:
+    """Start a conversation for "new", or check that the client's ID is one the server issued.
+    
+    A new conversation starts from `history`, so a client whose conversation
+    expired can carry on after uploading its history once.
+    
+    Raises 404 for unknown or expired IDs, so clients cannot pick (or guess)
+    the ID of someone else's conversation. Call it once an agent slot is
+    reserved, so a request turned away with 429 leaves no empty conversation.
+    """
+    if conversation_id is None:
+        return None
+    if conversation_id == "new":
+        conversation_id = await conversation_store.create()
+        seed = [
+            {"role": m["role"], "content": m["content"]} for m in history
+            if m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)
+        ]
+        if seed:
+            await conversation_store.append(conversation_id, seed)
+        return conversation_id
+    if not await conversation_store.exists(conversation_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation")
+    return conversation_id
+
+async def streaming_chat_response(chat_request: ChatRequest, request: Request,
+                                  wire_format: StreamFormat) -> StreamingResponse:
+    """Start streaming an answer to `chat_request` in `wire_format`."""
     if not chat_request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
+    slot = reserve_slot(client_key(request))
+    try:
+        conversation_id = await resolve_conversation_id(chat_request.conversation_id, chat_request.history)
+    except BaseException:
+        slot.release()
+        raise
+    
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",  # Disable nginx buffering
+        "Transfer-Encoding": "chunked",
+    }
+    if conversation_id:
+        headers["X-Conversation-ID"] = conversation_id
+    
+    stream = stream_openai_response(
+        chat_request.message,
+        chat_request.history,
+        conversation_id,
+        use_cache=not wants_fresh_response(request),
+        request=request,
+        slot=slot,
+        wire_format=wire_format,
+    )
+    # Free the slot even if the stream is never started
+    weakref.finalize(stream, slot.release)
+    
+    return StreamingResponse(stream, media_type=wire_format.media_type, headers=headers)
+
+@app.post("/api/chat/stream")
+async def chat_stream(chat_request: ChatRequest, request: Request):
+    """Stream chat response as JSON lines, or another format per the Accept header.
+    
+    `Accept: text/event-stream` selects Server-Sent Events and
+    `Accept: application/x-dash-stream` the compact framing (see stream_format).
+    Send `Cache-Control: no-cache` to bypass the response cache. Requests
+    beyond the agent concurrency limit queue fairly per user; 429 with
+    Retry-After is returned when the queue is full.
+    """
+    wire_format = stream_format.negotiate(request.headers.get("Accept", ""))
+    return await streaming_chat_response(chat_request, request, wire_format)
+
+@app.post("/api/chat/sse")
+async def chat_sse(chat_request: ChatRequest, request: Request):
+    """Stream chat response as Server-Sent Events (for fetch-based SSE clients)."""
+    return await streaming_chat_response(chat_request, request, stream_format.SSE)
+
+batch_items = metrics.counter(
+    "chat_batch_items_total",
+    "Batch questions by outcome",
+    ("result",),
+)
+batch_item_seconds = metrics.histogram(
+    "chat_batch_item_seconds",
+    "Time to answer one unique batch question, including queueing",
+)
+
+async def stream_batch_answers(questions: list[str], history: list[dict], concurrency: int,
+                               key: str, use_cache: bool = True,
+                               request: Optional[Request] = None) -> AsyncGenerator[bytes, None]:
+    """Answer `questions` with bounded concurrency, yielding NDJSON lines as each finishes.
+    
+    Identical questions (after normalization) are asked once; their copies
+    are reported with `duplicate_of` pointing at the first occurrence.
+    """
+    started = time.perf_counter()
+    groups: dict[str, list[int]] = {}
+    for index, question in enumerate(questions):
+        groups.setdefault(fingerprint(question, history), []).append(index)
+    
+    client = get_openai_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def answer(indices: list[int]) -> tuple[list[int], str, float]:
+        async with semaphore:
+            item_started = time.perf_counter()
+            try:
+                slot = await admission.acquire(key, config.ADMISSION_MAX_WAIT)
+            except (QueueFull, asyncio.TimeoutError):
+                return indices, AgentError("Server busy, please retry"), time.perf_counter() - item_started
+            try:
+                response = await get_chat_response(client, questions[indices[0]], history, use_cache)
+            finally:
+                slot.release()
+            return indices, response, time.perf_counter() - item_started
+    
+    tasks = [asyncio.create_task(answer(indices)) for indices in groups.values()]
+    watcher = None
+    if request is not None:
+        watcher = asyncio.create_task(cancel_on_disconnect(request, asyncio.current_task()))
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indices, response, seconds = await next_done
+            batch_item_seconds.observe(seconds)
+            for index in indices:
+                item = {"index": index, "question": questions[index], "seconds": round(seconds, 3)}
+                if isinstance(response, AgentError):
+                    item["error"] = response.detail
+                    batch_items.inc(result="error")
+                else:
+                    item["answer"] = response
+                    batch_items.inc(result="answered" if index == indices[0] else "deduplicated")
+                if index != indices[0]:
+                    item["duplicate_of"] = indices[0]
+                yield stream_format.dumps(item) + b"\n"
+        
+        yield stream_format.dumps({
+            "complete": True,
+            "items": len(questions),
+            "unique": len(groups),
+            "seconds": round(time.perf_counter() - started, 3),
+        }) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        if watcher is not None:
+            watcher.cancel()
+
+@app.post("/api/chat/batch")
+async def chat_batch(batch_request: BatchRequest, request: Request):
+    """Answer a list of questions, streaming one NDJSON line per question as it finishes.
+    
+    Each line has the question's `index`, `answer` (or `error`) and `seconds`;
+    the last line is `{"complete": true, ...}` with the total wall-clock time.
+    Send `Cache-Control: no-cache` to bypass the response cache.
+    """
+    questions = batch_request.questions
+    if not questions or len(questions) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {config.BATCH_MAX_ITEMS} questions")
+    if any(not question.strip() for question in questions):
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    
+    concurrency = min(batch_request.concurrency or config.BATCH_MAX_CONCURRENCY, config.BATCH_MAX_CONCURRENCY)
     return StreamingResponse(
-        stream_openai_response_json(chat_request.message, chat_request.history),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # Disable nginx buffering
-            "Transfer-Encoding": "chunked",
-        }
+        stream_batch_answers(
+            questions,
+            batch_request.history,
+            concurrency,
+            key=client_key(request),
+            use_cache=not wants_fresh_response(request),
+            request=request,
+        ),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+websocket_connections = metrics.gauge(
+    "chat_websocket_connections",
+    "Open chat WebSocket connections",
+)
+websocket_streams = metrics.counter(
+    "chat_websocket_streams_total",
+    "Chat streams started over WebSockets",
+)
+
+class WebSocketStreams:
+    """The chat streams multiplexed over one WebSocket connection.
+    
+    Each stream sends frames only while it has credit: it starts with
+    WS_INITIAL_CREDIT frames and the client grants more with `credit`
+    messages, so a slow tab cannot make the server buffer unbounded output.
+    """
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.credits: dict[str, asyncio.Semaphore] = {}
+        self._send_lock = asyncio.Lock()
+    
+    async def send(self, payload) -> None:
+        """Send one message (a dict, or an already encoded frame)."""
+        data = payload if isinstance(payload, bytes) else stream_format.dumps(payload)
+        async with self._send_lock:
+            await self.websocket.send_text(data.decode())
+    
+    async def start(self, stream_id: str, message: dict) -> None:
+        if stream_id in self.tasks:
+            await self.send({"type": "error", "id": stream_id, "error": "Stream ID already in use"})
+            return
+        if len(self.tasks) >= config.WS_MAX_STREAMS:
+            await self.send({"type": "error", "id": stream_id, "error": "Too many concurrent streams"})
+            return
+        try:
+            chat_request = ChatRequest.model_validate(message)
+        except ValidationError as e:
+            await self.send({"type": "error", "id": stream_id, "error": f"Invalid request: {e.errors()[0]['msg']}"})
+            return
+        if not chat_request.message.strip():
+            await self.send({"type": "error", "id": stream_id, "error": "Message cannot be empty"})
+            return
+        try:
+            slot = admission.reserve(client_key(self.websocket))
+        except QueueFull as e:
+            await self.send({"type": "error", "id": stream_id, "error": str(e), "retry_after": e.retry_after})
+            return
+        try:
+            conversation_id = await resolve_conversation_id(chat_request.conversation_id, chat_request.history)
+            if conversation_id != chat_request.conversation_id:
+                await self.send({"type": "conversation", "id": stream_id, "conversation_id": conversation_id})
+        except HTTPException as e:
+            slot.release()
+            await self.send({"type": "error", "id": stream_id, "error": e.detail})
+            return
+        except BaseException:
+            slot.release()
+            raise
+        chat_request.conversation_id = conversation_id
+        
+        websocket_streams.inc()
+        self.credits[stream_id] = asyncio.Semaphore(config.WS_INITIAL_CREDIT)
+        self.tasks[stream_id] = asyncio.create_task(
+            self._pump(stream_id, chat_request, slot, use_cache=not message.get("no_cache", False))
+        )
+    
+    async def _pump(self, stream_id: str, chat_request: ChatRequest, slot: Slot, use_cache: bool) -> None:
+        frames = stream_openai_response(
+            chat_request.message,
+            chat_request.history,
+            chat_request.conversation_id,
+            use_cache=use_cache,
+            slot=slot,
+            wire_format=stream_format.MultiplexFormat(stream_id),
+        )
+        try:
+            async for frame in frames:
+                await self.credits[stream_id].acquire()
+                await self.send(frame)
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            pass  # Connection closed; the receive loop cancels the other streams
+        finally:
+            await frames.aclose()
+            slot.release()
+            self.tasks.pop(stream_id, None)
+            self.credits.pop(stream_id, None)
+    
+    def grant(self, stream_id: str, frames) -> None:
+        credit = self.credits.get(stream_id)
+        if credit is None or not isinstance(frames, int):
+            return
+        for _ in range(max(0, min(frames, 1024))):
+            credit.release()
+    
+    async def cancel(self, stream_id: str) -> None:
+        task = self.tasks.get(stream_id)
+        if task is not None:
+            task.cancel()
+            await self.send({"type": "cancelled", "id": stream_id})
+    
+    def cancel_all(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+
+@app.websocket("/api/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """Multiplex chat streams over one persistent WebSocket.
+    
+    Client messages (JSON):
+      {"type": "start", "id": "s1", "message": "...", "history": [...],
+       "conversation_id": "...", "no_cache": false}
+      {"type": "cancel", "id": "s1"}
+      {"type": "credit", "id": "s1", "frames": 32}
+    Server messages carry the stream id: content, complete, error and
+    cancelled, plus conversation (with the issued conversation_id) for a
+    "new" conversation.
+    """
+    await websocket.accept()
+    websocket_connections.inc()
+    streams = WebSocketStreams(websocket)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                message_type = message.get("type")
+                stream_id = str(message.get("id", ""))
+            except (ValueError, AttributeError):
+                await streams.send({"type": "error", "error": "Messages must be JSON objects"})
+                continue
+            if not 0 < len(stream_id) <= 64:
+                await streams.send({"type": "error", "error": "Each message needs a stream id"})
+            elif message_type == "start":
+                await streams.start(stream_id, message)
+            elif message_type == "cancel":
+                await streams.cancel(stream_id)
+            elif message_type == "credit":
+                streams.grant(stream_id, message.get("frames"))
+            else:
+                await streams.send({"type": "error", "id": stream_id, "error": f"Unknown message type: {message_type}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        streams.cancel_all()
+        websocket_connections.dec()
+
+@app.delete("/api/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    """Forget a server-side conversation."""
+    if not await conversation_store.exists(conversation_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation")
+    await conversation_store.delete(conversation_id)
+    return {"status": "deleted"}
+
 @app.get("/health")
 async def health():
     """Health check endpoint."""
-    return {"status": "healthy", "config": {"has_endpoint": bool(config.DO_AGENT_ENDPOINT)}}
+    return {
+        "status": "healthy",
+        "config": {"has_endpoint": bool(config.DO_AGENT_ENDPOINT)},
+        "agent_pool": agent_clients.pool_stats(),
+        "agent_circuit": chat_service.circuit_breaker.state,
+        "slack_events": slack_event_queue.stats() if slack_event_queue else None,
+        "slack_history_cache": slack_bot.history_cache.stats() if slack_bot else None
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics for chat latency, throughput and errors."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+slack_retries = metrics.counter(
+    "slack_event_retries_total",
+    "Slack event redeliveries received, by X-Slack-Retry-Reason",
+    ("reason",),
+)
+slack_duplicates_suppressed = metrics.counter(
+    "slack_event_duplicates_suppressed_total",
+    "Slack events ignored because their event ID was already handled",
+    ("reason",),
+)
 
 def verify_slack_signature(request_body: bytes, timestamp: str, signature: str) -> bool:
     """Verify Slack request signature."""
@@ -167,9 +993,27 @@ def verify_slack_signature(request_body: bytes, timestamp: str, signature: str)
     
     return hmac.compare_digest(expected_signature, signature)
 
+async def handle_queued_slack_event(event_data: dict) -> None:
+    """Handle a Slack event from the worker pool once admission control grants it a slot."""
+    try:
+        # Queue per workspace, sharing agent capacity fairly with web chat
+        key = f"slack:{event_data.get('team_id', 'unknown')}"
+        slot = await admission.acquire(key, config.ADMISSION_MAX_WAIT)
+    except (QueueFull, asyncio.TimeoutError):
+        # The event was acknowledged already, so Slack will not redeliver it
+        print(f"Dropped Slack event {event_data.get('event_id')}: server busy")
+        await slack_bot.reply_busy(event_data)
+        return
+    try:
+        await slack_bot.handle_slack_event(event_data)
+    finally:
+        slot.release()
+
 @app.post("/slack/events")
 async def slack_events(request: Request):
     """Handle Slack event subscriptions."""
+    if config.SLACK_BOT_TOKEN:
+        await wait_until_warm()
     if not slack_bot:
         raise HTTPException(status_code=501, detail="Slack integration not configured")
     
@@ -193,8 +1037,28 @@ async def slack_events(request: Request):
     
     # Handle events
     if event_data.get("type") == "event_callback":
-        # Process event in background to respond quickly to Slack
-        asyncio.create_task(slack_bot.handle_slack_event(event_data))
+        retry_reason = request.headers.get("X-Slack-Retry-Reason", "")
+        if request.headers.get("X-Slack-Retry-Num"):
+            slack_retries.inc(reason=retry_reason or "unknown")
+        
+        # Bot echoes, edits and other events we don't answer never take a queue or agent slot
+        if not slack_bot.wants_event(event_data):
+            return {"status": "ignored"}
+        
+        # Slack redelivers events it thinks we missed; handle each event ID once
+        event_id = event_data.get("event_id")
+        if event_id and not await slack_dedup.claim(event_id):
+            slack_duplicates_suppressed.inc(reason=retry_reason or "none")
+            return {"status": "duplicate"}
+        
+        # Acknowledge right away and let the worker pool handle it; when the
+        # backlog is full Slack redelivers the event later
+        try:
+            slack_event_queue.submit(event_data)
+        except QueueFull as e:
+            if event_id:
+                await slack_dedup.release(event_id)
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
         return {"status": "ok"}
     
     return {"status": "ignored"}
@@ -204,7 +1068,11 @@ async def root():
     """Root endpoint."""
     endpoints = {
         "chat": "/api/chat/stream",
-        "health": "/health"
+        "chat_sse": "/api/chat/sse",
+        "chat_ws": "/api/chat/ws",
+        "chat_batch": "/api/chat/batch",
+        "health": "/health",
+        "metrics": "/metrics"
     }
     
     if slack_bot:
@@ -219,6 +1087,9 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
+    from dotenv import load_dotenv
+    load_dotenv()
+    config.load()
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -2,45 +2,114 @@
 Slack bot integration for DASH AI assistant.
 Handles Slack events and conversations with DigitalOcean Agent.
 """
+import asyncio
 import re
-from typing import List, Dict, Any, Optional
-from slack_sdk import WebClient
-from openai import OpenAI
-from chat_service import get_chat_response
-from markdown_to_mrkdwn import SlackMarkdownConverter
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+import aiohttp
+from slack_sdk.web.async_client import AsyncWebClient
+from chat_service import get_chat_response, stream_chat_response
+from slack_delivery import SlackDelivery, split_message
+from slack_history import SlackHistoryCache, ts_key
+from slack_identity import BotIdentity
+from slack_mrkdwn import MrkdwnStream, to_mrkdwn
+import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+
+slack_event_duration = metrics.histogram(
+    "slack_event_handling_seconds",
+    "Time to handle a Slack event, including the agent call and reply",
+    ("event_type",),
+)
+slack_event_errors = metrics.counter(
+    "slack_event_errors_total",
+    "Slack events that failed while being handled",
+    ("event_type",),
+)
+slack_first_text = metrics.histogram(
+    "slack_reply_first_text_seconds",
+    "Time from starting a reply until answer text is visible in Slack",
+    ("mode",),
+)
+slack_message_updates = metrics.counter(
+    "slack_message_updates_total",
+    "chat.update calls made while streaming answers into Slack",
+    ("result",),
+)
+
+PLACEHOLDER_TEXT = "_Thinking…_"
+ERROR_TEXT = "Sorry, I encountered an error processing your request."
+# Message subtypes that are not a user asking something: edits and
+# deletions (our streamed replies cause many) carry no top-level text
+IGNORED_SUBTYPES = {"message_changed", "message_deleted", "bot_message"}
+BUSY_TEXT = "Sorry, I'm handling too many questions right now. Please ask again in a minute."
 
 
 class SlackBot:
-    def __init__(self, slack_token: str, openai_client: OpenAI):
-        self.slack_client = WebClient(token=slack_token)
+    def __init__(self, slack_token: str, openai_client: "AsyncOpenAI", history_limit: int = 15,
+                 max_connections: int = 20, stream_replies: bool = True, update_interval: float = 1.0,
+                 history_cache: Optional[SlackHistoryCache] = None, channel_rate: float = 1.0,
+                 channel_burst: float = 3, delivery_attempts: int = 3, identity_path: Optional[str] = None,
+                 identity_refresh_seconds: float = 3600):
+        # Async client so Slack API calls never block web chat streams on the event loop
+        self.slack_client = AsyncWebClient(token=slack_token)
         self.openai_client = openai_client
-        self.bot_user_id: Optional[str] = None
-        self.markdown_converter = SlackMarkdownConverter()
-    
-    def _fix_slack_formatting(self, text: str) -> str:
-        """Fix common Slack formatting issues after markdown conversion."""
-        # Replace asterisk bullets with Slack-friendly bullets
-        lines = text.split('\n')
-        fixed_lines = []
-        
-        for line in lines:
-            # Check if line starts with * (bullet point)
-            if line.strip().startswith('* '):
-                # Replace with bullet character and proper indentation
-                fixed_line = line.replace('* ', '• ', 1)
-                fixed_lines.append(fixed_line)
-            else:
-                fixed_lines.append(line)
+        # Messages fetched per request; chat_service compacts them to the token budget
+        self.history_limit = history_limit
+        self.history_cache = history_cache or SlackHistoryCache(max_messages=history_limit)
+        # Every Slack API call is paced by per-method and per-channel rate limits
+        self.delivery = SlackDelivery(self._client, channel_rate=channel_rate, channel_burst=channel_burst,
+                                      max_attempts=delivery_attempts)
+        self.max_connections = max_connections
+        # Post a placeholder and edit it as the answer streams in, at most once per interval
+        self.stream_replies = stream_replies
+        self.update_interval = update_interval
+        # Resolved at startup (see start), optionally shared with other workers through a file
+        self.identity = BotIdentity(lambda: self.delivery.call("auth.test"), slack_token,
+                                    path=identity_path, refresh_seconds=identity_refresh_seconds)
+        self._identity_refresh: Optional[asyncio.Task] = None
+    
+    @property
+    def bot_user_id(self) -> Optional[str]:
+        return self.identity.user_id
+    
+    def _client(self) -> AsyncWebClient:
+        """Return the Slack client, attaching the shared connection pool on first use.
         
-        return '\n'.join(fixed_lines)
+        Without a session slack_sdk opens a new aiohttp session (and TLS
+        connection) for every call; the pool is created lazily because aiohttp
+        sessions must be created inside the running event loop.
+        """
+        session = self.slack_client.session
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self.slack_client.session = aiohttp.ClientSession(connector=connector)
+        return self.slack_client
+    
+    async def aclose(self) -> None:
+        """Stop the identity refresh and close the pooled Slack connections."""
+        if self._identity_refresh is not None:
+            self._identity_refresh.cancel()
+        session = self.slack_client.session
+        if session is not None and not session.closed:
+            await session.close()
     
     async def initialize(self):
-        """Initialize bot user ID for mention detection."""
-        try:
-            auth_response = self.slack_client.auth_test()
-            self.bot_user_id = auth_response["user_id"]
-        except Exception as e:
-            print(f"Failed to initialize bot: {e}")
+        """Resolve the bot user ID for mention detection, from the identity cache file if it is fresh."""
+        await self.identity.resolve()
+    
+    async def start(self) -> None:
+        """Resolve the bot identity before events arrive and keep it fresh in the background.
+        
+        Events never wait for auth.test; if it fails here, the background
+        refresh retries and the bot's own messages are still recognized by
+        their bot_id meanwhile.
+        """
+        await self.initialize()
+        self._identity_refresh = asyncio.create_task(self.identity.refresh_forever())
     
     def _is_bot_mentioned(self, text: str) -> bool:
         """Check if the bot is mentioned in the message."""
@@ -56,29 +125,50 @@ class SlackBot:
         mention_pattern = f"<@{self.bot_user_id}>"
         return text.replace(mention_pattern, "").strip()
     
-    async def _get_conversation_history(self, channel: str, thread_ts: Optional[str] = None, limit: int = 15) -> List[Dict[str, str]]:
-        """Get conversation history from Slack and convert to OpenAI format."""
-        try:
+    async def _get_conversation_history(self, channel: str, thread_ts: Optional[str] = None, limit: Optional[int] = None,
+                                        before_ts: Optional[str] = None, complete: bool = False) -> List[Dict[str, str]]:
+        """Get conversation history (messages before `before_ts`) and convert to OpenAI format.
+        
+        Messages come from the per-channel cache; Slack is only asked for what
+        the cache has not seen. `complete` marks conversations where every
+        message reaches the bot as an event (DMs).
+        """
+        limit = limit or self.history_limit
+        
+        async def fetch(oldest: Optional[str]) -> List[Dict[str, Any]]:
+            # Only messages newer than `oldest` when refreshing a cached channel
+            extra = {"oldest": oldest} if oldest else {}
             if thread_ts:
                 # Get thread replies for channel mentions
-                response = self.slack_client.conversations_replies(
-                    channel=channel,
+                response = await self.delivery.call(
+                    "conversations.replies",
+                    channel,
                     ts=thread_ts,
-                    limit=limit
+                    limit=limit,
+                    **extra
                 )
-                messages = response["messages"]
             else:
                 # Get conversation history for DMs
-                response = self.slack_client.conversations_history(
-                    channel=channel,
-                    limit=limit
+                response = await self.delivery.call(
+                    "conversations.history",
+                    channel,
+                    limit=limit,
+                    **extra
                 )
-                messages = response["messages"]
+            return response["messages"]
+        
+        try:
+            messages = await self.history_cache.lookup((channel, thread_ts), fetch, complete=complete)
             
-            # Convert to OpenAI format, excluding the current message (it's the last one)
+            # Exclude the current message (and anything after it); messages are oldest first
+            if before_ts:
+                messages = [msg for msg in messages if ts_key(msg["ts"]) < ts_key(before_ts)]
+            
+            # Convert to OpenAI format
             history = []
-            for msg in reversed(messages[:-1]):  # Reverse to chronological order, exclude last message
-                if msg.get("bot_id") == self.bot_user_id or msg.get("user") == self.bot_user_id:
+            for msg in messages[-limit:]:
+                bot_id = msg.get("bot_id")
+                if msg.get("user") == self.bot_user_id or (bot_id and bot_id == self.identity.bot_id):
                     # Bot message
                     history.append({
                         "role": "assistant",
@@ -112,31 +202,12 @@ class SlackBot:
             return
         
         # Get conversation history from channel (not thread-specific)
-        history = await self._get_conversation_history(channel, None)
-        
-        # Get AI response
-        response = await get_chat_response(self.openai_client, clean_text, history)
-        
-        # Convert markdown to Slack mrkdwn
-        slack_response = self.markdown_converter.convert(response)
-        # Fix any remaining formatting issues
-        slack_response = self._fix_slack_formatting(slack_response)
+        history = await self._get_conversation_history(channel, None, before_ts=event.get("ts"))
+        self.history_cache.add((channel, None), event)
         
         # Send response as new message (not in thread)
-        try:
-            self.slack_client.chat_postMessage(
-                channel=channel,
-                text=slack_response
-                # Removed thread_ts to send as new message
-            )
-        except Exception as e:
-            print(f"Error sending message: {e}")
-            # Send error response
-            self.slack_client.chat_postMessage(
-                channel=channel,
-                text="Sorry, I encountered an error processing your request."
-                # No thread_ts for demo
-            )
+        for message in await self._reply(channel, clean_text, history):
+            self.history_cache.add((channel, None), message)
     
     async def handle_direct_message(self, event: Dict[str, Any]):
         """Handle direct messages to the bot."""
@@ -146,42 +217,131 @@ class SlackBot:
         if not text.strip():
             return
         
-        # Get conversation history
-        history = await self._get_conversation_history(channel)
+        # Get conversation history; every DM message reaches us as an event, so the cache stays complete
+        history = await self._get_conversation_history(channel, before_ts=event.get("ts"), complete=True)
+        self.history_cache.add((channel, None), event)
         
-        # Get AI response
-        response = await get_chat_response(self.openai_client, text, history)
+        for message in await self._reply(channel, text, history):
+            self.history_cache.add((channel, None), message)
+    
+    async def _reply(self, channel: str, question: str, history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Answer `question` in `channel`, streaming the answer in if enabled.
         
-        # Convert markdown to Slack mrkdwn
-        slack_response = self.markdown_converter.convert(response)
-        # Fix any remaining formatting issues
-        slack_response = self._fix_slack_formatting(slack_response)
+        Long answers are split over several messages. Returns the bot's
+        messages as Slack stores them, for the history cache.
+        """
+        if self.stream_replies:
+            return await self._stream_reply(channel, question, history)
         
-        # Send response
+        started = time.perf_counter()
+        response = await get_chat_response(self.openai_client, question, history)
+        posted: List[Dict[str, Any]] = []
         try:
-            self.slack_client.chat_postMessage(
-                channel=channel,
-                text=slack_response
-            )
+            for chunk in split_message(to_mrkdwn(response)):
+                message = await self.delivery.call("chat.postMessage", channel, text=chunk)
+                posted.append({"ts": message["ts"], "user": self.bot_user_id, "text": chunk})
+                if len(posted) == 1:
+                    slack_first_text.observe(time.perf_counter() - started, mode="post")
         except Exception as e:
-            print(f"Error sending DM: {e}")
-            # Send error response
-            self.slack_client.chat_postMessage(
-                channel=channel,
-                text="Sorry, I encountered an error processing your request."
-            )
+            print(f"Error sending message: {e}")
+            # Send error response (queued behind the rate limit like any other message)
+            await self.delivery.call("chat.postMessage", channel, text=ERROR_TEXT)
+        return posted
+    
+    async def _stream_reply(self, channel: str, question: str, history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Post a placeholder right away, then edit it as the answer streams in.
+        
+        Partial edits are skipped while the channel or chat.update rate limit
+        has no room (and at least `update_interval` apart); the final edit
+        waits its turn and always carries the complete answer. Text beyond
+        one message continues in follow-up messages.
+        """
+        started = time.perf_counter()
+        placeholder = await self.delivery.call("chat.postMessage", channel, text=PLACEHOLDER_TEXT)
+        channel = placeholder["channel"]
+        posted = [{"ts": placeholder["ts"], "user": self.bot_user_id, "text": PLACEHOLDER_TEXT}]
+        
+        # Each complete line of the answer is converted to mrkdwn once, as it arrives
+        stream = MrkdwnStream()
+        first_text_seen = False
+        next_update = time.monotonic() + self.update_interval
+        async for frame in stream_chat_response(self.openai_client, question, history):
+            stream.feed(frame)
+            if time.monotonic() < next_update or not self.delivery.ready("chat.update", channel):
+                continue
+            next_update = time.monotonic() + self.update_interval
+            text = stream.render()
+            if not text:
+                continue
+            try:
+                # Partial edits are best effort; the final edit still goes out
+                await self._show(channel, posted, split_message(text), final=False)
+            except Exception as e:
+                slack_message_updates.inc(result="error")
+                print(f"Error updating message: {e}")
+            if not first_text_seen and posted[0]["text"] != PLACEHOLDER_TEXT:
+                first_text_seen = True
+                slack_first_text.observe(time.perf_counter() - started, mode="stream")
+        
+        try:
+            chunks = split_message(stream.finish() or ERROR_TEXT)
+            await self._show(channel, posted, chunks, final=True)
+            if not first_text_seen:
+                slack_first_text.observe(time.perf_counter() - started, mode="stream")
+        except Exception as e:
+            print(f"Error sending message: {e}")
+            # Replace the placeholder with an error response
+            await self.delivery.call("chat.update", channel, ts=posted[0]["ts"], text=ERROR_TEXT)
+            posted[0]["text"] = ERROR_TEXT
+        return posted
+    
+    async def _show(self, channel: str, posted: List[Dict[str, Any]], chunks: List[str], final: bool) -> None:
+        """Make the bot's messages read `chunks`: edit changed ones, post new ones, delete extras."""
+        for index, chunk in enumerate(chunks):
+            if index == len(posted):
+                message = await self.delivery.call("chat.postMessage", channel, text=chunk)
+                posted.append({"ts": message["ts"], "user": self.bot_user_id, "text": chunk})
+            elif posted[index]["text"] != chunk:
+                # A rate limited partial edit is dropped rather than retried
+                await self.delivery.call("chat.update", channel, attempts=None if final else 1,
+                                         ts=posted[index]["ts"], text=chunk)
+                slack_message_updates.inc(result="final" if final else "partial")
+                posted[index]["text"] = chunk
+        if final:
+            # The final conversion can come out shorter than a partial one
+            while len(posted) > len(chunks):
+                await self.delivery.call("chat.delete", channel, ts=posted.pop()["ts"])
+    
+    def wants_event(self, event_data: Dict[str, Any]) -> bool:
+        """Whether an event is a mention or DM to answer, checked before it waits for an agent slot."""
+        event = event_data.get("event", {})
+        # Ignore bot's own messages, edits and deletions; other subtypes,
+        # such as file_share (a DM with an attachment), are still answered
+        if event.get("user") == self.bot_user_id or event.get("bot_id") or event.get("subtype") in IGNORED_SUBTYPES:
+            return False
+        if not event.get("user") or "text" not in event:
+            return False
+        return event.get("type") == "app_mention" or (
+            event.get("type") == "message" and event.get("channel_type") == "im"
+        )
+    
+    async def reply_busy(self, event_data: Dict[str, Any]) -> None:
+        """Tell the user their question was dropped because the server is busy."""
+        channel = event_data.get("event", {}).get("channel")
+        if not channel:
+            return
+        try:
+            await self.delivery.call("chat.postMessage", channel, text=BUSY_TEXT)
+        except Exception as e:
+            print(f"Error sending busy reply: {e}")
     
     async def handle_slack_event(self, event_data: Dict[str, Any]):
         """Main event handler for Slack events."""
         event = event_data.get("event", {})
         event_type = event.get("type")
+        started = time.perf_counter()
         
-        # Initialize bot user ID if not done yet
-        if not self.bot_user_id:
-            await self.initialize()
-        
-        # Ignore bot's own messages
-        if event.get("user") == self.bot_user_id or event.get("bot_id"):
+        if not self.wants_event(event_data):
             return
         
         try:
@@ -190,4 +350,7 @@ class SlackBot:
             elif event_type == "message" and event.get("channel_type") == "im":
                 await self.handle_direct_message(event)
         except Exception as e:
-            print(f"Error handling Slack event: {e}")
\ No newline at end of file
+            slack_event_errors.inc(event_type=event_type)
+            print(f"Error handling Slack event: {e}")
+        finally:
+            slack_event_duration.observe(time.perf_counter() - started, event_type=event_type)
\ No newline at end of file
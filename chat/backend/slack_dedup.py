@@ -0,0 +1,95 @@
+"""
+Duplicate suppression for Slack events.
+Slack redelivers an event (with X-Slack-Retry-Num set) whenever it thinks we
+were too slow or failed, so the same mention can arrive several times. Event
+IDs are remembered for a while in memory and, optionally, in a local SQLite
+database shared by every worker process on the host.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from caching import TTLCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slack_events (
+    event_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slack_events_seen_at ON slack_events (seen_at);
+"""
+
+
+class EventDeduplicator:
+    """Remembers Slack event IDs for `ttl_seconds` so each event is handled once.
+
+    With a `path`, claims go through SQLite so separate worker processes agree
+    on who handles an event; the in-memory cache answers repeats without a
+    database round trip.
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_size: int = 10000, ttl_seconds: float = 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._seen = TTLCache(cache_size, ttl=ttl_seconds)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _claim(self, event_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            # Inserts a new ID, or takes over one whose previous claim has expired
+            cursor = self._db().execute(
+                "INSERT INTO slack_events (event_id, seen_at) VALUES (?, ?) "
+                "ON CONFLICT (event_id) DO UPDATE SET seen_at = excluded.seen_at WHERE seen_at < ?",
+                (event_id, now, now - self.ttl_seconds)
+            )
+            return cursor.rowcount == 1
+
+    def _release(self, event_id: str) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM slack_events WHERE event_id = ?", (event_id,))
+
+    def _purge(self, cutoff: float) -> int:
+        with self._lock:
+            return self._db().execute("DELETE FROM slack_events WHERE seen_at < ?", (cutoff,)).rowcount
+
+    async def claim(self, event_id: str) -> bool:
+        """Record `event_id`; returns False if it was already seen within the TTL."""
+        if event_id in self._seen:
+            return False
+        self._seen.set(event_id, True)
+        if self.path and not await asyncio.to_thread(self._claim, event_id):
+            return False
+        return True
+
+    async def release(self, event_id: str) -> None:
+        """Forget a claim, e.g. when the event could not be queued, so Slack's retry is handled."""
+        self._seen.pop(event_id)
+        if self.path:
+            await asyncio.to_thread(self._release, event_id)
+
+    async def purge_expired(self) -> int:
+        """Forget IDs older than the TTL; returns how many database rows were deleted."""
+        self._seen.purge_expired()
+        if not self.path:
+            return 0
+        return await asyncio.to_thread(self._purge, time.time() - self.ttl_seconds)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
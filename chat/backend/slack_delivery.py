@@ -0,0 +1,187 @@
+"""
+Rate-limit-aware delivery of Slack Web API calls.
+Every call the bot makes goes through token buckets: one per method for the
+workspace (Slack's per-method tiers) and, for messages, one per channel
+(about one message per second). Calls wait their turn instead of tripping
+Slack's limits, a 429 pauses the bucket for the Retry-After period before
+the call is retried, and long answers are split into block-sized messages.
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from slack_sdk.errors import SlackApiError
+
+import metrics
+
+queue_delay = metrics.histogram(
+    "slack_delivery_queue_seconds",
+    "Time Slack API calls waited for rate limit tokens before being sent",
+    ("method",),
+)
+waiting_calls = metrics.gauge(
+    "slack_delivery_waiting",
+    "Slack API calls currently waiting for rate limit tokens",
+)
+delivery_results = metrics.counter(
+    "slack_delivery_requests_total",
+    "Slack API calls by outcome",
+    ("method", "result"),
+)
+
+# Slack's limits: Tier 3 methods allow ~50 calls per minute per workspace,
+# Tier 4 ~100; chat.postMessage allows ~1 message per second per channel.
+WORKSPACE_LIMITS_PER_MINUTE = {
+    "chat.postMessage": 600,
+    "chat.update": 50,
+    "conversations.history": 50,
+    "conversations.replies": 50,
+    "auth.test": 100,
+    "users.info": 100,
+}
+DEFAULT_LIMIT_PER_MINUTE = 20
+# Methods that post into a channel and share its message budget
+CHANNEL_METHODS = ("chat.postMessage", "chat.update")
+
+# Slack rejects section blocks over 3000 characters and truncates long messages
+MAX_MESSAGE_CHARS = 3000
+CODE_FENCE = "```"
+
+
+class TokenBucket:
+    """Token bucket handing out send times; callers may go into debt and wait their turn."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def ready(self) -> bool:
+        """Whether a call could go out right now."""
+        self._refill()
+        return self.tokens >= 1
+
+    def reserve(self) -> float:
+        """Take a token; returns how many seconds to wait before using it."""
+        self._refill()
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds` (Slack said Retry-After)."""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+def _cut(text: str, cut: int) -> Tuple[str, str]:
+    """Split `text` at `cut`, closing a code block left open and reopening it in the rest."""
+    part, rest = text[:cut].rstrip(), text[cut:].lstrip("\n ")
+    if part.count(CODE_FENCE) % 2:
+        part += "\n" + CODE_FENCE
+        rest = CODE_FENCE + "\n" + rest
+    return part, rest
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_CHARS) -> List[str]:
+    """Split mrkdwn into messages of at most `limit` characters.
+
+    Splits at paragraph breaks, then line breaks, then spaces; a code block
+    cut in two is closed at the end of one part and reopened in the next.
+    """
+    parts: List[str] = []
+    while len(text) > limit:
+        # Leave room to close a code block that is cut in two
+        window = text[:limit - len(CODE_FENCE) - 1]
+        cuts = [window.rfind(separator) for separator in ("\n\n", "\n", " ")]
+        for cut in [cut for cut in cuts if cut > 0] + [len(window)]:
+            part, rest = _cut(text, cut)
+            # A cut that only reopens the code block it closes would loop forever
+            if len(rest) < len(text):
+                break
+        parts.append(part)
+        text = rest
+    if text.strip() or not parts:
+        parts.append(text)
+    return parts
+
+
+class SlackDelivery:
+    """Schedules Slack Web API calls under per-method and per-channel token buckets."""
+
+    def __init__(self, client_factory: Callable[[], Any], channel_rate: float = 1.0,
+                 channel_burst: float = 3, max_attempts: int = 3,
+                 limits_per_minute: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self._client_factory = client_factory
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_attempts = max_attempts
+        self.limits_per_minute = {**WORKSPACE_LIMITS_PER_MINUTE, **(limits_per_minute or {})}
+        self.clock = clock
+        self._method_buckets: Dict[str, TokenBucket] = {}
+        self._channel_buckets: Dict[str, TokenBucket] = {}
+
+    def _buckets(self, method: str, channel: Optional[str]) -> List[TokenBucket]:
+        bucket = self._method_buckets.get(method)
+        if bucket is None:
+            per_minute = self.limits_per_minute.get(method, DEFAULT_LIMIT_PER_MINUTE)
+            # Allow a few seconds' worth of calls in a burst
+            bucket = TokenBucket(per_minute / 60, max(1.0, per_minute / 20), self.clock)
+            self._method_buckets[method] = bucket
+        buckets = [bucket]
+        if channel and method in CHANNEL_METHODS:
+            channel_bucket = self._channel_buckets.get(channel)
+            if channel_bucket is None:
+                channel_bucket = TokenBucket(self.channel_rate, self.channel_burst, self.clock)
+                self._channel_buckets[channel] = channel_bucket
+            buckets.append(channel_bucket)
+        return buckets
+
+    def ready(self, method: str, channel: Optional[str] = None) -> bool:
+        """Whether a call could be sent without waiting."""
+        return all(bucket.ready() for bucket in self._buckets(method, channel))
+
+    async def call(self, method: str, channel: Optional[str] = None, *, attempts: Optional[int] = None,
+                   **kwargs: Any) -> Any:
+        """Call a Web API method (e.g. "chat.postMessage") once rate limits allow.
+
+        Rate limited calls are retried after Retry-After, up to `attempts`
+        times; the last SlackApiError is raised when they run out.
+        """
+        attempts = attempts or self.max_attempts
+        if channel is not None:
+            kwargs["channel"] = channel
+        api_method = getattr(self._client_factory(), method.replace(".", "_"))
+        for attempt in range(1, attempts + 1):
+            queued_at = self.clock()
+            buckets = self._buckets(method, channel)
+            wait = max(bucket.reserve() for bucket in buckets)
+            if wait:
+                waiting_calls.inc()
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    waiting_calls.dec()
+            queue_delay.observe(self.clock() - queued_at, method=method)
+            try:
+                response = await api_method(**kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429:
+                    delivery_results.inc(method=method, result="error")
+                    raise
+                delivery_results.inc(method=method, result="rate_limited")
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                for bucket in buckets:
+                    bucket.pause(retry_after)
+                if attempt == attempts:
+                    raise
+                continue
+            delivery_results.inc(method=method, result="ok")
+            return response
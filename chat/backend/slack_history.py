@@ -0,0 +1,118 @@
+"""
+Per-channel cache of recent Slack messages.
+Keeps the last few messages of each active conversation in memory so the
+bot does not re-read the whole history from Slack for every mention or DM.
+Incoming events and the bot's own replies are added as they happen; DMs,
+where every message reaches us as an event, are then served from memory,
+and other channels only fetch messages newer than the last one fetched.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import metrics
+from caching import TTLCache
+
+history_lookups = metrics.counter(
+    "slack_history_lookups_total",
+    "Slack history lookups: hit (no API call), refresh (newer messages only) or miss (full fetch)",
+    ("result",),
+)
+
+# Fetches messages (newest first, as Slack returns them), optionally only those newer than `oldest`
+Fetch = Callable[[Optional[str]], Awaitable[List[Dict[str, Any]]]]
+
+KEPT_FIELDS = ("ts", "user", "bot_id", "text")
+
+
+def ts_key(ts: str) -> Tuple[int, ...]:
+    """Sort key for Slack timestamps ("1700000000.000100")."""
+    return tuple(int(part) for part in ts.split("."))
+
+
+@dataclass
+class ChannelHistory:
+    """Recent messages of one conversation, oldest first."""
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    # Every new message reaches us as an event, so no refresh is needed
+    complete: bool = False
+    # Newest message fetched from Slack. Refreshes start here rather than at
+    # the newest message added from events, since other messages may have
+    # been posted in between (e.g. while the bot was answering).
+    fetched_ts: Optional[str] = None
+
+
+class SlackHistoryCache:
+    """Recent messages per conversation, evicted after `idle_seconds` without use."""
+
+    def __init__(self, max_channels: int = 1000, max_messages: int = 15, idle_seconds: float = 1800):
+        self.max_messages = max_messages
+        self._channels = TTLCache(max_channels, ttl=idle_seconds)
+        self.hits = 0
+        self.refreshes = 0
+        self.misses = 0
+
+    def _fetched(self, history: ChannelHistory, messages: List[Dict[str, Any]]) -> None:
+        """Merge messages fetched from Slack and move the refresh point past them."""
+        self._merge(history, messages)
+        fetched = [message["ts"] for message in messages if message.get("ts")]
+        if history.fetched_ts:
+            fetched.append(history.fetched_ts)
+        if fetched:
+            history.fetched_ts = max(fetched, key=ts_key)
+
+    def _merge(self, history: ChannelHistory, messages: List[Dict[str, Any]]) -> None:
+        """Add messages (any order), dropping duplicates and keeping the newest `max_messages`."""
+        by_ts = {message["ts"]: message for message in history.messages}
+        for message in messages:
+            if message.get("ts"):
+                by_ts[message["ts"]] = {name: message[name] for name in KEPT_FIELDS if name in message}
+        ordered = sorted(by_ts.values(), key=lambda message: ts_key(message["ts"]))
+        history.messages = ordered[-self.max_messages:]
+
+    async def lookup(self, key: Hashable, fetch: Fetch, complete: bool = False) -> List[Dict[str, Any]]:
+        """Recent messages for a conversation, oldest first, fetching from Slack only what is missing.
+
+        `complete` marks conversations whose every message arrives as an
+        event (DMs); they are only fetched when not cached.
+        """
+        history: Optional[ChannelHistory] = self._channels.get(key)
+        if history is None:
+            history = ChannelHistory(complete=complete)
+            self._fetched(history, await fetch(None))
+            self.misses += 1
+            history_lookups.inc(result="miss")
+        elif history.complete:
+            self.hits += 1
+            history_lookups.inc(result="hit")
+        else:
+            self._fetched(history, await fetch(history.fetched_ts))
+            self.refreshes += 1
+            history_lookups.inc(result="refresh")
+        # Storing again restarts the idle timer
+        self._channels.set(key, history)
+        return list(history.messages)
+
+    def add(self, key: Hashable, message: Dict[str, Any]) -> None:
+        """Record a message seen as an event or posted by the bot, if the conversation is cached."""
+        history: Optional[ChannelHistory] = self._channels.get(key)
+        if history is not None:
+            self._merge(history, [message])
+
+    def purge_expired(self) -> int:
+        """Drop conversations idle for longer than `idle_seconds`."""
+        return self._channels.purge_expired()
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered without a full history fetch."""
+        lookups = self.hits + self.refreshes + self.misses
+        return (self.hits + self.refreshes) / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self._channels),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+        }
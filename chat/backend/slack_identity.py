@@ -0,0 +1,124 @@
+"""
+The bot's own Slack identity.
+Events from the bot itself must be ignored, which needs the bot's user ID
+from auth.test. It is resolved once at startup rather than on the first
+event, kept in a small local file so other worker processes (and restarts)
+start with it right away, and refreshed in the background.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+import metrics
+
+identity_refreshes = metrics.counter(
+    "slack_identity_refreshes_total",
+    "Bot identity lookups: cache_file (read from the shared file), auth_test (asked Slack) or error",
+    ("source",),
+)
+
+# Retry a failed lookup sooner than the regular refresh
+RETRY_SECONDS = 30
+
+
+@dataclass
+class Identity:
+    user_id: str
+    bot_id: Optional[str]
+    team_id: Optional[str]
+    resolved_at: float
+    # Hash of the bot token, so a file written for another token is ignored
+    token_hash: str
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+class BotIdentity:
+    """Resolves the bot's user ID with auth.test and keeps it fresh.
+
+    `auth_test` is called as `await auth_test()` and returns the auth.test
+    response. With a `path`, the identity is read from and written to that
+    file; a file younger than `refresh_seconds` saves the auth.test call.
+    """
+
+    def __init__(self, auth_test: Callable[[], Awaitable[Any]], token: str, path: Optional[str] = None,
+                 refresh_seconds: float = 3600):
+        self._auth_test = auth_test
+        self._token_hash = token_hash(token)
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.current: Optional[Identity] = None
+
+    @property
+    def user_id(self) -> Optional[str]:
+        return self.current.user_id if self.current else None
+
+    @property
+    def bot_id(self) -> Optional[str]:
+        return self.current.bot_id if self.current else None
+
+    def _fresh(self, identity: Optional[Identity]) -> bool:
+        return identity is not None and time.time() - identity.resolved_at < self.refresh_seconds
+
+    def _read(self) -> Optional[Identity]:
+        try:
+            with open(self.path) as f:
+                identity = Identity(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        return identity if identity.token_hash == self._token_hash else None
+
+    def _write(self, identity: Identity) -> None:
+        # Write then rename, so other processes never read a partial file
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(asdict(identity), f)
+        os.replace(temporary, self.path)
+
+    async def resolve(self) -> Optional[Identity]:
+        """Load the identity from the cache file, or ask Slack when the file is missing or stale.
+
+        Failures are logged and leave the previous identity in place.
+        """
+        if self.path:
+            cached = await asyncio.to_thread(self._read)
+            if self._fresh(cached):
+                self.current = cached
+                identity_refreshes.inc(source="cache_file")
+                return cached
+        try:
+            response = await self._auth_test()
+        except Exception as e:
+            identity_refreshes.inc(source="error")
+            print(f"Failed to resolve Slack bot identity: {e}")
+            return self.current
+        self.current = Identity(
+            user_id=response["user_id"],
+            bot_id=response.get("bot_id"),
+            team_id=response.get("team_id"),
+            resolved_at=time.time(),
+            token_hash=self._token_hash,
+        )
+        identity_refreshes.inc(source="auth_test")
+        if self.path:
+            try:
+                await asyncio.to_thread(self._write, self.current)
+            except OSError as e:
+                print(f"Failed to write Slack identity cache {self.path}: {e}")
+        return self.current
+
+    async def refresh_forever(self) -> None:
+        """Keep the identity fresh; started in the background once it has been resolved at startup."""
+        while True:
+            if self._fresh(self.current):
+                delay = self.current.resolved_at + self.refresh_seconds - time.time()
+            else:
+                delay = RETRY_SECONDS
+            await asyncio.sleep(delay)
+            await self.resolve()
@@ -0,0 +1,207 @@
+"""
+Markdown to Slack mrkdwn conversion.
+Agent answers are markdown; Slack messages use mrkdwn (*bold*, _italic_,
+<url|text> links, no headings or tables). Conversion is one pass over the
+lines, so a streamed answer is converted as it arrives: MrkdwnStream
+converts each line once it is complete and only holds back what is still
+ambiguous (the unfinished last line, or a possible table header until the
+next line shows whether a table follows). Whole answers go through a small
+memo cache, since the same questions tend to get the same answers.
+"""
+import re
+from typing import List, Optional, Tuple
+
+from caching import TTLCache
+
+CODE_FENCE = "```"
+RULE = "──────────"
+
+FENCE = re.compile(r"^```([\w+-]*)\s*$")
+HEADING = re.compile(r"^#{1,6}\s+(.+?)(?:\s+#+)?\s*$")
+TASK = re.compile(r"^(\s*)[-*+] \[([ xX])\] ")
+BULLET = re.compile(r"^(\s*)[-*+] ")
+HORIZONTAL_RULE = re.compile(r"^(?:-{3,}|\*{3,}|_{3,})\s*$")
+TABLE_ROW = re.compile(r"^\|(.+)\|\s*$")
+TABLE_SEPARATOR = re.compile(r"^\|[-:| ]+\|\s*$")
+BOLD = re.compile(r"\*\*(.+?)\*\*")
+# Alternatives are tried left to right at each position; code spans are kept verbatim
+INLINE = re.compile(
+    r"(?P<code>`[^`\n]+`)"
+    r"|\*\*\*(?P<bold_italic>[^*\n]+?)\*\*\*"
+    r"|\*\*(?P<bold>.+?)\*\*"
+    r"|__(?P<underline>.+?)__"
+    r"|~~(?P<strike>.+?)~~"
+    r"|!\[[^\]\n]*\]\((?P<image>[^)\s]+)\)"
+    r"|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\)"
+    r"|(?<![*\w])\*(?P<italic>[^*\s](?:[^*\n]*[^*\s])?)\*(?![*\w])"
+)
+# Markup that is still open at the end of a partial line is not shown yet
+OPENERS = ("`", "**", "~~", "__")
+
+
+def _inline_match(match: "re.Match[str]") -> str:
+    kind = match.lastgroup
+    if kind == "code":
+        return match.group(0)
+    if kind == "bold_italic":
+        return f"*_{match.group(kind)}_*"
+    if kind in ("bold", "underline"):
+        return f"*{convert_inline(match.group(kind))}*"
+    if kind == "strike":
+        return f"~{convert_inline(match.group(kind))}~"
+    if kind == "image":
+        return f"<{match.group(kind)}>"
+    if kind == "link_url":
+        return f"<{match.group('link_url')}|{convert_inline(match.group('link_text'))}>"
+    return f"_{match.group('italic')}_"
+
+
+def convert_inline(text: str) -> str:
+    """Convert emphasis, links, images and strikethrough within one line."""
+    if not any(char in text for char in "*_~[`"):
+        return text
+    return INLINE.sub(_inline_match, text)
+
+
+def convert_line(line: str, in_code: bool) -> Tuple[str, bool]:
+    """Convert one complete line; returns the mrkdwn and whether a code block is open after it."""
+    fence = FENCE.match(line.strip())
+    if fence:
+        return (CODE_FENCE + fence.group(1) if not in_code else CODE_FENCE), not in_code
+    if in_code:
+        return line, True
+    if HORIZONTAL_RULE.match(line):
+        return RULE, False
+    heading = HEADING.match(line)
+    if heading:
+        # The whole heading is bold, so bold inside it is dropped
+        title = BOLD.sub(r"\1", heading.group(1))
+        return f"*{convert_inline(title)}*", False
+    task = TASK.match(line)
+    if task:
+        box = "☐" if task.group(2) == " " else "☑"
+        return f"{task.group(1)}• {box} {convert_inline(line[task.end():])}".rstrip(), False
+    bullet = BULLET.match(line)
+    if bullet:
+        return f"{bullet.group(1)}• {convert_inline(line[bullet.end():])}".rstrip(), False
+    return convert_inline(line).rstrip(), False
+
+
+def _cells(row: str) -> List[str]:
+    return [convert_inline(cell.strip()) for cell in row.strip().strip("|").split("|")]
+
+
+def table_header(row: str) -> str:
+    return " | ".join(f"*{cell}*" if cell else "" for cell in _cells(row))
+
+
+def table_row(row: str) -> str:
+    return " | ".join(_cells(row))
+
+
+def _hold_back(line: str) -> str:
+    """Cut a partial line before markup that has been opened but not closed yet."""
+    for marker in OPENERS:
+        if line.count(marker) % 2:
+            line = line[:line.rfind(marker)]
+    if line.rfind("[") > line.rfind(")"):
+        line = line[:line.rfind("[")]
+    # A "* " bullet marker is not emphasis
+    bullet = BULLET.match(line)
+    if line[bullet.end() if bullet else 0:].replace("**", "").count("*") % 2:
+        line = line[:line.rfind("*")]
+    return line
+
+
+class MrkdwnStream:
+    """Converts markdown fed in pieces, converting each complete line exactly once."""
+
+    def __init__(self):
+        self._lines: List[str] = []
+        # Source text after the last newline
+        self._pending = ""
+        # A table-like line waiting for the next one to tell whether it is a table header
+        self._header: Optional[str] = None
+        self._in_code = False
+        self._in_table = False
+
+    def feed(self, text: str) -> None:
+        """Add the next piece of the answer."""
+        if "\n" not in text:
+            self._pending += text
+            return
+        *lines, self._pending = (self._pending + text).split("\n")
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line: str) -> None:
+        if self._header is not None:
+            header, self._header = self._header, None
+            if TABLE_SEPARATOR.match(line):
+                self._in_table = True
+                self._lines.append(table_header(header))
+                return
+            self._emit(header)
+        if self._in_table:
+            if TABLE_ROW.match(line):
+                self._lines.append(table_row(line))
+                return
+            self._in_table = False
+        if not self._in_code and TABLE_ROW.match(line):
+            self._header = line
+            return
+        self._emit(line)
+
+    def _emit(self, line: str) -> None:
+        converted, self._in_code = convert_line(line, self._in_code)
+        # Leading blank lines are dropped
+        if converted or self._lines:
+            self._lines.append(converted)
+
+    def render(self) -> str:
+        """Mrkdwn for everything fed so far, for showing a partial answer.
+
+        The unfinished last line is converted as it stands, minus markup
+        that is still open, and an open code block is closed so the partial
+        message renders.
+        """
+        lines = self._lines
+        in_code = self._in_code
+        pending = self._pending
+        if self._header is None and pending.strip():
+            if in_code:
+                converted, in_code = convert_line(pending, in_code)
+                lines = lines + [converted]
+            elif self._in_table and TABLE_ROW.match(pending):
+                lines = lines + [table_row(pending)]
+            elif not pending.startswith("|"):
+                converted, in_code = convert_line(_hold_back(pending), in_code)
+                lines = lines + [converted]
+        text = "\n".join(lines).rstrip()
+        if in_code and text:
+            text += "\n" + CODE_FENCE
+        return text
+
+    def finish(self) -> str:
+        """Convert whatever is still held back and return the complete mrkdwn."""
+        if self._pending:
+            self._line(self._pending)
+            self._pending = ""
+        if self._header is not None:
+            header, self._header = self._header, None
+            self._emit(header)
+        return self.render()
+
+
+_converted = TTLCache(256)
+
+
+def to_mrkdwn(markdown: str) -> str:
+    """Convert a whole markdown answer to mrkdwn, reusing the result for repeated answers."""
+    converted = _converted.get(markdown)
+    if converted is None:
+        stream = MrkdwnStream()
+        stream.feed(markdown)
+        converted = stream.finish()
+        _converted.set(markdown, converted)
+    return converted
@@ -0,0 +1,127 @@
+"""
+Bounded worker pool for Slack events.
+Events are acknowledged right away and handled by a fixed number of
+workers. Each channel is pinned to one worker, so replies in a channel go
+out in the order the messages arrived, while different channels are handled
+in parallel. The backlog is capped, and shutdown drains it before exiting.
+"""
+import asyncio
+import math
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+from admission import QueueFull
+
+backlog_size = metrics.gauge(
+    "slack_event_backlog",
+    "Slack events waiting for a worker",
+)
+busy_workers = metrics.gauge(
+    "slack_event_workers_busy",
+    "Slack event workers currently handling an event",
+)
+queue_wait = metrics.histogram(
+    "slack_event_queue_wait_seconds",
+    "Time Slack events spent queued before a worker picked them up",
+)
+dropped_events = metrics.counter(
+    "slack_events_dropped_total",
+    "Slack events that were never handled",
+    ("reason",),
+)
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def channel_of(event_data: Dict[str, Any]) -> str:
+    """The channel an event belongs to, which decides its worker."""
+    event = event_data.get("event", {})
+    return event.get("channel") or event_data.get("team_id") or ""
+
+
+class SlackEventQueue:
+    """Fixed set of workers with per-channel ordering and a bounded backlog."""
+
+    def __init__(self, handler: EventHandler, workers: int = 4, max_backlog: int = 256):
+        self.handler = handler
+        self.max_backlog = max_backlog
+        self.backlog = 0
+        self.busy = 0
+        self.accepting = False
+        self._queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(max(workers, 1))]
+        self._workers: List[asyncio.Task] = []
+        # Moving average of handling time, for Retry-After estimates
+        self._avg_duration = 5.0
+
+    def start(self) -> None:
+        """Start the workers (inside the running event loop)."""
+        self.accepting = True
+        self._workers = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+
+    def retry_after(self) -> int:
+        """Seconds Slack should wait before redelivering a rejected event."""
+        estimate = self._avg_duration * (self.backlog / len(self._queues) + 1)
+        return max(1, min(60, math.ceil(estimate)))
+
+    def submit(self, event_data: Dict[str, Any]) -> None:
+        """Queue an event for its channel's worker; raises QueueFull when the backlog is full."""
+        if not self.accepting:
+            dropped_events.inc(reason="shutting_down")
+            raise QueueFull("Shutting down", self.retry_after())
+        if self.backlog >= self.max_backlog:
+            dropped_events.inc(reason="backlog_full")
+            raise QueueFull("Too many Slack events are waiting", self.retry_after())
+        shard = zlib.crc32(channel_of(event_data).encode()) % len(self._queues)
+        self._queues[shard].put_nowait((event_data, time.monotonic()))
+        self.backlog += 1
+        backlog_size.set(self.backlog)
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            event_data, queued_at = await queue.get()
+            self.backlog -= 1
+            backlog_size.set(self.backlog)
+            started = time.monotonic()
+            queue_wait.observe(started - queued_at)
+            self.busy += 1
+            busy_workers.set(self.busy)
+            try:
+                await self.handler(event_data)
+            except Exception as e:
+                print(f"Error handling Slack event {event_data.get('event_id')}: {e}")
+            finally:
+                self.busy -= 1
+                busy_workers.set(self.busy)
+                self._avg_duration = 0.9 * self._avg_duration + 0.1 * (time.monotonic() - started)
+                queue.task_done()
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """Stop accepting events, finish the backlog (up to `timeout`) and stop the workers.
+
+        Returns the number of events that were abandoned, queued or in progress.
+        """
+        self.accepting = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        abandoned = self.backlog + self.busy
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if abandoned:
+            dropped_events.inc(abandoned, reason="shutdown")
+            print(f"Abandoned {abandoned} queued Slack events at shutdown")
+        self.backlog = 0
+        backlog_size.set(0)
+        return abandoned
+
+    def stats(self) -> Dict[str, Any]:
+        """Backlog per worker, for the health endpoint."""
+        return {
+            "backlog": self.backlog,
+            "busy_workers": self.busy,
+            "per_worker": [queue.qsize() for queue in self._queues],
+        }
@@ -0,0 +1,151 @@
+"""
+Wire formats for streamed chat responses.
+Clients pick a format with the Accept header:
+
+- text/plain (default): newline-delimited JSON, {"content": ...} per frame
+- text/event-stream: Server-Sent Events with raw text data lines, which
+  proxies and browsers know not to buffer
+- application/x-dash-stream: compact length-prefixed frames, no JSON at all
+
+Compact frames are `<type><length>:<payload>`, where the length is the
+payload size in UTF-8 bytes and the type is `c` (content), `e` (error) or
+`d` (done, empty payload). For example: `c5:Hello` `c7: world.` `d0:`
+
+The WebSocket endpoint multiplexes streams, so its frames are JSON
+messages tagged with the stream id (see MultiplexFormat).
+"""
+import re
+from typing import Any, Dict
+
+import orjson
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode `obj` as compact UTF-8 JSON."""
+    return orjson.dumps(obj)
+
+
+class StreamFormat:
+    """Encodes content, completion and error frames as bytes."""
+    name = ""
+    media_type = ""
+
+    def content(self, text: str) -> bytes:
+        raise NotImplementedError
+
+    def complete(self) -> bytes:
+        raise NotImplementedError
+
+    def error(self, message: str) -> bytes:
+        raise NotImplementedError
+
+
+class NDJSONFormat(StreamFormat):
+    """One JSON object per line (the original web client format)."""
+    name = "ndjson"
+    media_type = "text/plain"
+
+    def content(self, text: str) -> bytes:
+        return dumps({"content": text}) + b"\n"
+
+    def complete(self) -> bytes:
+        return b'{"complete":true}\n'
+
+    def error(self, message: str) -> bytes:
+        return dumps({"error": message}) + b"\n"
+
+
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+class SSEFormat(StreamFormat):
+    """Server-Sent Events; content is sent as plain `data:` lines."""
+    name = "sse"
+    media_type = "text/event-stream"
+
+    @staticmethod
+    def _event(data: str, event: str = "") -> bytes:
+        # Multi-line data becomes one `data:` line per line; clients rejoin them with "\n"
+        lines = "".join(f"data: {line}\n" for line in LINE_BREAK.split(data))
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}{lines}\n".encode()
+
+    def content(self, text: str) -> bytes:
+        return self._event(text)
+
+    def complete(self) -> bytes:
+        return b"event: complete\ndata: \n\n"
+
+    def error(self, message: str) -> bytes:
+        return self._event(message, "error")
+
+
+class CompactFormat(StreamFormat):
+    """Length-prefixed text frames with one-letter control types."""
+    name = "compact"
+    media_type = "application/x-dash-stream"
+
+    @staticmethod
+    def _frame(kind: bytes, payload: str) -> bytes:
+        data = payload.encode()
+        return b"%s%d:%s" % (kind, len(data), data)
+
+    def content(self, text: str) -> bytes:
+        return self._frame(b"c", text)
+
+    def complete(self) -> bytes:
+        return b"d0:"
+
+    def error(self, message: str) -> bytes:
+        return self._frame(b"e", message)
+
+
+class MultiplexFormat(StreamFormat):
+    """JSON messages tagged with a stream id, for streams sharing a WebSocket."""
+    name = "websocket"
+    media_type = "application/json"
+
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
+
+    def content(self, text: str) -> bytes:
+        return dumps({"type": "content", "id": self.stream_id, "content": text})
+
+    def complete(self) -> bytes:
+        return dumps({"type": "complete", "id": self.stream_id})
+
+    def error(self, message: str) -> bytes:
+        return dumps({"type": "error", "id": self.stream_id, "error": message})
+
+
+NDJSON = NDJSONFormat()
+SSE = SSEFormat()
+COMPACT = CompactFormat()
+
+FORMATS_BY_MEDIA_TYPE: Dict[str, StreamFormat] = {
+    "text/event-stream": SSE,
+    "application/x-dash-stream": COMPACT,
+    "application/x-ndjson": NDJSON,
+    "text/plain": NDJSON,
+}
+
+
+def negotiate(accept: str) -> StreamFormat:
+    """Pick the stream format for an Accept header (NDJSON when nothing matches)."""
+    choices = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, _, params = item.partition(";")
+        stream_format = FORMATS_BY_MEDIA_TYPE.get(media_type.strip().lower())
+        if stream_format is None:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            choices.append((-quality, position, stream_format))
+    return min(choices, key=lambda choice: choice[:2])[2] if choices else NDJSON
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control and fair queueing.
+"""
+import asyncio
+
+from admission import AdmissionController, QueueFull
+
+
+def test_waiters_are_served_round_robin_per_key():
+    """A heavy user's backlog does not delay another user's single request."""
+    async def run():
+        controller = AdmissionController(max_active=1, max_queue=10)
+        holder = controller.reserve("heavy")
+        assert holder.granted
+
+        order = []
+
+        async def request(key, name):
+            slot = controller.reserve(key)
+            await slot.wait()
+            order.append(name)
+            slot.release()
+
+        tasks = [asyncio.create_task(request("heavy", f"heavy{i}")) for i in range(3)]
+        tasks.append(asyncio.create_task(request("light", "light0")))
+        await asyncio.sleep(0)
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order, controller.active, controller.queued
+
+    order, active, queued = asyncio.run(run())
+    assert order == ["heavy0", "light0", "heavy1", "heavy2"]
+    assert (active, queued) == (0, 0)
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def run():
+        controller = AdmissionController(max_active=1, max_queue=2, max_queue_per_key=1)
+        controller.reserve("a")
+        controller.reserve("a")
+        try:
+            controller.reserve("a")
+        except QueueFull as e:
+            per_key = e.retry_after
+        controller.reserve("b")
+        try:
+            controller.reserve("c")
+        except QueueFull as e:
+            total = e.retry_after
+        return per_key, total
+
+    per_key, total = asyncio.run(run())
+    assert 1 <= per_key <= 60 and 1 <= total <= 60
+
+
+def test_timed_out_waiter_leaves_the_queue():
+    async def run():
+        controller = AdmissionController(max_active=1)
+        holder = controller.reserve("a")
+        slot = controller.reserve("b")
+        try:
+            await slot.wait(timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+        queued = controller.queued
+        slot.release()
+        holder.release()
+        return queued, controller.active
+
+    assert asyncio.run(run()) == (0, 0)
+
+
+if __name__ == "__main__":
+    for test in [
+        test_waiters_are_served_round_robin_per_key,
+        test_full_queue_rejects_with_retry_after,
+        test_timed_out_waiter_leaves_the_queue,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
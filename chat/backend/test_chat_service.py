@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared chat service.
+Uses an in-process fake agent transport so no DigitalOcean endpoint is needed.
+"""
+import asyncio
+import time
+
+from openai import AsyncOpenAI
+
+import chat_service
+from chat_service import (
+    AgentError,
+    CircuitBreaker,
+    FlushPolicy,
+    HedgePolicy,
+    HistoryCompactor,
+    ResponseCache,
+    RetryPolicy,
+    coalesce_chunks,
+    count_message_tokens,
+    get_chat_response,
+    stream_chat_response,
+)
+from fake_agent import make_fake_agent_client
+
+
+async def _collect(client: AsyncOpenAI, message: str) -> str:
+    parts = []
+    async for content in stream_chat_response(client, message, []):
+        parts.append(content)
+    return "".join(parts)
+
+
+def test_stream_chat_response():
+    """Streaming returns every delta from the agent in order."""
+    client = make_fake_agent_client(["Revenue ", "was ", "$1M."], delay=0)
+    assert asyncio.run(_collect(client, "revenue?")) == "Revenue was $1M."
+
+
+def test_get_chat_response():
+    """Non-streaming returns the complete agent message."""
+    client = make_fake_agent_client(["Hello", " there"], delay=0)
+    assert asyncio.run(get_chat_response(client, "hi", [])) == "Hello there"
+
+
+def test_concurrent_streams_do_not_serialize():
+    """Load test: many in-flight streams on one event loop overlap instead of queueing."""
+    tokens = ["tok "] * 10
+    delay = 0.02
+    concurrency = 200
+    client = make_fake_agent_client(tokens, delay=delay)
+
+    async def run():
+        # One stream alone sets the baseline duration
+        start = time.perf_counter()
+        await _collect(client, "warmup")
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_collect(client, f"q{i}") for i in range(concurrency)))
+        return single, time.perf_counter() - start, results
+
+    single, elapsed, results = asyncio.run(run())
+
+    assert all(result == "".join(tokens) for result in results)
+    # Serialized streams would take concurrency * single; overlapping ones stay close to single
+    assert elapsed < single * 10, f"{concurrency} streams took {elapsed:.2f}s (single: {single:.2f}s)"
+
+
+def test_concurrent_non_streaming_requests_do_not_serialize():
+    """Slack's non-streaming path must not hold the event loop while waiting on the agent."""
+    client = make_fake_agent_client(["answer"], delay=0.2)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(get_chat_response(client, f"q{i}", []) for i in range(50)))
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 2.0
+
+
+async def _deltas(tokens: list[str], delay: float = 0):
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield token
+
+
+async def _frames(tokens: list[str], policy: FlushPolicy, delay: float = 0) -> list[str]:
+    return [frame async for frame in coalesce_chunks(_deltas(tokens, delay), policy)]
+
+
+def test_coalesce_flushes_first_delta_alone():
+    """First token goes out on its own; the rest are batched."""
+    frames = asyncio.run(_frames(["a", "b", "c", "d"], FlushPolicy(max_bytes=1000, flush_on_sentence=False)))
+    assert frames == ["a", "bcd"]
+
+
+def test_coalesce_flushes_on_bytes_and_sentences():
+    """Frames close at the byte limit or at the end of a sentence, whichever comes first."""
+    policy = FlushPolicy(max_bytes=4, max_delay_ms=1000)
+    frames = asyncio.run(_frames(["Hi", "ab", "cd", "ef", "Done.", " Next"], policy))
+    assert frames == ["Hi", "abcd", "efDone.", " Next"]
+
+
+def test_coalesce_flushes_on_delay():
+    """A slow upstream never holds buffered text longer than max_delay_ms."""
+    policy = FlushPolicy(max_bytes=1000, max_delay_ms=10, flush_on_sentence=False)
+    frames = asyncio.run(_frames(["a", "b", "c"], policy, delay=0.05))
+    assert frames == ["a", "b", "c"]
+
+
+def _history(turns: int) -> list[dict]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}. " + "detail " * 40})
+        history.append({"role": "assistant", "content": f"Answer {i}. " + "figure " * 40})
+    return history
+
+
+def test_compaction_leaves_short_history_alone():
+    history = _history(2)
+    compacted, stats = HistoryCompactor(max_tokens=10_000).compact(history)
+    assert compacted is history
+    assert stats.tokens_saved == 0
+
+
+def test_compaction_keeps_recent_turns_within_budget():
+    """Recent turns survive verbatim; older ones become a summary inside the budget."""
+    history = _history(20)
+    compactor = HistoryCompactor(max_tokens=1000, summary_tokens=200)
+    compacted, stats = compactor.compact(history)
+
+    assert compacted[0]["role"] == "system"
+    assert compacted[0]["content"].startswith(HistoryCompactor.SUMMARY_PREFIX)
+    assert compacted[-1] == history[-1]
+    assert compacted[1:] == history[-(len(compacted) - 1):]
+    assert sum(count_message_tokens(m) for m in compacted) <= 1000
+    assert stats.tokens_after < stats.tokens_before
+    assert stats.turns_summarized == len(history) - (len(compacted) - 1)
+
+
+def test_compaction_summary_rolls_forward():
+    """The next turn extends the cached summary instead of rebuilding it."""
+    compactor = HistoryCompactor(max_tokens=1000, summary_tokens=2000)
+    history = _history(20)
+    first, _ = compactor.compact(history)
+    second, _ = compactor.compact(history + _history(1))
+    assert second[0]["content"].startswith(first[0]["content"])
+    assert compactor._summaries.hits == 1
+
+
+
+def test_response_cache_replays_repeated_questions():
+    """Repeats are served from cache on both paths; bypass goes upstream."""
+    client = make_fake_agent_client(["Revenue ", "was ", "$1M. ", "Up 10%."], delay=0)
+    chat_service.configure(cache=ResponseCache())
+    try:
+        first = asyncio.run(_collect(client, "What was revenue in 2023?"))
+        replayed = asyncio.run(_collect(client, "what was revenue  in 2023"))
+        complete = asyncio.run(get_chat_response(client, "What was revenue in 2023?", []))
+        assert first == replayed == complete == "Revenue was $1M. Up 10%."
+        assert len(client.fake_requests) == 1
+
+        asyncio.run(get_chat_response(client, "What was revenue in 2023?", [], use_cache=False))
+        assert len(client.fake_requests) == 2
+    finally:
+        chat_service.configure(cache=None)
+
+
+
+def test_answers_cut_short_by_an_error_are_not_cached():
+    client = make_fake_agent_client(["Revenue ", "was ", "$1M. ", "Up 10%."], delay=0, drop_after=2)
+    chat_service.configure(cache=ResponseCache())
+    try:
+        async def frames():
+            return [frame async for frame in stream_chat_response(client, "What was revenue?", [])]
+
+        answers = [asyncio.run(get_chat_response(client, "What was revenue?", [])) for _ in range(2)]
+        streamed = asyncio.run(frames())
+        assert all(isinstance(answer, AgentError) for answer in answers)
+        assert answers[0].startswith("Revenue was Error: ")
+        assert "connection reset" in answers[0].detail
+        # The error arrives as a frame of its own after the partial answer
+        assert "".join(streamed[:-1]) == "Revenue was " and isinstance(streamed[-1], AgentError)
+        assert len(client.fake_requests) == 3
+    finally:
+        chat_service.configure(cache=None)
+
+
+def test_single_flight_shares_one_upstream_stream():
+    """Identical concurrent requests from web and Slack make one upstream call."""
+    tokens = ["Q3 ", "revenue ", "grew ", "12%."]
+    client = make_fake_agent_client(tokens, delay=0.02)
+
+    async def late_stream():
+        await asyncio.sleep(0.05)  # Join mid-stream; must still see the start
+        return await _collect(client, "How did Q3 go?")
+
+    async def run():
+        return await asyncio.gather(
+            _collect(client, "How did Q3 go?"),
+            get_chat_response(client, "how did q3 go", []),
+            late_stream(),
+        )
+
+    results = asyncio.run(run())
+    assert results == ["".join(tokens)] * 3
+    assert len(client.fake_requests) == 1
+    assert chat_service.single_flight.in_flight() == 0
+
+
+def test_single_flight_cancels_abandoned_upstream():
+    """When the only subscriber leaves, the shared upstream stream stops."""
+    client = make_fake_agent_client(["tok "] * 50, delay=0.01)
+
+    async def run():
+        stream = stream_chat_response(client, "abandon me", [])
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return chat_service.single_flight.in_flight()
+
+    assert asyncio.run(run()) == 0
+
+
+def test_closing_after_a_timer_flush_cancels_the_pending_read():
+    """Closing the stream while the coalescer awaits the next delta does not fail."""
+    client = make_fake_agent_client(["First", " second", " third"], delay=0.1)
+    policy = FlushPolicy(max_bytes=1000, max_delay_ms=10, flush_on_sentence=False)
+
+    async def run():
+        stream = stream_chat_response(client, "close me mid-read", [], flush_policy=policy, use_cache=False)
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return frames, chat_service.single_flight.in_flight()
+
+    assert asyncio.run(run()) == (["First", " second"], 0)
+
+
+def _with_resilience(retry: RetryPolicy, breaker: CircuitBreaker, hedge: HedgePolicy = HedgePolicy()):
+    """Install resilience settings; returns a function restoring the previous ones."""
+    previous = (chat_service.retry_policy, chat_service.circuit_breaker, chat_service.hedge_policy)
+    chat_service.configure(retry=retry, breaker=breaker, hedge=hedge)
+    return lambda: chat_service.configure(retry=previous[0], breaker=previous[1], hedge=previous[2])
+
+
+def test_failures_before_first_token_are_retried():
+    client = make_fake_agent_client(["Recovered."], delay=0, failures=2)
+    restore = _with_resilience(RetryPolicy(max_attempts=3, base_delay=0.001), CircuitBreaker())
+    try:
+        retries_before = chat_service.agent_retries.value()
+        assert asyncio.run(_collect(client, "retry me")) == "Recovered."
+        assert len(client.fake_requests) == 3
+        assert chat_service.agent_retries.value() == retries_before + 2
+    finally:
+        restore()
+
+
+def test_open_circuit_fails_fast():
+    client = make_fake_agent_client(["never"], delay=0, failures=100)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    restore = _with_resilience(RetryPolicy(max_attempts=1), breaker)
+    try:
+        async def run():
+            return [await get_chat_response(client, f"failing {i}", []) for i in range(4)]
+
+        answers = asyncio.run(run())
+        assert breaker.state == CircuitBreaker.OPEN
+        # Only the requests before the circuit opened reached the agent
+        assert len(client.fake_requests) == 2
+        assert all(answer.startswith("Error: ") for answer in answers)
+        assert "unavailable" in answers[-1]
+    finally:
+        restore()
+
+
+def test_circuit_closes_after_successful_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 10
+    assert breaker.allow()  # The single half-open probe
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_slow_first_token_is_hedged():
+    # The first request stalls; the hedge sent at the TTFT threshold answers first
+    client = make_fake_agent_client(["Fast ", "answer."], delay=0, first_token_delays=[5.0])
+    hedge = HedgePolicy(enabled=True, min_samples=1, min_delay=0.05)
+    restore = _with_resilience(RetryPolicy(), CircuitBreaker(), hedge)
+    try:
+        chat_service.ttft_tracker.observe(0.01)
+        won_before = chat_service.hedged_requests.value(outcome="won")
+        start = time.perf_counter()
+        assert asyncio.run(_collect(client, "hedge me")) == "Fast answer."
+        assert time.perf_counter() - start < 1
+        assert len(client.fake_requests) == 2
+        assert chat_service.hedged_requests.value(outcome="won") == won_before + 1
+    finally:
+        restore()
+
+
+if __name__ == "__main__":
+    for test in [
+        test_stream_chat_response,
+        test_get_chat_response,
+        test_concurrent_streams_do_not_serialize,
+        test_concurrent_non_streaming_requests_do_not_serialize,
+        test_coalesce_flushes_first_delta_alone,
+        test_coalesce_flushes_on_bytes_and_sentences,
+        test_coalesce_flushes_on_delay,
+        test_compaction_leaves_short_history_alone,
+        test_compaction_keeps_recent_turns_within_budget,
+        test_compaction_summary_rolls_forward,
+        test_response_cache_replays_repeated_questions,
+        test_answers_cut_short_by_an_error_are_not_cached,
+        test_single_flight_shares_one_upstream_stream,
+        test_single_flight_cancels_abandoned_upstream,
+        test_closing_after_a_timer_flush_cancels_the_pending_read,
+        test_failures_before_first_token_are_retried,
+        test_open_circuit_fails_fast,
+        test_circuit_closes_after_successful_probe,
+        test_slow_first_token_is_hedged,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
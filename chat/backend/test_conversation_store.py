@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the server-side conversation store.
+"""
+import asyncio
+import os
+import tempfile
+
+from conversation_store import ConversationStore
+
+
+def _turn(question: str, answer: str) -> list[dict]:
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+def test_append_and_reload():
+    """Turns are returned in order, from the LRU and after a restart."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "conversations.db")
+
+        async def run():
+            store = ConversationStore(path)
+            assert await store.get_history("c1") == []
+            await store.append("c1", _turn("q1", "a1"))
+            await store.append("c1", _turn("q2", "a2"))
+            cached = await store.get_history("c1")
+            store.close()
+
+            reopened = ConversationStore(path)
+            persisted = await reopened.get_history("c1")
+            reopened.close()
+            return cached, persisted
+
+        cached, persisted = asyncio.run(run())
+        assert cached == persisted == _turn("q1", "a1") + _turn("q2", "a2")
+
+
+def test_idle_conversations_expire():
+    """Conversations past the TTL are evicted from memory and disk."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "conversations.db")
+
+        async def run():
+            store = ConversationStore(path, ttl_seconds=0)
+            await store.append("c1", _turn("q", "a"))
+            await asyncio.sleep(0.01)
+            purged = await store.purge_expired()
+            history = await store.get_history("c1")
+            store.close()
+            return purged, history
+
+        assert asyncio.run(run()) == (1, [])
+
+
+def test_expired_conversation_starts_over():
+    """A turn added after the TTL (before the purge) does not bring back the old turns."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "conversations.db")
+
+        async def run():
+            store = ConversationStore(path, ttl_seconds=0.05)
+            conversation_id = await store.create()
+            assert await store.exists(conversation_id)
+            await store.append(conversation_id, _turn("q1", "a1"))
+            await asyncio.sleep(0.1)
+            assert not await store.exists(conversation_id)
+            await store.append(conversation_id, _turn("q2", "a2"))
+            history = await store.get_history(conversation_id)
+            store.close()
+            return history
+
+        assert asyncio.run(run()) == _turn("q2", "a2")
+
+
+if __name__ == "__main__":
+    for test in [test_append_and_reload, test_idle_conversations_expire, test_expired_conversation_starts_over]:
+        test()
+        print(f"✓ {test.__name__}")
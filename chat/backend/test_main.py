@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+End-to-end tests for the FastAPI backend.
+Runs the app and a local fake agent server on ephemeral ports.
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import uvicorn
+from openai import AsyncOpenAI
+from starlette.requests import Request
+from websockets.sync.client import connect
+
+os.environ.setdefault('DO_AGENT_ENDPOINT', 'test')
+os.environ.setdefault('DO_AGENT_ACCESS_KEY', 'test')
+os.environ.setdefault('CONVERSATION_DB_PATH', os.path.join(tempfile.mkdtemp(), 'conversations.db'))
+
+import main
+from fake_agent import create_app
+
+
+@contextmanager
+def serve(app):
+    """Run an ASGI app with uvicorn in a background thread; yields its base URL."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    host, port = server.servers[0].sockets[0].getsockname()[:2]
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+@contextmanager
+def backend_with_fake_agent(**agent_options):
+    """Run the backend against a local fake agent; yields (backend URL, agent stats)."""
+    agent = create_app(**agent_options)
+    with serve(agent) as agent_url:
+        main.agent_clients._clients["default"] = AsyncOpenAI(base_url=f"{agent_url}/api/v1", api_key="test")
+        try:
+            with serve(main.app) as backend_url:
+                yield backend_url, agent.state.stats
+        finally:
+            main.agent_clients._clients.clear()
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def count_conversations() -> int:
+    return main.conversation_store._db().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+
+def test_client_disconnect_cancels_upstream_stream():
+    """Closing the browser stream stops the agent stream long before it would finish."""
+    cancelled_before = main.stream_cancellations.value()
+    tokens = [f"token{i} " for i in range(200)]
+
+    with backend_with_fake_agent(tokens=tokens, token_delay=0.05) as (url, stats):
+        with httpx.Client(timeout=10) as client:
+            request = {"message": "A long answer please"}
+            with client.stream("POST", f"{url}/api/chat/stream", json=request,
+                               headers={"Cache-Control": "no-cache"}) as response:
+                first_line = next(response.iter_lines())
+                assert "token0" in first_line
+
+        # 200 tokens at 50 ms would take 10 s; cancellation must reach the agent quickly
+        assert wait_for(lambda: stats.aborted_streams == 1, timeout=3)
+        assert stats.completed_streams == 0
+        assert wait_for(lambda: main.stream_cancellations.value() == cancelled_before + 1)
+        assert main.active_streams.value() == 0
+
+
+def test_completed_stream_is_not_cancelled():
+    with backend_with_fake_agent(tokens=["Done", "."], token_delay=0.01) as (url, stats):
+        response = httpx.post(f"{url}/api/chat/stream", json={"message": "Quick one"},
+                              headers={"Cache-Control": "no-cache"}, timeout=10)
+        assert json.loads(response.text.splitlines()[-1]) == {"complete": True}
+        assert wait_for(lambda: stats.completed_streams == 1)
+        assert stats.aborted_streams == 0
+
+
+def test_full_admission_queue_returns_429():
+    with backend_with_fake_agent(tokens=["slow "] * 40, token_delay=0.05) as (url, stats):
+        # The controller is built at startup; shrink it to one slot and no queue
+        main.admission.max_active, main.admission.max_queue = 1, 0
+        with httpx.Client(timeout=10) as client:
+            request = {"message": "Hold the only slot"}
+            with client.stream("POST", f"{url}/api/chat/stream", json=request,
+                               headers={"Cache-Control": "no-cache"}) as response:
+                lines = response.iter_lines()  # Keep a reference so the stream stays open
+                next(lines)
+                conversations = count_conversations()
+                rejected = client.post(f"{url}/api/chat/stream", json={"message": "Me too", "conversation_id": "new"})
+                assert rejected.status_code == 429
+                assert int(rejected.headers["Retry-After"]) >= 1
+                # No conversation is started for a request that was turned away
+                assert count_conversations() == conversations
+        assert wait_for(lambda: main.admission.active == 0)
+
+
+def test_client_key_only_trusts_headers_from_proxies():
+    def key(peer: str, **headers) -> str:
+        scope = {"type": "http", "client": (peer, 40000),
+                 "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]}
+        return main.client_key(Request(scope))
+
+    trusted = main.config.ADMISSION_TRUSTED_PROXIES
+    main.config.ADMISSION_TRUSTED_PROXIES = [ipaddress.ip_network("10.0.0.0/8")]
+    try:
+        # Direct clients cannot choose their own queue
+        assert key("203.0.113.5", x_user_id="someone-else") == "ip:203.0.113.5"
+        assert key("203.0.113.5", x_forwarded_for="198.51.100.1") == "ip:203.0.113.5"
+        # Through the proxy: the user, else the first untrusted address from the right
+        assert key("10.0.0.2", x_user_id="alice") == "user:alice"
+        assert key("10.0.0.2", x_forwarded_for="1.2.3.4, 198.51.100.1, 10.0.0.3") == "ip:198.51.100.1"
+        assert key("10.0.0.2") == "ip:10.0.0.2"
+    finally:
+        main.config.ADMISSION_TRUSTED_PROXIES = trusted
+
+
+def test_stream_format_is_negotiated_by_accept_header():
+    tokens = ["Line one.\n", "Caf\u00e9 ", "ol\u00e9."]
+    answer = "".join(tokens)
+    with backend_with_fake_agent(tokens=tokens, token_delay=0.01) as (url, stats):
+        def post(path: str, accept: str) -> httpx.Response:
+            return httpx.post(f"{url}{path}", json={"message": "Formats"}, timeout=10,
+                              headers={"Accept": accept, "Cache-Control": "no-cache"})
+
+        compact = post("/api/chat/stream", "application/x-dash-stream")
+        assert compact.headers["content-type"].startswith("application/x-dash-stream")
+        frames, body = [], compact.content
+        while body:
+            kind, length, rest = re.match(rb"([ced])(\d+):(.*)", body, re.S).groups()
+            frames.append((kind, rest[:int(length)].decode()))
+            body = rest[int(length):]
+        assert frames[-1] == (b"d", "")
+        assert "".join(text for kind, text in frames if kind == b"c") == answer
+
+        for sse in (post("/api/chat/stream", "text/event-stream"), post("/api/chat/sse", "*/*")):
+            assert sse.headers["content-type"].startswith("text/event-stream")
+            events = sse.text.split("\n\n")
+            assert events[-2:] == ["event: complete\ndata: ", ""]
+            content = ["\n".join(line[len("data: "):] for line in event.split("\n")) for event in events[:-2]]
+            assert "".join(content) == answer
+
+
+def test_agent_failures_are_sent_as_error_frames():
+    """An upstream failure ends the stream with the format's error frame instead of content and complete."""
+    with backend_with_fake_agent(error_rate=1.0, error_status=503) as (url, stats):
+        # Skip the OpenAI client's own retries with backoff
+        main.agent_clients._clients["default"] = main.agent_clients._clients["default"].with_options(max_retries=0)
+        def post(accept: str) -> str:
+            return httpx.post(f"{url}/api/chat/stream", json={"message": "Fail"}, timeout=10,
+                              headers={"Accept": accept, "Cache-Control": "no-cache"}).text
+
+        ndjson = [json.loads(line) for line in post("application/x-ndjson").splitlines()]
+        assert list(ndjson[-1]) == ["error"] and not ndjson[-1]["error"].startswith("Error: ")
+        assert not any("content" in frame or "complete" in frame for frame in ndjson)
+
+        sse = post("text/event-stream")
+        assert sse.startswith("event: error\ndata: ") and "event: complete" not in sse
+
+        compact = post("application/x-dash-stream")
+        assert compact.startswith("e") and "d0:" not in compact
+
+
+def test_server_issues_conversation_ids():
+    """Conversations start with "new"; IDs the server did not issue are rejected."""
+    with backend_with_fake_agent(tokens=["Answer."], token_delay=0.01) as (url, stats):
+        def post(conversation_id: str, history: list = []) -> httpx.Response:
+            request = {"message": "Hi", "conversation_id": conversation_id, "history": history}
+            return httpx.post(f"{url}/api/chat/stream", json=request, headers={"Cache-Control": "no-cache"}, timeout=10)
+
+        started = post("new")
+        conversation_id = started.headers["X-Conversation-ID"]
+        assert started.status_code == 200 and len(conversation_id) == 32
+        assert post(conversation_id).headers["X-Conversation-ID"] == conversation_id
+        assert wait_for(lambda: len(asyncio.run(main.conversation_store.get_history(conversation_id))) == 4)
+
+        assert post("1").status_code == 422
+        assert post("a" * 32).status_code == 404
+        assert httpx.delete(f"{url}/api/conversations/{'a' * 32}").status_code == 404
+        assert httpx.delete(f"{url}/api/conversations/{conversation_id}").status_code == 200
+        assert post(conversation_id).status_code == 404
+
+        # A new conversation starts from the history the client sends
+        seeded = post("new", [{"role": "user", "content": "Earlier"}, {"role": "assistant", "content": "Before."}])
+        history = asyncio.run(main.conversation_store.get_history(seeded.headers["X-Conversation-ID"]))
+        assert [m["content"] for m in history] == ["Earlier", "Before.", "Hi", "Answer."]
+
+
+def test_websocket_multiplexes_streams_with_credit_and_cancel():
+    tokens = [f"Sentence {i}. " for i in range(40)]
+    with backend_with_fake_agent(tokens=tokens, token_delay=0.02) as (url, stats):
+        main.config.WS_INITIAL_CREDIT = 2  # Config is re-read at startup
+        with connect(url.replace("http", "ws") + "/api/chat/ws") as ws:
+            for stream_id in ("a", "b"):
+                ws.send(json.dumps({"type": "start", "id": stream_id, "message": f"Question {stream_id}",
+                                    "no_cache": True}))
+            received = {"a": [], "b": []}
+            while len(received["a"]) + len(received["b"]) < 4:
+                frame = json.loads(ws.recv(timeout=5))
+                received[frame["id"]].append(frame)
+
+            # Both streams are out of credit: nothing more arrives until the client asks
+            try:
+                ws.recv(timeout=0.3)
+                assert False, "Frame sent without credit"
+            except TimeoutError:
+                pass
+
+            ws.send(json.dumps({"type": "cancel", "id": "b"}))
+            ws.send(json.dumps({"type": "credit", "id": "a", "frames": 1000}))
+            while not received["a"] or received["a"][-1]["type"] != "complete":
+                frame = json.loads(ws.recv(timeout=5))
+                received[frame["id"]].append(frame)
+
+            answer = "".join(frame.get("content", "") for frame in received["a"])
+            assert answer == "".join(tokens)
+            assert {"type": "cancelled", "id": "b"} in received["b"]
+        assert wait_for(lambda: stats.aborted_streams == 1 and stats.completed_streams == 1)
+        assert wait_for(lambda: main.admission.active == 0)
+
+
+def test_batch_deduplicates_and_streams_timings():
+    with backend_with_fake_agent(tokens=["Answer."], token_delay=0.01) as (url, stats):
+        questions = ["Revenue in 2023?", "Headcount?", "revenue in  2023?"]
+        response = httpx.post(f"{url}/api/chat/batch", json={"questions": questions},
+                              headers={"Cache-Control": "no-cache"}, timeout=10)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        items = sorted(lines[:-1], key=lambda item: item["index"])
+        assert [item["answer"] for item in items] == ["Answer."] * 3
+        assert items[2]["duplicate_of"] == 0
+        assert all(item["seconds"] >= 0 for item in items)
+        assert lines[-1]["complete"] and lines[-1]["unique"] == 2 and lines[-1]["seconds"] > 0
+        assert stats.requests == 2
+
+
+if __name__ == "__main__":
+    for test in [
+        test_client_disconnect_cancels_upstream_stream,
+        test_completed_stream_is_not_cancelled,
+        test_full_admission_queue_returns_429,
+        test_client_key_only_trusts_headers_from_proxies,
+        test_stream_format_is_negotiated_by_accept_header,
+        test_agent_failures_are_sent_as_error_frames,
+        test_server_issues_conversation_ids,
+        test_websocket_multiplexes_streams_with_credit_and_cancel,
+        test_batch_deduplicates_and_streams_timings,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
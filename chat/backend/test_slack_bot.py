@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Tests for SlackBot against a local fake Slack API.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from unittest.mock import Mock, patch
+
+import httpx
+
+import main
+from fake_agent import make_fake_agent_client
+from fake_slack import BOT_ID, BOT_USER_ID, create_app
+from load_test import signed_slack_event
+from slack_bot import BUSY_TEXT, PLACEHOLDER_TEXT, SlackBot, slack_event_errors
+from slack_delivery import SlackDelivery
+from slack_identity import token_hash
+from test_main import backend_with_fake_agent, serve, wait_for
+
+SIGNING_SECRET = "test-signing-secret"
+
+
+def make_bot(slack_url: str, openai_client=None, **options) -> SlackBot:
+    bot = SlackBot("xoxb-test", openai_client or Mock(), **options)
+    bot.slack_client.base_url = f"{slack_url}/api/"
+    return bot
+
+
+def test_slack_calls_share_a_pool_without_blocking_the_loop():
+    history = [{"user": "UALICE", "text": f"Question {i}", "ts": f"{i}.0"} for i in range(5)]
+    slack = create_app(messages=history, latency=0.2)
+    with serve(slack) as url:
+        async def run():
+            bot = make_bot(url, max_connections=4)
+            # Not what is measured here; see the delivery tests for rate limiting
+            bot.delivery = SlackDelivery(bot._client, limits_per_minute={"conversations.history": 6000})
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticking = asyncio.create_task(ticker())
+            started = time.perf_counter()
+            await bot.initialize()
+            histories = await asyncio.gather(*(bot._get_conversation_history("DALICE") for _ in range(8)))
+            elapsed = time.perf_counter() - started
+            ticking.cancel()
+            await bot.aclose()
+            return bot, histories, elapsed, ticks
+
+        bot, histories, elapsed, ticks = asyncio.run(run())
+
+    assert bot.bot_user_id == BOT_USER_ID
+    assert all(len(history) == 5 and history[0]["content"] == "Question 0" for history in histories)
+    # Nine calls of 200 ms would take 1.8 s one after another; four pooled connections overlap them
+    assert elapsed < 1.0
+    # The event loop kept running other tasks while the calls were in flight
+    assert ticks > elapsed / 0.01 / 2
+    assert len(slack.state.stats.connections) <= 4
+    assert bot.slack_client.session.closed
+
+
+def test_answers_stream_into_a_placeholder_message():
+    tokens = [f"Figure {i} rose. " for i in range(30)]
+    slack = create_app()
+    with serve(slack) as url:
+        async def run():
+            agent = make_fake_agent_client(tokens, delay=0.02)
+            bot = make_bot(url, agent, update_interval=0.1)
+            try:
+                await bot._reply("DALICE", "Streaming please", [])
+            finally:
+                await bot.aclose()
+
+        asyncio.run(run())
+
+    stats = slack.state.stats
+    assert [post["text"] for post in stats.posted] == [PLACEHOLDER_TEXT]
+    # Partial edits arrive while the answer is generated (~0.6 s), then the full answer
+    assert 2 <= len(stats.updates) <= 8
+    assert len(stats.updates[0]["text"]) < len(stats.updates[-1]["text"])
+    assert stats.texts[stats.posted[0]["ts"]] == "".join(tokens).strip()
+
+
+def test_rate_limited_updates_back_off_and_still_deliver_the_answer():
+    tokens = [f"Figure {i} rose. " for i in range(20)]
+    slack = create_app(rate_limits={"chat.update": 1}, retry_after=1)
+    with serve(slack) as url:
+        async def run():
+            agent = make_fake_agent_client(tokens, delay=0.02)
+            bot = make_bot(url, agent, update_interval=0.05)
+            try:
+                await bot._reply("DALICE", "Rate limits", [])
+            finally:
+                await bot.aclose()
+
+        asyncio.run(run())
+
+    stats = slack.state.stats
+    # One partial edit, then Slack says wait: no more partial edits until the final one
+    assert 1 <= stats.rate_limited <= 2
+    assert len(stats.updates) == 2
+    assert stats.texts[stats.posted[0]["ts"]] == "".join(tokens).strip()
+
+
+def test_long_streamed_answers_continue_in_follow_up_messages():
+    tokens = [f"Sentence number {i} is about revenue. " for i in range(120)]
+    slack = create_app()
+    with serve(slack) as url:
+        async def run():
+            agent = make_fake_agent_client(tokens, delay=0.005)
+            bot = make_bot(url, agent, update_interval=0.05)
+            try:
+                return await bot._reply("DALICE", "A long one", [])
+            finally:
+                await bot.aclose()
+
+        posted = asyncio.run(run())
+
+    texts = [slack.state.stats.texts[message["ts"]] for message in posted]
+    assert len(texts) == 2
+    assert all(len(text) <= 3000 for text in texts)
+    assert " ".join(texts).split() == "".join(tokens).split()
+
+
+def test_dm_history_is_served_from_the_cache_after_the_first_message():
+    slack = create_app()
+    with serve(slack) as url:
+        async def run():
+            agent = make_fake_agent_client(["Answer."], delay=0.01)
+            bot = make_bot(url, agent, stream_replies=False)
+            try:
+                for number, text in enumerate(["First question", "Second question"]):
+                    dm = {"type": "message", "channel_type": "im", "channel": "DALICE", "user": "UALICE",
+                          "text": text, "ts": f"{time.time():.6f}"}
+                    slack.state.messages.insert(0, dict(dm))  # Slack stores it before notifying us
+                    await bot.handle_slack_event({"event_id": f"Ev{number}", "event": dm})
+                return agent.fake_requests, bot.history_cache.stats()
+            finally:
+                await bot.aclose()
+
+        requests, cache_stats = asyncio.run(run())
+
+    assert slack.state.stats.calls["conversations.history"] == 1
+    assert (cache_stats["misses"], cache_stats["hits"]) == (1, 1)
+    # The current message is the question, not part of the history
+    assert [m["content"] for m in requests[0]["messages"]] == ["First question"]
+    assert [m["content"] for m in requests[1]["messages"]] == ["First question", "Answer.", "Second question"]
+
+
+def test_edits_and_deletions_of_replies_are_ignored():
+    slack = create_app()
+    with serve(slack) as url:
+        async def run():
+            agent = make_fake_agent_client(["Answer."], delay=0)
+            bot = make_bot(url, agent)
+            errors_before = slack_event_errors.value(event_type="message")
+            try:
+                for number, subtype in enumerate(["message_changed", "message_deleted"]):
+                    event = {"type": "message", "subtype": subtype, "channel_type": "im", "channel": "DALICE",
+                             "message": {"text": "Answer.", "user": BOT_USER_ID}, "ts": f"{number}.5"}
+                    await bot.handle_slack_event({"event_id": f"EvEdit{number}", "event": event})
+                return agent.fake_requests, slack_event_errors.value(event_type="message") - errors_before
+            finally:
+                await bot.aclose()
+
+        requests, errors = asyncio.run(run())
+
+    assert requests == [] and errors == 0
+    assert slack.state.stats.calls == {}
+
+
+def test_dms_with_attachments_are_answered():
+    slack = create_app()
+    with serve(slack) as url:
+        async def run():
+            agent = make_fake_agent_client(["Answer."], delay=0)
+            bot = make_bot(url, agent, stream_replies=False)
+            try:
+                dm = {"type": "message", "subtype": "file_share", "channel_type": "im", "channel": "DALICE",
+                      "user": "UALICE", "text": "What does this report say?", "files": [{"id": "F1"}],
+                      "ts": f"{time.time():.6f}"}
+                await bot.handle_slack_event({"event_id": "EvFile", "event": dm})
+                return agent.fake_requests
+            finally:
+                await bot.aclose()
+
+        requests = asyncio.run(run())
+
+    assert [m["content"] for m in requests[0]["messages"]] == ["What does this report say?"]
+    assert list(slack.state.stats.texts.values()) == ["Answer."]
+
+
+@contextmanager
+def backend_with_slack(messages=None, **agent_options):
+    """Run the backend with Slack enabled against a fake agent and a fake Slack API.
+
+    The bot identity comes from a cache file, as another worker would have
+    left it, so startup does not call the real Slack API. Yields (backend
+    URL, fake Slack stats, fake agent stats).
+    """
+    slack = create_app(messages=messages)
+    identity_file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    with identity_file:
+        json.dump({"user_id": BOT_USER_ID, "bot_id": BOT_ID, "team_id": "TFAKE", "resolved_at": time.time(),
+                   "token_hash": token_hash("xoxb-test")}, identity_file)
+    env = {"SLACK_BOT_TOKEN": "xoxb-test", "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+           "SLACK_IDENTITY_CACHE_PATH": identity_file.name}
+    try:
+        with patch.dict(os.environ, env), serve(slack) as slack_url:
+            with backend_with_fake_agent(**agent_options) as (url, agent_stats):
+                assert wait_for(lambda: main.slack_bot is not None)
+                main.slack_bot.slack_client.base_url = f"{slack_url}/api/"
+                yield url, slack.state.stats, agent_stats
+    finally:
+        os.unlink(identity_file.name)
+
+
+def test_slack_retries_of_a_handled_event_are_suppressed():
+    suppressed_before = main.slack_duplicates_suppressed.value(reason="http_timeout")
+    with backend_with_slack(tokens=["Revenue was up."], token_delay=0.01) as (url, slack_stats, agent_stats):
+        body, headers = signed_slack_event(1, SIGNING_SECRET)
+        first = httpx.post(f"{url}/slack/events", content=body, headers=headers, timeout=10)
+        retry = httpx.post(f"{url}/slack/events", content=body, timeout=10,
+                           headers={**headers, "X-Slack-Retry-Num": "1", "X-Slack-Retry-Reason": "http_timeout"})
+        assert first.json() == {"status": "ok"}
+        assert retry.json() == {"status": "duplicate"}
+
+        assert wait_for(lambda: list(slack_stats.texts.values()) == ["Revenue was up."])
+        assert agent_stats.requests == 1
+        # The identity was known before the event arrived
+        assert main.slack_bot.bot_user_id == BOT_USER_ID
+        assert slack_stats.calls["auth.test"] == 0
+    assert main.slack_duplicates_suppressed.value(reason="http_timeout") == suppressed_before + 1
+
+
+def signed(event: dict) -> tuple[bytes, dict]:
+    """Sign an event_callback carrying `event`, as Slack would."""
+    body = json.dumps({"type": "event_callback", "team_id": "TFAKE", "event_id": f"Ev{time.time_ns()}",
+                       "event": event}).encode()
+    timestamp = str(int(time.time()))
+    signature = "v0=" + hmac.new(SIGNING_SECRET.encode(), f"v0:{timestamp}:{body.decode()}".encode(),
+                                 hashlib.sha256).hexdigest()
+    return body, {"X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": signature}
+
+
+def test_ignored_events_skip_the_queue_and_dropped_questions_get_a_busy_reply():
+    with backend_with_slack(tokens=["slow "] * 40, token_delay=0.05) as (url, slack_stats, agent_stats):
+        echo = {"type": "message", "channel_type": "im", "channel": "DALICE", "user": BOT_USER_ID,
+                "text": "Answer.", "ts": "1.5"}
+        body, headers = signed(echo)
+        assert httpx.post(f"{url}/slack/events", content=body, headers=headers, timeout=10).json() == \
+            {"status": "ignored"}
+
+        # Hold the only agent slot with a web chat, so the Slack question cannot queue
+        main.admission.max_active, main.admission.max_queue = 1, 0
+        with httpx.Client(timeout=10) as client:
+            with client.stream("POST", f"{url}/api/chat/stream", json={"message": "Hold the only slot"},
+                               headers={"Cache-Control": "no-cache"}) as response:
+                lines = response.iter_lines()  # Keep a reference so the stream stays open
+                next(lines)
+                question = {"type": "app_mention", "channel": "CGENERAL", "user": "UALICE",
+                            "text": f"<@{BOT_USER_ID}> revenue?", "ts": "2.5"}
+                body, headers = signed(question)
+                assert client.post(f"{url}/slack/events", content=body, headers=headers).json() == {"status": "ok"}
+                assert wait_for(lambda: BUSY_TEXT in slack_stats.texts.values())
+        assert agent_stats.requests == 1
+
+
+if __name__ == "__main__":
+    for test in [
+        test_slack_calls_share_a_pool_without_blocking_the_loop,
+        test_answers_stream_into_a_placeholder_message,
+        test_rate_limited_updates_back_off_and_still_deliver_the_answer,
+        test_long_streamed_answers_continue_in_follow_up_messages,
+        test_dm_history_is_served_from_the_cache_after_the_first_message,
+        test_edits_and_deletions_of_replies_are_ignored,
+        test_dms_with_attachments_are_answered,
+        test_slack_retries_of_a_handled_event_are_suppressed,
+        test_ignored_events_skip_the_queue_and_dropped_questions_get_a_busy_reply,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for Slack event deduplication.
+"""
+import asyncio
+import os
+import tempfile
+
+from slack_dedup import EventDeduplicator
+
+
+def test_repeated_event_ids_are_claimed_once():
+    async def run():
+        dedup = EventDeduplicator(ttl_seconds=60)
+        first = await dedup.claim("Ev1")
+        retry = await dedup.claim("Ev1")
+        other = await dedup.claim("Ev2")
+        await dedup.release("Ev2")
+        after_release = await dedup.claim("Ev2")
+        return first, retry, other, after_release
+
+    assert asyncio.run(run()) == (True, False, True, True)
+
+
+def test_sqlite_claims_are_shared_between_workers():
+    """Two processes with their own memory cache still agree through the database."""
+    async def run(path):
+        worker_a = EventDeduplicator(path, ttl_seconds=60)
+        worker_b = EventDeduplicator(path, ttl_seconds=60)
+        try:
+            claims = [await worker_a.claim("Ev1"), await worker_b.claim("Ev1"), await worker_b.claim("Ev2")]
+            await worker_b.release("Ev2")
+            claims.append(await worker_a.claim("Ev2"))
+            return claims
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assert asyncio.run(run(os.path.join(tmp, "events.db"))) == [True, False, True, True]
+
+
+def test_expired_ids_can_be_claimed_again():
+    async def run(path):
+        dedup = EventDeduplicator(path, ttl_seconds=0.05)
+        try:
+            await dedup.claim("Ev1")
+            await asyncio.sleep(0.1)
+            purged = await dedup.purge_expired()
+            return await dedup.claim("Ev1"), purged
+        finally:
+            dedup.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assert asyncio.run(run(os.path.join(tmp, "events.db"))) == (True, 1)
+
+
+if __name__ == "__main__":
+    for test in [
+        test_repeated_event_ids_are_claimed_once,
+        test_sqlite_claims_are_shared_between_workers,
+        test_expired_ids_can_be_claimed_again,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for rate-limit-aware Slack delivery.
+"""
+import asyncio
+import time
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+from fake_slack import create_app
+from slack_delivery import SlackDelivery, TokenBucket, queue_delay, split_message
+from test_main import serve
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_spaces_calls_after_the_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    clock.now = 1.0
+    assert not bucket.ready()
+    clock.now = 1.5
+    assert bucket.ready()
+    bucket.pause(3)
+    assert bucket.reserve() == 3
+
+
+def test_long_messages_are_split_at_boundaries_and_keep_code_blocks_whole():
+    paragraph = "Revenue grew in every region this quarter. " * 20
+    code = "```\n" + "SELECT region, SUM(revenue) FROM sales;\n" * 60 + "```"
+    text = "\n\n".join([paragraph, paragraph, code, paragraph])
+    parts = split_message(text, limit=1000)
+    assert len(parts) > 3
+    assert all(len(part) <= 1000 for part in parts)
+    assert all(part.count("```") % 2 == 0 for part in parts)
+    # Nothing is lost: rejoining (and dropping the added fences) restores the words
+    rejoined = " ".join(parts).replace("```", "").split()
+    assert rejoined == text.replace("```", "").split()
+    assert split_message("Short answer.") == ["Short answer."]
+
+
+def test_unbreakable_code_lines_are_cut_without_looping():
+    # Minified JSON or base64: no separator except the newline after the opening fence
+    text = "```\n" + "a" * 5000 + "\n```"
+    parts = split_message(text)
+    assert all(len(part) <= 3000 and part.count("```") == 2 for part in parts)
+    assert "".join(part.replace("```", "").strip() for part in parts) == "a" * 5000
+
+
+def test_delivery_paces_channel_messages_and_honors_retry_after():
+    slack = create_app(rate_limits={"chat.postMessage": 3}, retry_after=1)
+    with serve(slack) as url:
+        async def run():
+            client = AsyncWebClient(token="xoxb-test", base_url=f"{url}/api/")
+            delivery = SlackDelivery(lambda: client, channel_rate=20, channel_burst=2)
+            delays_before = queue_delay.count(method="chat.postMessage")
+            started = time.perf_counter()
+            await asyncio.gather(*(delivery.call("chat.postMessage", "C1", text=f"Message {i}") for i in range(5)))
+            return time.perf_counter() - started, queue_delay.count(method="chat.postMessage") - delays_before
+
+        elapsed, observed = asyncio.run(run())
+
+    stats = slack.state.stats
+    # Three go out (two at once, one paced), the fourth hits the limit and both wait out Retry-After
+    assert sorted(post["text"] for post in stats.posted) == [f"Message {i}" for i in range(5)]
+    assert stats.rate_limited >= 1
+    assert 1.0 <= elapsed < 3.0
+    assert observed == 5 + stats.rate_limited
+
+
+if __name__ == "__main__":
+    for test in [
+        test_token_bucket_spaces_calls_after_the_burst,
+        test_long_messages_are_split_at_boundaries_and_keep_code_blocks_whole,
+        test_unbreakable_code_lines_are_cut_without_looping,
+        test_delivery_paces_channel_messages_and_honors_retry_after,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-channel Slack history cache.
+"""
+import asyncio
+
+from slack_history import SlackHistoryCache
+
+
+def message(ts: str, text: str = "", user: str = "UALICE") -> dict:
+    return {"ts": ts, "user": user, "text": text or f"Message {ts}", "type": "message", "blocks": []}
+
+
+class FakeHistory:
+    """Channel history served newest first, recording every fetch."""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.fetches = []
+
+    async def __call__(self, oldest):
+        self.fetches.append(oldest)
+        newer = [m for m in self.messages if oldest is None or float(m["ts"]) > float(oldest)]
+        return sorted(newer, key=lambda m: float(m["ts"]), reverse=True)
+
+
+def test_channels_refresh_only_newer_messages():
+    async def run():
+        cache = SlackHistoryCache(max_messages=3)
+        fetch = FakeHistory([message(f"100.00000{i}") for i in range(5)])
+        first = await cache.lookup(("C1", None), fetch)
+        fetch.messages.append(message("101.000000", "New"))
+        second = await cache.lookup(("C1", None), fetch)
+        return cache, fetch, first, second
+
+    cache, fetch, first, second = asyncio.run(run())
+    assert [m["ts"] for m in first] == ["100.000002", "100.000003", "100.000004"]
+    assert [m["text"] for m in second] == ["Message 100.000003", "Message 100.000004", "New"]
+    assert fetch.fetches == [None, "100.000004"]
+    # Only the fields the bot uses are kept
+    assert set(second[0]) == {"ts", "user", "text"}
+    assert (cache.misses, cache.refreshes, cache.hits) == (1, 1, 0)
+
+
+def test_complete_conversations_are_served_from_events():
+    async def run():
+        cache = SlackHistoryCache(max_messages=10)
+        fetch = FakeHistory([message("100.000001", "Hi")])
+        await cache.lookup(("D1", None), fetch, complete=True)
+        cache.add(("D1", None), message("100.000003", "Answer", user="UBOT"))
+        cache.add(("D1", None), message("100.000002", "Question"))
+        cache.add(("D1", None), message("100.000002", "Question"))  # Redelivered event
+        cache.add(("D2", None), message("100.000004", "Not cached"))
+        history = await cache.lookup(("D1", None), fetch, complete=True)
+        return cache, fetch, history
+
+    cache, fetch, history = asyncio.run(run())
+    assert [m["text"] for m in history] == ["Hi", "Question", "Answer"]
+    assert fetch.fetches == [None]
+    assert cache.hit_rate == 0.5
+    assert cache.stats()["channels"] == 1
+
+
+def test_idle_channels_are_evicted():
+    async def run():
+        cache = SlackHistoryCache(idle_seconds=0.05)
+        fetch = FakeHistory([message("100.000001")])
+        await cache.lookup(("C1", None), fetch, complete=True)
+        await cache.lookup(("C2", None), fetch, complete=True)
+        await asyncio.sleep(0.03)
+        await cache.lookup(("C2", None), fetch, complete=True)  # Still in use
+        await asyncio.sleep(0.03)
+        purged = cache.purge_expired()
+        await cache.lookup(("C1", None), fetch, complete=True)
+        return purged, fetch.fetches
+
+    purged, fetches = asyncio.run(run())
+    assert purged == 1
+    assert fetches == [None, None, None]
+
+
+def test_messages_posted_while_answering_are_not_skipped():
+    """The bot's own reply does not move the refresh point past messages never fetched."""
+    async def run():
+        cache = SlackHistoryCache(max_messages=10)
+        fetch = FakeHistory([message("100.000000", "first")])
+        await cache.lookup(("C1", None), fetch)
+        mention = message("101.000000", "<@B> q1")
+        fetch.messages.append(mention)
+        cache.add(("C1", None), mention)
+        # Posted by someone else while the agent was answering; no event reaches the cache
+        fetch.messages.append(message("105.000000", "meanwhile", user="UBOB"))
+        reply = message("120.000000", "answer", user="UBOT")
+        fetch.messages.append(reply)
+        cache.add(("C1", None), reply)
+        history = await cache.lookup(("C1", None), fetch)
+        return fetch, history
+
+    fetch, history = asyncio.run(run())
+    assert [m["text"] for m in history] == ["first", "<@B> q1", "meanwhile", "answer"]
+    assert fetch.fetches == [None, "100.000000"]
+
+
+if __name__ == "__main__":
+    for test in [
+        test_channels_refresh_only_newer_messages,
+        test_complete_conversations_are_served_from_events,
+        test_idle_channels_are_evicted,
+        test_messages_posted_while_answering_are_not_skipped,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for resolving and caching the bot's Slack identity.
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+import slack_identity
+from slack_identity import BotIdentity
+
+
+class FakeAuthTest:
+    """auth.test stand-in counting calls; fails while `failing` is set."""
+
+    def __init__(self, user_id="UBOT"):
+        self.user_id = user_id
+        self.calls = 0
+        self.failing = False
+
+    async def __call__(self):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("Slack is down")
+        return {"ok": True, "user_id": self.user_id, "bot_id": "BBOT", "team_id": "T1"}
+
+
+def test_identity_file_is_shared_between_workers():
+    async def run(path):
+        auth_test = FakeAuthTest()
+        first = BotIdentity(auth_test, "xoxb-one", path=path)
+        second = BotIdentity(auth_test, "xoxb-one", path=path)
+        await first.resolve()
+        await second.resolve()
+        # A file written for another token is not trusted
+        other_token = BotIdentity(FakeAuthTest("UOTHER"), "xoxb-two", path=path)
+        await other_token.resolve()
+        return auth_test.calls, second.user_id, second.bot_id, other_token.user_id
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "identity.json")
+        assert asyncio.run(run(path)) == (1, "UBOT", "BBOT", "UOTHER")
+        with open(path) as f:
+            assert "xoxb" not in f.read()
+
+
+def test_stale_files_are_refreshed_and_failures_keep_the_last_identity():
+    async def run(path):
+        auth_test = FakeAuthTest()
+        identity = BotIdentity(auth_test, "xoxb-one", path=path, refresh_seconds=60)
+        await identity.resolve()
+        with open(path) as f:
+            stored = json.load(f)
+        with open(path, "w") as f:
+            json.dump({**stored, "resolved_at": stored["resolved_at"] - 120}, f)
+        auth_test.failing = True
+        await identity.resolve()
+        return auth_test.calls, identity.user_id
+
+    with tempfile.TemporaryDirectory() as directory:
+        assert asyncio.run(run(os.path.join(directory, "identity.json"))) == (2, "UBOT")
+
+
+def test_background_refresh_retries_until_resolved():
+    async def run():
+        auth_test = FakeAuthTest()
+        auth_test.failing = True
+        identity = BotIdentity(auth_test, "xoxb-one")
+        await identity.resolve()
+        refresh = asyncio.create_task(identity.refresh_forever())
+        auth_test.failing = False
+        for _ in range(100):
+            if identity.user_id:
+                break
+            await asyncio.sleep(0.01)
+        refresh.cancel()
+        return identity.user_id
+
+    retry_seconds = slack_identity.RETRY_SECONDS
+    slack_identity.RETRY_SECONDS = 0.05
+    try:
+        assert asyncio.run(run()) == "UBOT"
+    finally:
+        slack_identity.RETRY_SECONDS = retry_seconds
+
+
+if __name__ == "__main__":
+    for test in [
+        test_identity_file_is_shared_between_workers,
+        test_stale_files_are_refreshed_and_failures_keep_the_last_identity,
+        test_background_refresh_retries_until_resolved,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
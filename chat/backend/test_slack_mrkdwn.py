@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the markdown to Slack mrkdwn converter.
+"""
+import random
+
+import slack_mrkdwn
+from slack_mrkdwn import MrkdwnStream, to_mrkdwn
+
+ANSWER = """# Revenue **Q3**
+
+Revenue was **up**, *costs* ~~fell~~; see [the report](https://example.com/r).
+
+| Region | Sales |
+|--------|------:|
+| EU | **10** |
+| US | 20 |
+
+- one `a*b*c`
+* two
+  - [x] done
+
+```sql
+SELECT * FROM sales; -- **not bold**
+```
+"""
+
+EXPECTED = """*Revenue Q3*
+
+Revenue was *up*, _costs_ ~fell~; see <https://example.com/r|the report>.
+
+*Region* | *Sales*
+EU | *10*
+US | 20
+
+• one `a*b*c`
+• two
+  • ☑ done
+
+```sql
+SELECT * FROM sales; -- **not bold**
+```"""
+
+
+def test_markdown_converts_to_mrkdwn():
+    assert to_mrkdwn(ANSWER) == EXPECTED
+    # A table-like line without a separator row is plain text
+    assert to_mrkdwn("| not | a table |\nNext **line**") == "| not | a table |\nNext *line*"
+
+
+def test_streamed_pieces_convert_like_the_whole_answer():
+    rng = random.Random(7)
+    for _ in range(50):
+        stream = MrkdwnStream()
+        position = 0
+        while position < len(ANSWER):
+            size = rng.randint(1, 12)
+            stream.feed(ANSWER[position:position + size])
+            position += size
+            partial = stream.render()
+            # Half-typed markup is held back and an open code block is closed
+            assert "**" not in partial.split("```")[0]
+            assert partial.count("```") % 2 == 0
+        assert stream.finish() == EXPECTED
+
+    stream = MrkdwnStream()
+    stream.feed("Revenue was **up")
+    assert stream.render() == "Revenue was"
+    stream.feed("**\n\n| Region | Sales |\n")
+    # The table header waits for the next line
+    assert stream.render() == "Revenue was *up*"
+
+
+def test_repeated_answers_are_converted_once():
+    slack_mrkdwn._converted.clear()
+    hits = slack_mrkdwn._converted.hits
+    assert to_mrkdwn(ANSWER) is to_mrkdwn(ANSWER)
+    assert slack_mrkdwn._converted.hits == hits + 1
+
+
+if __name__ == "__main__":
+    for test in [
+        test_markdown_converts_to_mrkdwn,
+        test_streamed_pieces_convert_like_the_whole_answer,
+        test_repeated_answers_are_converted_once,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the Slack event worker pool.
+"""
+import asyncio
+
+from admission import QueueFull
+from slack_queue import SlackEventQueue
+
+
+def event(channel: str, number: int) -> dict:
+    return {"event_id": f"Ev{channel}{number}", "event": {"channel": channel, "text": str(number)}}
+
+
+def test_channels_keep_order_and_workers_are_bounded():
+    async def run():
+        handled = []
+        running = 0
+        peak = 0
+
+        async def handler(event_data):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            handled.append((event_data["event"]["channel"], int(event_data["event"]["text"])))
+            running -= 1
+
+        queue = SlackEventQueue(handler, workers=2, max_backlog=100)
+        queue.start()
+        for number in range(5):
+            for channel in ("C1", "C2", "C3", "C4"):
+                queue.submit(event(channel, number))
+        await queue.drain(timeout=5)
+        return handled, peak
+
+    handled, peak = asyncio.run(run())
+    assert len(handled) == 20
+    assert peak == 2
+    for channel in ("C1", "C2", "C3", "C4"):
+        assert [number for name, number in handled if name == channel] == list(range(5))
+
+
+def test_full_backlog_is_rejected_and_drain_finishes_the_rest():
+    async def run():
+        handled = []
+        release = asyncio.Event()
+
+        async def handler(event_data):
+            await release.wait()
+            handled.append(event_data["event_id"])
+
+        queue = SlackEventQueue(handler, workers=1, max_backlog=2)
+        queue.start()
+        queue.submit(event("C1", 0))
+        await asyncio.sleep(0)  # The worker picks up the first event and blocks
+        queue.submit(event("C1", 1))
+        queue.submit(event("C1", 2))
+        try:
+            queue.submit(event("C1", 3))
+            assert False, "Backlog limit not enforced"
+        except QueueFull as e:
+            assert e.retry_after >= 1
+
+        draining = asyncio.create_task(queue.drain(timeout=5))
+        await asyncio.sleep(0)
+        try:
+            queue.submit(event("C2", 0))
+            assert False, "Accepted an event while draining"
+        except QueueFull:
+            pass
+        release.set()
+        return handled, await draining
+
+    handled, abandoned = asyncio.run(run())
+    assert handled == ["EvC10", "EvC11", "EvC12"]
+    assert abandoned == 0
+
+
+def test_drain_timeout_abandons_stuck_events():
+    async def run():
+        async def handler(event_data):
+            await asyncio.sleep(60)
+
+        queue = SlackEventQueue(handler, workers=1, max_backlog=10)
+        queue.start()
+        queue.submit(event("C1", 0))
+        queue.submit(event("C1", 1))
+        await asyncio.sleep(0)
+        return await queue.drain(timeout=0.05), queue.backlog
+
+    assert asyncio.run(run()) == (2, 0)
+
+
+if __name__ == "__main__":
+    for test in [
+        test_channels_keep_order_and_workers_are_bounded,
+        test_full_backlog_is_rejected_and_drain_finishes_the_rest,
+        test_drain_timeout_abandons_stuck_events,
+    ]:
+        test()
+        print(f"✓ {test.__name__}")
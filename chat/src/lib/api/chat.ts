@@ -7,6 +7,9 @@ const API_BASE_URL = browser
 	? import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'
 	: 'http://localhost:8000';
 
+// Storage key for the server-side conversation ID (history itself is kept by the chat store)
+const CONVERSATION_STORAGE_KEY = 'dash-conversation-id';
+
 export interface StreamingResponse {
 	content?: string;
 	error?: string;
@@ -15,6 +18,7 @@ export interface StreamingResponse {
 
 export class ChatAPI {
 	private controller: AbortController | null = null;
+	private conversationId: string | null = browser ? localStorage.getItem(CONVERSATION_STORAGE_KEY) : null;
 
 	/**
 	 * Send a message and handle streaming response
@@ -25,6 +29,9 @@ export class ChatAPI {
 		this.controller = new AbortController();
 
 		try {
+			// Get conversation history from store, before this message
+			const history = this.getConversationHistory();
+
 			// Add user message to store
 			chatStore.addUserMessage(message);
 			
@@ -32,18 +39,14 @@ export class ChatAPI {
 			const streamingId = chatStore.startAssistantMessage();
 			chatStore.setConnected(true);
 
-			// Get conversation history from store
-			const history = this.getConversationHistory();
-
-			// Make request to streaming endpoint
-			const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
-				method: 'POST',
-				headers: {
-					'Content-Type': 'application/json',
-				},
-				body: JSON.stringify({ message, history }),
-				signal: this.controller.signal
-			});
+			// The server keeps the history, so only the new message is sent; the
+			// full history is uploaded once, when a conversation is (re)started
+			let response = await this.postMessage(message, history);
+			if (response.status === 404 && this.conversationId) {
+				// The conversation expired on the server: start a new one from our history
+				this.setConversationId(null);
+				response = await this.postMessage(message, history);
+			}
 
 			if (!response.ok) {
 				throw new Error(`HTTP ${response.status}: ${response.statusText}`);
@@ -53,6 +56,11 @@ export class ChatAPI {
 				throw new Error('No response body received');
 			}
 
+			const conversationId = response.headers.get('X-Conversation-ID');
+			if (conversationId) {
+				this.setConversationId(conversationId);
+			}
+
 			// Process streaming response
 			await this.processStream(response.body);
 
@@ -75,6 +83,33 @@ export class ChatAPI {
 		}
 	}
 
+	/**
+	 * POST a message to the streaming endpoint, continuing the current conversation if there is one
+	 */
+	private postMessage(message: string, history: Array<{role: 'user' | 'assistant', content: string}>): Promise<Response> {
+		const body = this.conversationId
+			? { message, conversation_id: this.conversationId }
+			: { message, history, conversation_id: 'new' };
+		return fetch(`${API_BASE_URL}/api/chat/stream`, {
+			method: 'POST',
+			headers: {
+				'Content-Type': 'application/json',
+			},
+			body: JSON.stringify(body),
+			signal: this.controller?.signal
+		});
+	}
+
+	private setConversationId(conversationId: string | null): void {
+		this.conversationId = conversationId;
+		if (!browser) return;
+		if (conversationId) {
+			localStorage.setItem(CONVERSATION_STORAGE_KEY, conversationId);
+		} else {
+			localStorage.removeItem(CONVERSATION_STORAGE_KEY);
+		}
+	}
+
 	/**
 	 * Process the streaming response body
 	 */
@@ -127,22 +162,10 @@ export class ChatAPI {
 		const trimmed = line.trim();
 		if (!trimmed) return;
 
+		let data: StreamingResponse;
 		try {
 			// Try to parse as JSON
-			const data: StreamingResponse = JSON.parse(trimmed);
-			
-			if (data.error) {
-				throw new Error(data.error);
-			}
-			
-			if (data.content) {
-				chatStore.appendStreamingContent(data.content);
-			}
-			
-			if (data.complete) {
-				chatStore.completeStreaming();
-			}
-			
+			data = JSON.parse(trimmed);
 		} catch (parseError) {
 			// Log parse errors for debugging
 			console.warn('Failed to parse JSON line:', trimmed, parseError);
@@ -155,6 +178,20 @@ export class ChatAPI {
 			
 			// Treat as raw text content
 			chatStore.appendStreamingContent(trimmed);
+			return;
+		}
+		
+		// An error frame ends the stream; sendMessage shows it
+		if (data.error) {
+			throw new Error(data.error);
+		}
+		
+		if (data.content) {
+			chatStore.appendStreamingContent(data.content);
+		}
+		
+		if (data.complete) {
+			chatStore.completeStreaming();
 		}
 	}
 
@@ -195,6 +232,11 @@ export class ChatAPI {
 	 * Clear conversation history
 	 */
 	clearConversation(): void {
+		if (this.conversationId) {
+			// Best effort: the server forgets idle conversations anyway
+			fetch(`${API_BASE_URL}/api/conversations/${this.conversationId}`, { method: 'DELETE' }).catch(() => {});
+			this.setConversationId(null);
+		}
 		chatStore.clearMessages();
 	}
 